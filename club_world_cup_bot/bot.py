@@ -6,20 +6,33 @@ This bot allows users to predict match results for the 2025 FIFA Club World Cup.
 import os
 import logging
 import asyncio
-from datetime import datetime, timedelta
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
 load_dotenv("credentials.env")  # Load from credentials.env file
 load_dotenv("club_world_cup_bot/credentials.env")
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from club_world_cup_bot.handlers import user_commands, admin_commands
-from club_world_cup_bot.services.prediction import lock_expired_matches, set_admin_by_username, get_matches
+from club_world_cup_bot.middlewares.access import AccessMiddleware
+from club_world_cup_bot.middlewares.concurrency import ConcurrencyLimitMiddleware
+from club_world_cup_bot.fsm_storage import create_fsm_storage, TTLStorage
+from club_world_cup_bot.firebase_helpers import (
+    start_cache_listeners, add_change_callback, ensure_username_index, ensure_match_predictions_index, run_db
+)
+from club_world_cup_bot.services.prediction import lock_expired_matches, set_admin_by_username
 from club_world_cup_bot.services.scoring import update_leaderboard
+from club_world_cup_bot.services.ranking import invalidate_rank_index
+from club_world_cup_bot.services.access import invalidate_access
+from club_world_cup_bot.services.lock_scheduler import lock_scheduler
+from club_world_cup_bot.services.result_poller import result_poller, RESULT_POLL_INTERVAL_MINUTES
+from club_world_cup_bot.services.reminders import get_matches_to_remind, send_match_reminder
+from club_world_cup_bot.services.leader import leader_lease, leader_only, LEADER_RENEW_SECONDS
+from club_world_cup_bot.services.sharding import HashRing, ShardedRequestHandler, WORKER_URLS, WORKER_URL
 
 # Configure logging
 logging.basicConfig(
@@ -35,84 +48,242 @@ if not BOT_TOKEN:
 # For development/testing, add your Telegram username to be set as admin
 ADMIN_USERNAME = os.environ.get("ADMIN_USER_ID")  # The env var is still called ADMIN_USER_ID but contains username
 
+# How updates are received: "polling" (getUpdates) or "webhook" (aiohttp server)
+BOT_RUN_MODE = os.environ.get("BOT_RUN_MODE", "polling").lower()
+
+# Webhook settings; Telegram posts updates to WEBHOOK_BASE_URL + WEBHOOK_PATH
+WEBHOOK_BASE_URL = os.environ.get("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("PORT", "8080"))  # Heroku sets PORT for web dynos
+
+# Most updates handled at the same time, in either run mode
+MAX_CONCURRENT_UPDATES = int(os.environ.get("MAX_CONCURRENT_UPDATES", "32"))
+
+if BOT_RUN_MODE not in ("polling", "webhook"):
+    raise ValueError(f"BOT_RUN_MODE must be 'polling' or 'webhook', not {BOT_RUN_MODE!r}")
+
+if BOT_RUN_MODE == "webhook" and not (WEBHOOK_BASE_URL and WEBHOOK_SECRET):
+    raise ValueError("WEBHOOK_BASE_URL and WEBHOOK_SECRET must be set in webhook mode")
+
+if WORKER_URLS and WORKER_URL not in WORKER_URLS:
+    raise ValueError("WORKER_URL must be one of WORKER_URLS when updates are sharded")
+
+# How often the leader re-reads pending lock deadlines. Match changes on other
+# workers are normally picked up within seconds through the change stream;
+# this catches any that were missed (e.g. while the stream was reconnecting).
+LOCK_REFRESH_MINUTES = 10
+
 async def on_startup(bot: Bot):
     """Actions to perform when the bot starts."""
     logging.info("Bot is starting...")
     
+    # Make sure username and per-match prediction lookups have an index to read from
+    await run_db(ensure_username_index)
+    await run_db(ensure_match_predictions_index)
+    
     # Set admin user if specified
     if ADMIN_USERNAME:
-        set_admin_by_username(ADMIN_USERNAME)
+        await run_db(set_admin_by_username, ADMIN_USERNAME)
         logging.info(f"Set user @{ADMIN_USERNAME} as admin")
     
+    # Arm a lock job for every match that is still open
+    pending = await run_db(lock_scheduler.rebuild)
+    logging.info(f"Scheduled prediction locks for {pending} matches")
+    
+    # Writes over all matches and users are left to the leader, so workers
+    # starting together don't each repeat them
+    if not leader_lease.is_leader:
+        return
+    
     # Lock any expired matches
-    locked = lock_expired_matches()
+    locked = await run_db(lock_expired_matches)
     if locked:
         logging.info("Locked expired matches")
     
     # Update leaderboard at startup
-    update_leaderboard()
+    await run_db(update_leaderboard)
     logging.info("Updated leaderboard at startup")
 
-async def lock_matches_job():
-    """Job to lock matches that have started."""
-    locked = lock_expired_matches()
-    if locked:
-        logging.info("Locked matches in scheduled job")
-        update_leaderboard()
+def on_users_changed(path):
+    """Drop this worker's user-derived caches after a write to users on any worker."""
+    # Scores may have changed on another worker, which this worker's rank index can't see
+    invalidate_rank_index()
+    
+    # Score writes don't affect access; other changes may, including for other user IDs
+    # through their username (e.g. a placeholder admin)
+    if not path.rstrip("/").endswith("/score"):
+        invalidate_access()
+
+async def on_matches_locked(match_ids):
+    """Called by the lock scheduler after matches have been locked."""
+    logging.info(f"Locked matches {', '.join(match_ids)} in scheduled job")
+    await run_db(update_leaderboard)
+
+async def poll_match_results():
+    """Fetch the results of finished matches from API-Football."""
+    finished = await run_db(result_poller.poll)
+    if finished:
+        logging.info(f"Set results of matches {', '.join(finished)} from API-Football")
 
 async def send_match_reminders(bot: Bot):
-    """Send reminders for upcoming matches."""
-    matches = get_matches()
-    now = datetime.now()
+    """Send reminders for upcoming matches to users who haven't predicted them."""
+    # Open matches starting within the next 24 hours that haven't been reminded yet
+    upcoming = await run_db(get_matches_to_remind)
     
-    for match_id, match in matches.items():
-        if match.get("locked", False) or "reminder_sent" in match:
-            continue
+    for entry in upcoming:
+        match_id, match = entry.match_id, entry.match
         
         try:
-            match_time = datetime.strptime(match["time"], "%Y-%m-%d %H:%M")
-            time_diff = match_time - now
-            
-            # If match is starting in less than 24 hours but more than 23
-            if timedelta(hours=23) < time_diff <= timedelta(hours=24):
-                # Logic for sending reminders would go here
-                # This would require tracking all users
-                # For simplicity, we're not implementing this fully
-                logging.info(f"Would send reminder for match {match_id}: {match['team1']} vs {match['team2']}")
-                
-                # Mark as reminded
-                match["reminder_sent"] = True
+            delivered, failed = await send_match_reminder(bot, match_id, match)
+            logging.info(
+                f"Sent {delivered} reminders for match {match_id}: {match['team1']} vs {match['team2']}"
+                + (f" ({failed} failed)" if failed else "")
+            )
         except Exception as e:
             logging.error(f"Error sending reminder for match {match_id}: {e}")
 
+async def renew_leader_lease():
+    """Keep (or try to take) the lease that lets this worker run the scheduled jobs."""
+    was_leader = leader_lease.is_leader
+    
+    if await run_db(leader_lease.renew) and not was_leader:
+        # Deadlines may have changed on other workers while this one was not the leader
+        await run_db(lock_scheduler.rebuild)
+
+async def on_shutdown():
+    """Hand the leader lease over right away instead of letting it expire."""
+    await run_db(leader_lease.release)
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher):
+    """Point Telegram at this server's webhook endpoint."""
+    await bot.set_webhook(
+        f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dispatcher.resolve_used_update_types()
+    )
+    logging.info(f"Webhook set to {WEBHOOK_BASE_URL}{WEBHOOK_PATH}")
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Serve updates from an aiohttp webhook endpoint until the process is stopped."""
+    app = web.Application()
+    
+    # Acknowledge each update right away and handle it in a background task;
+    # requests without the matching secret token header are rejected
+    if WORKER_URLS:
+        # Several workers: forward each update to the worker owning its user
+        handler = ShardedRequestHandler(
+            dispatcher=dp, bot=bot,
+            ring=HashRing(WORKER_URLS), worker_url=WORKER_URL, path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            handle_in_background=True
+        )
+    else:
+        handler = SimpleRequestHandler(
+            dispatcher=dp, bot=bot,
+            secret_token=WEBHOOK_SECRET,
+            handle_in_background=True
+        )
+    handler.register(app, path=WEBHOOK_PATH)
+    
+    # Run the dispatcher's startup and shutdown callbacks with the web app
+    dp.startup.register(set_webhook)
+    setup_application(app, dp, bot=bot)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT).start()
+    logging.info(f"Listening for webhook updates on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    """Fetch updates with long polling until the process is stopped."""
+    # Polling doesn't work while a webhook is set (e.g. after running in webhook mode)
+    await bot.delete_webhook()
+    await dp.start_polling(bot)
+
 async def main():
     """Main function to start the bot."""
     # Initialize bot and dispatcher
     bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    # Conversation states outlive restarts unless FSM_STORAGE is "memory"
+    storage = create_fsm_storage()
+    dp = Dispatcher(storage=storage)
+    
+    # Bound how many updates are handled at once
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(MAX_CONCURRENT_UPDATES))
+    
+    # Resolve each sender's access once per update
+    dp.message.middleware(AccessMiddleware())
+    dp.callback_query.middleware(AccessMiddleware())
     
     # Register handlers
     dp.include_router(user_commands.router)
     dp.include_router(admin_commands.router)
     
+    # Keep cached database snapshots in sync with remote changes
+    await run_db(start_cache_listeners)
+    
+    # Every worker starts a scheduler, but jobs only run on the worker holding the leader lease
+    await run_db(leader_lease.renew)
+    
     # Initialize scheduler
     scheduler = AsyncIOScheduler()
+    scheduler.add_job(
+        renew_leader_lease, 'interval',
+        seconds=LEADER_RENEW_SECONDS
+    )
     
-    # Schedule jobs
-    scheduler.add_job(lock_matches_job, 'interval', minutes=5)
+    # Schedule jobs; match locks are armed per match by the lock scheduler
+    lock_scheduler.attach(
+        scheduler, on_locked=on_matches_locked,
+        is_active=lambda: leader_lease.is_leader
+    )
+    # Re-arm lock jobs soon after a match is added or moved on any worker
+    add_change_callback('matches', lambda path: lock_scheduler.request_rebuild())
+    # Rank and access caches would otherwise only see this worker's own writes
+    add_change_callback('users', on_users_changed)
+    add_change_callback('usernames', lambda path: invalidate_access())
     scheduler.add_job(
-        send_match_reminders, 'interval', 
+        leader_only(run_db), 'interval',
+        minutes=LOCK_REFRESH_MINUTES, args=[lock_scheduler.rebuild]
+    )
+    scheduler.add_job(
+        leader_only(send_match_reminders), 'interval', 
         hours=1, args=[bot]
     )
     
+    # Drop admin conversations that were abandoned
+    if isinstance(storage, TTLStorage):
+        scheduler.add_job(
+            leader_only(run_db), 'interval',
+            hours=1, args=[storage.purge_expired]
+        )
+    
+    # Results are only polled when the API-Football integration is configured
+    if os.environ.get("API_FOOTBALL_KEY"):
+        scheduler.add_job(
+            leader_only(poll_match_results), 'interval',
+            minutes=RESULT_POLL_INTERVAL_MINUTES
+        )
+    
     # Start the scheduler
     scheduler.start()
     
-    # Register startup callback
+    # Register startup and shutdown callbacks
     dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
     
-    # Start polling
-    await dp.start_polling(bot)
+    # Start receiving updates
+    if BOT_RUN_MODE == "webhook":
+        await run_webhook(bot, dp)
+    else:
+        await run_polling(bot, dp)
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
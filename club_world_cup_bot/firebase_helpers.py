@@ -4,11 +4,234 @@ Firebase helper functions for the Club World Cup Bot.
 This module provides high-level functions for interacting with Firebase Realtime Database,
 abstracting the database operations from the application logic.
 """
+import asyncio
+import copy
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 from firebase_admin import db
 from .firebase_init import get_database
+from .models import Match, Prediction, User
+
+# How long a cached snapshot stays valid without a change notification
+CACHE_TTL_SECONDS = 30
+
+# Maximum number of cached snapshots before the least recently used are evicted
+CACHE_MAX_ENTRIES = 1024
+
+# Top-level nodes watched by the change-stream listeners
+CACHED_NODES = ('users', 'usernames', 'matches', 'predictions')
+
+# User fields mirrored into the username index
+INDEXED_USER_FIELDS = frozenset(('username', 'is_admin', 'whitelisted'))
+
+# Largest JSON payload sent in one multi-path update; bigger batches are split.
+# The Realtime Database accepts up to 16 MB per write from the SDKs.
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+
+# Users read per request when the predictions node is read in pages
+PREDICTION_PAGE_USERS = 500
+
+# Server-side timestamp sentinel; resolved to epoch milliseconds by the database
+SERVER_TIMESTAMP = {".sv": "timestamp"}
+
+# Number of threads available for blocking database calls made from async code
+DB_MAX_WORKERS = int(os.getenv("FIREBASE_MAX_WORKERS", "8"))
+
+_MISSING = object()
+_db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="firebase")
+
+async def run_db(func, *args, **kwargs):
+    """
+    Run a blocking database function without blocking the event loop.
+    
+    The call is executed in a bounded thread pool, so a slow request only
+    occupies one worker instead of stalling every other handler.
+    
+    Example:
+        matches = await run_db(get_matches)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
+class SnapshotCache:
+    """Thread-safe read-through cache for database snapshots with TTL and LRU eviction."""
+    
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_version = 0
+    
+    def _lookup(self, key):
+        """Return the cached value itself (not a copy), or _MISSING. Call with the lock held."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        
+        self._entries.move_to_end(key)
+        return value
+    
+    def get(self, key):
+        """Return a copy of the cached value for key, or _MISSING if absent or expired."""
+        with self._lock:
+            value = self._lookup(key)
+        
+        # Callers are free to mutate what they get back
+        return value if value is _MISSING else copy.deepcopy(value)
+    
+    def get_child(self, key, child, default=None):
+        """
+        Return a copy of one child of a cached dict snapshot, or _MISSING if the snapshot isn't cached.
+        
+        Only the child is copied, so a lookup costs the same however large the snapshot is.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                return _MISSING
+            child_value = value.get(child, default) if isinstance(value, dict) else default
+        
+        return copy.deepcopy(child_value)
+    
+    def set(self, key, value):
+        """Store a copy of value under key, evicting the oldest entries if needed."""
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._next_version += 1
+            self._entries[key] = (time.monotonic() + self.ttl, value, self._next_version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def version(self, key):
+        """
+        Return a number that changes whenever a new snapshot is stored under key.
+        
+        Returns None if key is absent or expired, so structures derived from a
+        snapshot can tell when they need to be rebuilt.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[2]
+    
+    def invalidate(self, *keys):
+        """Drop the given keys from the cache."""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+    
+    def invalidate_node(self, node):
+        """Drop every key belonging to a top-level node, e.g. all per-user predictions."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == node]:
+                del self._entries[key]
+    
+    def clear(self):
+        """Drop everything."""
+        with self._lock:
+            self._entries.clear()
+
+_cache = SnapshotCache()
+_listeners = []
+_change_callbacks = {}   # node -> [callback(path)]
+
+def invalidate_path(path):
+    """Invalidate every cached snapshot that may contain data at the given database path."""
+    parts = [part for part in str(path).split('/') if part]
+    
+    if not parts:
+        _cache.clear()
+        return
+    
+    node = parts[0]
+    if node == 'users':
+        _cache.invalidate(('users',))
+        if len(parts) > 1:
+            _cache.invalidate(('user', parts[1]))
+        else:
+            _cache.invalidate_node('user')
+    elif node == 'usernames':
+        if len(parts) > 1:
+            _cache.invalidate(('usernames', parts[1]))
+        else:
+            _cache.invalidate_node('usernames')
+    elif node == 'matches':
+        _cache.invalidate(('matches',))
+        if len(parts) > 1:
+            _cache.invalidate(('match', parts[1]))
+        else:
+            _cache.invalidate_node('match')
+    elif node == 'predictions':
+        if len(parts) > 1:
+            _cache.invalidate(('predictions', parts[1]))
+        else:
+            _cache.invalidate_node('predictions')
+
+def start_cache_listeners():
+    """Subscribe to the database change stream so cached snapshots are dropped on remote writes."""
+    if _listeners:
+        return True
+    
+    try:
+        database = get_database()
+        for node in CACHED_NODES:
+            def on_change(event, node=node):
+                invalidate_path(f"{node}/{event.path}")
+                _notify_change(node, event.path)
+            _listeners.append(database.child(node).listen(on_change))
+        return True
+    except Exception as e:
+        print(f"Error starting cache listeners, relying on TTL expiry: {e}")
+        return False
+
+def add_change_callback(node, callback):
+    """
+    Call callback(path) whenever the change stream reports a write under a cached node.
+    
+    Writes made by any process are reported, including this one's. Callbacks
+    run on the listener's thread, so they should only hand the work off.
+    Nothing is reported if start_cache_listeners failed.
+    """
+    _change_callbacks.setdefault(node, []).append(callback)
+
+def _notify_change(node, path):
+    """Run the change callbacks of a node."""
+    for callback in _change_callbacks.get(node, ()):
+        try:
+            callback(path)
+        except Exception as e:
+            print(f"Error in change callback for {node}: {e}")
+
+def stop_cache_listeners():
+    """Close the change-stream listeners and empty the cache."""
+    while _listeners:
+        registration = _listeners.pop()
+        try:
+            registration.close()
+        except Exception as e:
+            print(f"Error closing cache listener: {e}")
+    _cache.clear()
 
 def get_all_users():
     """Get all users from Firebase."""
+    cached = _cache.get(('users',))
+    if cached is not _MISSING:
+        return cached
+    
     try:
         database = get_database()
         users_ref = database.child('users')
@@ -16,42 +239,171 @@ def get_all_users():
         
         # Ensure we always return a dictionary
         if users is None:
-            return {}
+            users = {}
         elif isinstance(users, list):
             # Convert list to dictionary if needed
-            return {str(i): user for i, user in enumerate(users) if user is not None}
-        elif isinstance(users, dict):
-            return users
-        else:
+            users = {str(i): user for i, user in enumerate(users) if user is not None}
+        elif not isinstance(users, dict):
             return {}
+        
+        _cache.set(('users',), users)
+        return users
     except Exception as e:
         print(f"Error getting users: {e}")
         return {}
 
-def save_user(user_id, data):
-    """Save or update a user in Firebase."""
+def save_user(user_id, data, defaults=None):
+    """
+    Save or update a user in Firebase, keeping the username index in sync.
+    
+    Changes to indexed fields are applied in a transaction on the user record,
+    so the index is updated from the record that was actually replaced even if
+    another worker changed the user at the same time.
+    
+    Args:
+        user_id (str): User ID
+        data (dict): Fields to write
+        defaults (dict, optional): Fields to write only where the record has no value yet
+    """
     try:
         database = get_database()
-        users_ref = database.child('users')
-        users_ref.child(str(user_id)).update(data)
+        
+        if not defaults and not INDEXED_USER_FIELDS & data.keys():
+            updates = {f"users/{user_id}/{key}": value for key, value in data.items()}
+            database.update(updates)
+            for path in updates:
+                invalidate_path(path)
+            return True
+        
+        previous = {}
+        
+        def merge(current):
+            nonlocal previous
+            previous = current if isinstance(current, dict) else {}
+            merged = {**(defaults or {}), **previous, **data}
+            return {key: value for key, value in merged.items() if value is not None}
+        
+        user = database.child('users').child(str(user_id)).transaction(merge)
+        invalidate_path(f"users/{user_id}")
+        
+        index_updates = _username_index_updates(user_id, previous, user)
+        if index_updates:
+            database.update(index_updates)
+            for path in index_updates:
+                invalidate_path(path)
         return True
     except Exception as e:
         print(f"Error saving user {user_id}: {e}")
         return False
 
+def _username_index_entry(user):
+    """Build the role flags stored for a user in the username index."""
+    return {
+        'is_admin': bool(user.get('is_admin', False)),
+        'whitelisted': bool(user.get('whitelisted', False))
+    }
+
+def _username_index_updates(user_id, previous, user):
+    """Build the multi-path updates that move a user's username index entry."""
+    updates = {}
+    old_username = previous.get('username')
+    new_username = user.get('username')
+    
+    if old_username and old_username != new_username:
+        updates[f"usernames/{old_username}/{user_id}"] = None
+    if new_username:
+        updates[f"usernames/{new_username}/{user_id}"] = _username_index_entry(user)
+    
+    return updates
+
+def get_username_entries(username):
+    """Get the index entries for a username as {user_id: {'is_admin', 'whitelisted'}}."""
+    if not username:
+        return {}
+    
+    cached = _cache.get(('usernames', username))
+    if cached is not _MISSING:
+        return cached
+    
+    try:
+        database = get_database()
+        entries = database.child('usernames').child(username).get()
+        if not isinstance(entries, dict):
+            entries = {}
+        
+        _cache.set(('usernames', username), entries)
+        return entries
+    except Exception as e:
+        print(f"Error getting username index for {username}: {e}")
+        return {}
+
+def rebuild_username_index():
+    """Rebuild the username index from the full users node."""
+    try:
+        index = {}
+        for user_id, user in get_all_users().items():
+            if isinstance(user, dict) and user.get('username'):
+                index.setdefault(user['username'], {})[user_id] = _username_index_entry(user)
+        
+        database = get_database()
+        database.child('usernames').set(index)
+        invalidate_path('usernames')
+        return True
+    except Exception as e:
+        print(f"Error rebuilding username index: {e}")
+        return False
+
+def ensure_username_index():
+    """Build the username index if it does not exist yet (e.g. on an existing database)."""
+    try:
+        database = get_database()
+        if database.child('usernames').get(shallow=True) is None:
+            return rebuild_username_index()
+        return True
+    except Exception as e:
+        print(f"Error checking username index: {e}")
+        return False
+
 def get_user(user_id):
     """Get a specific user from Firebase."""
+    cached = _cache.get(('user', str(user_id)))
+    if cached is not _MISSING:
+        return cached
+    
     try:
         database = get_database()
         users_ref = database.child('users')
         user = users_ref.child(str(user_id)).get() or {}
+        _cache.set(('user', str(user_id)), user)
         return user
     except Exception as e:
         print(f"Error getting user {user_id}: {e}")
         return {}
 
+def get_user_ids():
+    """Get the IDs of all users without downloading their records."""
+    try:
+        database = get_database()
+        users_ref = database.child('users')
+        user_ids = users_ref.get(shallow=True)
+        
+        if isinstance(user_ids, dict):
+            return set(user_ids.keys())
+        return set()
+    except Exception as e:
+        print(f"Error getting user IDs: {e}")
+        return set()
+
+def get_matches_version():
+    """Version of the cached matches snapshot, or None if it needs to be fetched again."""
+    return _cache.version(('matches',))
+
 def get_all_matches():
     """Get all matches from Firebase."""
+    cached = _cache.get(('matches',))
+    if cached is not _MISSING:
+        return cached
+    
     try:
         database = get_database()
         matches_ref = database.child('matches')
@@ -59,60 +411,303 @@ def get_all_matches():
         
         # Ensure we always return a dictionary
         if matches is None:
-            return {}
+            matches = {}
         elif isinstance(matches, list):
             # Convert list to dictionary if needed
-            return {str(i): match for i, match in enumerate(matches) if match is not None}
-        elif isinstance(matches, dict):
-            return matches
-        else:
+            matches = {str(i): match for i, match in enumerate(matches) if match is not None}
+        elif not isinstance(matches, dict):
             return {}
+        
+        _cache.set(('matches',), matches)
+        return matches
     except Exception as e:
         print(f"Error getting matches: {e}")
         return {}
 
+def get_match(match_id):
+    """Get a single match, or an empty dict if it does not exist."""
+    # Serve from the full matches snapshot when it is already cached
+    match = _cache.get_child(('matches',), str(match_id))
+    if match is not _MISSING:
+        return match or {}
+    
+    cached = _cache.get(('match', str(match_id)))
+    if cached is not _MISSING:
+        return cached
+    
+    try:
+        database = get_database()
+        match = database.child('matches').child(str(match_id)).get()
+        match = match if isinstance(match, dict) else {}
+        _cache.set(('match', str(match_id)), match)
+        return match
+    except Exception as e:
+        print(f"Error getting match {match_id}: {e}")
+        return {}
+
+def get_match_ids():
+    """Get the IDs of all matches without downloading their records."""
+    try:
+        database = get_database()
+        match_ids = database.child('matches').get(shallow=True)
+        
+        if isinstance(match_ids, dict):
+            return set(match_ids.keys())
+        return set()
+    except Exception as e:
+        print(f"Error getting match IDs: {e}")
+        return set()
+
+def _order_key(value):
+    """Sort key following the Realtime Database query ordering: null, false, true, numbers, strings, objects."""
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (2,) if value else (1,)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5,)
+
+def filter_children(children, order_by, start_at=None, end_at=None, equal_to=None):
+    """
+    Apply an order_by_child query to an already downloaded node, the way the server would.
+    
+    Returns:
+        dict: The matching children, ordered by their order_by value
+    """
+    def child_value(child):
+        for part in order_by.split('/'):
+            child = child.get(part) if isinstance(child, dict) else None
+        return child
+    
+    selected = []
+    for key, child in children.items():
+        value = _order_key(child_value(child))
+        if equal_to is not None and value != _order_key(equal_to):
+            continue
+        if start_at is not None and value < _order_key(start_at):
+            continue
+        if end_at is not None and value > _order_key(end_at):
+            continue
+        selected.append((value, str(key), key, child))
+    
+    selected.sort(key=lambda item: item[:2])
+    return {key: child for _, _, key, child in selected}
+
+def query_children(node, order_by, start_at=None, end_at=None, equal_to=None, snapshot=None):
+    """
+    Get the children of a node whose order_by child is within a range, using a server-side query.
+    
+    The child must be listed in the node's ".indexOn" rule (see README). If the
+    query fails, e.g. because the rule is missing, the whole node is read
+    (from snapshot() if given) and filtered locally instead, so a failed query
+    is never mistaken for an empty result.
+    
+    Args:
+        node (str): Top-level node, e.g. 'matches'
+        order_by (str): Child to filter on, e.g. 'time'
+        start_at: Lowest value to include
+        end_at: Highest value to include
+        equal_to: Only include this value (instead of a range)
+        snapshot (callable, optional): Returns the whole node, e.g. from the cache
+    
+    Returns:
+        dict: {key: child}
+    """
+    try:
+        database = get_database()
+        query = database.child(node).order_by_child(order_by)
+        
+        if equal_to is not None:
+            query = query.equal_to(equal_to)
+        if start_at is not None:
+            query = query.start_at(start_at)
+        if end_at is not None:
+            query = query.end_at(end_at)
+        
+        children = query.get()
+        return children if isinstance(children, dict) else {}
+    except Exception as e:
+        print(f"Error querying {node} by {order_by}, filtering the whole node instead: {e}")
+    
+    try:
+        children = snapshot() if snapshot else get_database().child(node).get()
+    except Exception as e:
+        print(f"Error reading {node}: {e}")
+        return {}
+    
+    if not isinstance(children, dict):
+        return {}
+    return filter_children(children, order_by, start_at, end_at, equal_to)
+
+def query_matches(order_by, start_at=None, end_at=None, equal_to=None):
+    """
+    Get the matches whose order_by child is within a range, using a server-side query.
+    
+    The child must be listed in the matches ".indexOn" rule (see README);
+    without it the cached matches snapshot is filtered instead.
+    
+    Args:
+        order_by (str): Child to filter on, e.g. 'time' or 'locked'
+        start_at: Lowest value to include
+        end_at: Highest value to include
+        equal_to: Only include this value (instead of a range)
+    
+    Returns:
+        dict: {match_id: match}
+    """
+    matches = query_children('matches', order_by, start_at, end_at, equal_to, snapshot=get_all_matches)
+    return {match_id: match for match_id, match in matches.items() if isinstance(match, dict)}
+
+def get_unlocked_matches():
+    """Get the matches that are still open for predictions."""
+    # Missing values sort before false, so this also includes matches that have no locked field
+    return query_matches('locked', end_at=False)
+
 def save_match(match_id, data):
     """Save or update a match in Firebase."""
     try:
         database = get_database()
         matches_ref = database.child('matches')
-        matches_ref.child(str(match_id)).set(data)
+        matches_ref.child(str(match_id)).set({**data, 'updated_at': SERVER_TIMESTAMP})
+        invalidate_path('matches')
         return True
     except Exception as e:
         print(f"Error saving match {match_id}: {e}")
         return False
 
-def add_match(data):
-    """Add a new match to Firebase and return the generated ID."""
+def swap_match_result(match_id, result):
+    """
+    Set a match's result and lock it, in a transaction on the match record.
+    
+    The transaction returns the record it replaced, so callers that apply
+    score differences always diff against the real previous result, even when
+    two workers set a result for the same match at the same time.
+    
+    Returns:
+        tuple: (previous match, updated match), or (None, None) if the match
+        does not exist or the write failed
+    """
     try:
         database = get_database()
-        matches_ref = database.child('matches')
+        previous = None
+        
+        def apply(current):
+            nonlocal previous
+            previous = current
+            if not isinstance(current, dict):
+                return current
+            return {**current, 'result': result, 'locked': True, 'updated_at': SERVER_TIMESTAMP}
+        
+        updated = database.child('matches').child(str(match_id)).transaction(apply)
+        invalidate_path(f"matches/{match_id}")
         
-        # Get existing matches to generate next ID
-        existing_matches = matches_ref.get() or {}
-        next_id = str(len(existing_matches) + 1)
+        if not isinstance(previous, dict):
+            return None, None
+        return previous, updated
+    except Exception as e:
+        print(f"Error setting result of match {match_id}: {e}")
+        return None, None
+
+def allocate_match_ids(count=1):
+    """
+    Reserve a range of sequential match IDs with a transaction on counters/matches.
+    
+    Concurrent callers always get disjoint ranges. The first allocation seeds the
+    counter from the highest existing numeric match ID (a shallow read).
+    
+    Args:
+        count (int): Number of IDs to reserve
+    
+    Returns:
+        list: The reserved IDs as strings, or an empty list on failure
+    """
+    if count < 1:
+        return []
+    
+    try:
+        database = get_database()
+        seed = None
         
-        # Find a unique ID
-        while next_id in existing_matches:
-            next_id = str(int(next_id) + 1)
+        def reserve(current):
+            nonlocal seed
+            if not isinstance(current, int):
+                if seed is None:
+                    seed = max((int(key) for key in get_match_ids() if key.isdigit()), default=0)
+                current = seed
+            return current + count
         
-        matches_ref.child(next_id).set(data)
-        return next_id
+        last_id = database.child('counters').child('matches').transaction(reserve)
+        return [str(match_id) for match_id in range(last_id - count + 1, last_id + 1)]
     except Exception as e:
-        print(f"Error adding match: {e}")
+        print(f"Error allocating match IDs: {e}")
+        return []
+
+def add_match(data):
+    """Add a new match to Firebase and return the generated ID."""
+    match_ids = add_matches([data])
+    return match_ids[0] if match_ids else None
+
+def add_matches(matches):
+    """
+    Add several matches with IDs from one allocation and one multi-path write.
+    
+    Args:
+        matches (list): Match records
+    
+    Returns:
+        list: The generated IDs in the order of matches, or None on failure
+    """
+    match_ids = allocate_match_ids(len(matches))
+    if len(match_ids) != len(matches):
+        return None
+    
+    batch = WriteBatch()
+    for match_id, data in zip(match_ids, matches):
+        batch.update(f"matches/{match_id}", {**data, 'updated_at': SERVER_TIMESTAMP})
+    
+    if not batch.flush():
+        print(f"Error adding matches {', '.join(match_ids)}")
         return None
+    
+    return match_ids
+
+def get_fixture_index():
+    """Get the API-Football fixture index, {api_fixture_id: match_id}."""
+    try:
+        database = get_database()
+        index = database.child('fixture_index').get()
+        
+        if isinstance(index, list):
+            index = {str(i): match_id for i, match_id in enumerate(index) if match_id is not None}
+        return index if isinstance(index, dict) else {}
+    except Exception as e:
+        print(f"Error getting fixture index: {e}")
+        return {}
 
 def update_match(match_id, data):
     """Update specific fields of a match in Firebase."""
     try:
         database = get_database()
         matches_ref = database.child('matches')
-        matches_ref.child(str(match_id)).update(data)
+        matches_ref.child(str(match_id)).update({**data, 'updated_at': SERVER_TIMESTAMP})
+        invalidate_path('matches')
         return True
     except Exception as e:
         print(f"Error updating match {match_id}: {e}")
         return False
 
+def _prediction_dict(user_predictions):
+    """Normalize one user's predictions to {match_id: prediction}, or None if they are unusable."""
+    if isinstance(user_predictions, list):
+        # Convert user predictions list to dictionary using index as match_id
+        return {str(i): pred for i, pred in enumerate(user_predictions) if pred is not None}
+    if isinstance(user_predictions, dict):
+        return user_predictions
+    return None
+
 def get_all_predictions():
     """Get all predictions from Firebase."""
     try:
@@ -132,22 +727,53 @@ def get_all_predictions():
         # Ensure each user's predictions are also dictionaries
         cleaned_predictions = {}
         for user_id, user_predictions in predictions.items():
-            if user_predictions is None:
-                continue
-            elif isinstance(user_predictions, list):
-                # Convert user predictions list to dictionary using index as match_id
-                cleaned_predictions[user_id] = {str(i): pred for i, pred in enumerate(user_predictions) if pred is not None}
-            elif isinstance(user_predictions, dict):
+            user_predictions = _prediction_dict(user_predictions)
+            if user_predictions is not None:
                 cleaned_predictions[user_id] = user_predictions
-            # Skip if not dict or list
         
         return cleaned_predictions
     except Exception as e:
         print(f"Error getting predictions: {e}")
         return {}
 
+def iter_predictions_by_user(page_size=PREDICTION_PAGE_USERS):
+    """
+    Yield (user_id, predictions) for every user in the predictions node, in key order.
+    
+    The node is read page_size users at a time, so only one page is held in
+    memory. Database errors are raised rather than ending the iteration early,
+    so a failed read is never mistaken for the end of the node.
+    """
+    predictions_ref = get_database().child('predictions')
+    last_user_id = None
+    
+    while True:
+        if last_user_id is None:
+            limit = page_size
+            page = predictions_ref.order_by_key().limit_to_first(limit).get()
+        else:
+            # start_at is inclusive, so ask for one more and skip the last user of the previous page
+            limit = page_size + 1
+            page = predictions_ref.order_by_key().start_at(last_user_id).limit_to_first(limit).get()
+        
+        if not isinstance(page, dict) or not page:
+            return
+        
+        for user_id, user_predictions in page.items():
+            user_predictions = _prediction_dict(user_predictions)
+            if user_id != last_user_id and user_predictions is not None:
+                yield user_id, user_predictions
+        
+        if len(page) < limit:
+            return
+        last_user_id = next(reversed(page))
+
 def get_predictions(user_id):
     """Get all predictions for a specific user from Firebase."""
+    cached = _cache.get(('predictions', str(user_id)))
+    if cached is not _MISSING:
+        return cached
+    
     try:
         database = get_database()
         predictions_ref = database.child('predictions')
@@ -155,29 +781,177 @@ def get_predictions(user_id):
         
         # Ensure we always return a dictionary
         if user_predictions is None:
-            return {}
+            user_predictions = {}
         elif isinstance(user_predictions, list):
             # Convert list to dictionary if needed
-            return {str(i): pred for i, pred in enumerate(user_predictions) if pred is not None}
-        elif isinstance(user_predictions, dict):
-            return user_predictions
-        else:
+            user_predictions = {str(i): pred for i, pred in enumerate(user_predictions) if pred is not None}
+        elif not isinstance(user_predictions, dict):
             return {}
+        
+        _cache.set(('predictions', str(user_id)), user_predictions)
+        return user_predictions
     except Exception as e:
         print(f"Error getting predictions for user {user_id}: {e}")
         return {}
 
+def get_match_predictions(match_id):
+    """Get every user's prediction for a specific match from the match_predictions index, keyed by user ID."""
+    try:
+        database = get_database()
+        predictions = database.child('match_predictions').child(str(match_id)).get()
+        
+        if not isinstance(predictions, dict):
+            return {}
+        return {user_id: prediction for user_id, prediction in predictions.items() if isinstance(prediction, dict)}
+    except Exception as e:
+        print(f"Error getting predictions for match {match_id}: {e}")
+        return {}
+
+def get_match_prediction_user_ids(match_id):
+    """Get the IDs of the users who predicted a match, without downloading the predictions."""
+    try:
+        database = get_database()
+        user_ids = database.child('match_predictions').child(str(match_id)).get(shallow=True)
+        
+        if isinstance(user_ids, dict):
+            return set(user_ids.keys())
+        return set()
+    except Exception as e:
+        print(f"Error getting predicting users for match {match_id}: {e}")
+        return set()
+
+def get_reminded_user_ids(match_id):
+    """Get the IDs of the users who already received a reminder for a match."""
+    try:
+        database = get_database()
+        user_ids = database.child('reminders').child(str(match_id)).get(shallow=True)
+        
+        if isinstance(user_ids, dict):
+            return set(user_ids.keys())
+        return set()
+    except Exception as e:
+        print(f"Error getting reminders for match {match_id}: {e}")
+        return set()
+
+def rebuild_match_predictions_index():
+    """Rebuild the predictions-by-match index from the full predictions node."""
+    try:
+        index = {}
+        for user_id, user_predictions in get_all_predictions().items():
+            for match_id, prediction in user_predictions.items():
+                if isinstance(prediction, dict):
+                    index.setdefault(match_id, {})[user_id] = prediction
+        
+        database = get_database()
+        database.child('match_predictions').set(index)
+        return True
+    except Exception as e:
+        print(f"Error rebuilding match predictions index: {e}")
+        return False
+
+def ensure_match_predictions_index():
+    """Build the predictions-by-match index if it does not exist yet (e.g. on an existing database)."""
+    try:
+        database = get_database()
+        if database.child('match_predictions').get(shallow=True) is None:
+            return rebuild_match_predictions_index()
+        return True
+    except Exception as e:
+        print(f"Error checking match predictions index: {e}")
+        return False
+
+def _build_models(records, build, label):
+    """Build typed models from {key: record}, skipping records that fail validation."""
+    models = {}
+    for key, record in records.items():
+        if not isinstance(record, dict):
+            continue
+        
+        try:
+            models[key] = build(key, record)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Skipping invalid {label} {key}: {e}")
+    
+    return models
+
+def get_match_models():
+    """Get all matches as validated Match models, keyed by match ID."""
+    return _build_models(get_all_matches(), Match.from_dict, "match")
+
+def get_prediction_models(user_id):
+    """Get a user's predictions as validated Prediction models, keyed by match ID."""
+    return _build_models(get_predictions(user_id), lambda _, record: Prediction.from_dict(record), "prediction")
+
+def get_match_prediction_models(match_id):
+    """Get every user's prediction for a match as Prediction models, keyed by user ID."""
+    return _build_models(get_match_predictions(match_id), lambda _, record: Prediction.from_dict(record), "prediction")
+
+def get_user_model(user_id):
+    """Get a user as a validated User model, or None if the user does not exist."""
+    user = get_user(user_id)
+    if not user:
+        return None
+    
+    try:
+        return User.from_dict(user_id, user)
+    except (TypeError, ValueError) as e:
+        print(f"Skipping invalid user {user_id}: {e}")
+        return None
+
 def save_prediction(user_id, match_id, data):
-    """Save a prediction for a user and match in Firebase."""
+    """
+    Save a prediction for a user and match in Firebase.
+    
+    The prediction is stamped with a server-side updated_at and mirrored into
+    the match_predictions index and the prediction_changes log in the same
+    write, so per-match lookups and delta exports don't read every prediction.
+    """
     try:
         database = get_database()
-        predictions_ref = database.child('predictions')
-        predictions_ref.child(str(user_id)).child(str(match_id)).set(data)
+        prediction = {**data, 'updated_at': SERVER_TIMESTAMP}
+        database.update({
+            f"predictions/{user_id}/{match_id}": prediction,
+            f"match_predictions/{match_id}/{user_id}": prediction,
+            f"prediction_changes/{prediction_change_key(user_id, match_id)}": {
+                **prediction, 'user_id': str(user_id), 'match_id': str(match_id)
+            }
+        })
+        invalidate_path(f"predictions/{user_id}")
         return True
     except Exception as e:
         print(f"Error saving prediction for user {user_id}, match {match_id}: {e}")
         return False
 
+def prediction_change_key(user_id, match_id):
+    """Key of a prediction in the prediction_changes log."""
+    return f"{user_id}_{match_id}"
+
+def get_prediction_changes(since=None, before=None):
+    """
+    Get logged predictions saved at or after since and before before.
+    
+    Args:
+        since (int, optional): Epoch milliseconds; unbounded if None
+        before (int, optional): Epoch milliseconds (exclusive); unbounded if None
+    
+    Returns:
+        dict: {change_key: prediction with user_id, match_id and updated_at}
+    """
+    return query_children(
+        'prediction_changes', 'updated_at',
+        start_at=since, end_at=before - 1 if before is not None else None
+    )
+
+def get_export_state():
+    """Get the export watermark and manifest chain, e.g. {'watermark': ..., 'manifest': {...}}."""
+    try:
+        database = get_database()
+        state = database.child('exports').get()
+        return state if isinstance(state, dict) else {}
+    except Exception as e:
+        print(f"Error getting export state: {e}")
+        return {}
+
 def get_current_stage():
     """Get the current tournament stage from Firebase."""
     try:
@@ -201,14 +975,120 @@ def set_current_stage(stage):
         return False
 
 
+def increment_value(delta):
+    """Return a server-side increment sentinel for use in update() payloads."""
+    return {".sv": {"increment": delta}}
 
+def run_transaction(path, update):
+    """
+    Atomically replace the value at path with update(current value).
+    
+    update may be called several times if the value is changed concurrently,
+    and must not have side effects.
+    
+    Returns:
+        The committed value, or None if the transaction failed
+    """
+    try:
+        database = get_database()
+        value = database.child(str(path).strip('/')).transaction(update)
+        invalidate_path(path)
+        return value
+    except Exception as e:
+        print(f"Error running transaction on {path}: {e}")
+        return None
 
+def update_multiple(updates):
+    """Apply several child updates, keyed by path from the root, in one multi-path write."""
+    if not updates:
+        return True
+    
+    try:
+        database = get_database()
+        database.update(updates)
+        for path in updates:
+            invalidate_path(path)
+        return True
+    except Exception as e:
+        print(f"Error applying multi-path update: {e}")
+        return False
+
+class WriteBatch:
+    """
+    Collect child updates and write them as root-level multi-path updates.
+    
+    Updates are keyed by their path from the database root, e.g.
+    ``batch.update("users/42/score", 7)``. On flush they are sent as a single
+    update() call, or as several if the payload would exceed max_bytes.
+    Each chunk is atomic on its own, but a split batch is not atomic as a whole.
+    Paths in one batch must not overlap (e.g. "users/1" and "users/1/score").
+    
+    Usage:
+        with WriteBatch() as batch:
+            for user_id, score in scores.items():
+                batch.update(f"users/{user_id}/score", score)
+    """
+    
+    def __init__(self, max_bytes=MAX_BATCH_BYTES):
+        self.max_bytes = max_bytes
+        self._updates = {}
+    
+    def __len__(self):
+        return len(self._updates)
+    
+    def update(self, path, value):
+        """Queue a value to be written at path (None deletes the node)."""
+        self._updates[str(path).strip('/')] = value
+    
+    def update_children(self, path, data):
+        """Queue every key of data as a child update under path."""
+        for key, value in data.items():
+            self.update(f"{str(path).strip('/')}/{key}", value)
+    
+    def chunks(self):
+        """Split the queued updates into payloads that stay under max_bytes."""
+        chunks = []
+        current = {}
+        current_size = 2
+        
+        for path, value in self._updates.items():
+            entry_size = len(json.dumps({path: value}, separators=(',', ':'), default=str))
+            if current and current_size + entry_size > self.max_bytes:
+                chunks.append(current)
+                current = {}
+                current_size = 2
+            current[path] = value
+            current_size += entry_size
+        
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def flush(self):
+        """Write every queued update and empty the batch. Returns True if all chunks were written."""
+        success = True
+        for chunk in self.chunks():
+            if not update_multiple(chunk):
+                success = False
+                break
+        
+        self._updates.clear()
+        return success
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        return False
 
 def clear_all_data():
     """Clear all data from Firebase (for testing purposes)."""
     try:
         database = get_database()
         database.set({})
+        invalidate_path('/')
         return True
     except Exception as e:
         print(f"Error clearing data: {e}")
@@ -0,0 +1,220 @@
+"""
+Persistent FSM storage for the admin conversations (AddMatchForm, SetResultForm, ...).
+
+aiogram's MemoryStorage loses every in-progress form on a restart and cannot be
+shared between bot processes. The storages here keep each conversation as one
+compact record:
+    
+    {"s": "AddMatchForm:team2", "d": "{\"team1\":\"Chelsea\"}", "e": 1750000000}
+
+where s is the state, d the form data as compact JSON and e the epoch second the
+record expires. Records that were not touched for FSM_STATE_TTL_SECONDS are
+treated as empty when read and removed by purge_expired.
+
+Backends (FSM_STORAGE):
+    firebase - the fsm node of the Realtime Database; shared by every process
+    sqlite   - a local SQLite file (FSM_SQLITE_PATH); survives restarts of one process
+    memory   - aiogram's MemoryStorage, e.g. for tests
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import abstractmethod
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DEFAULT_DESTINY
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from .firebase_helpers import query_children, run_db, WriteBatch
+from .firebase_init import get_database
+
+# Which FSM storage backend the bot uses
+FSM_STORAGE = os.environ.get("FSM_STORAGE", "firebase").lower()
+
+# Conversations idle for longer than this are dropped
+FSM_STATE_TTL_SECONDS = int(os.environ.get("FSM_STATE_TTL_SECONDS", str(24 * 3600)))
+
+# Database file of the sqlite backend
+FSM_SQLITE_PATH = os.environ.get("FSM_SQLITE_PATH", "fsm_states.sqlite3")
+
+def storage_key_id(key):
+    """
+    Flatten a StorageKey into a database key, e.g. "123:-100456:789".
+    
+    Only the parts that are set are included, which keeps the usual
+    private-chat key short and free of characters Firebase rejects.
+    """
+    parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+    if key.thread_id:
+        parts.append(f"t{key.thread_id}")
+    if key.business_connection_id:
+        parts.append(f"b{key.business_connection_id}")
+    if key.destiny != DEFAULT_DESTINY:
+        parts.append(f"d{key.destiny}")
+    return ":".join(parts)
+
+def encode_data(data):
+    """Serialize form data as compact JSON, or None if there is none."""
+    if not data:
+        return None
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+def decode_data(raw):
+    """Deserialize form data written by encode_data."""
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw)
+        return data if isinstance(data, dict) else {}
+    except ValueError:
+        return {}
+
+class TTLStorage(BaseStorage):
+    """
+    Base class of the persistent storages.
+    
+    Subclasses implement the blocking _read, _write and purge_expired; they are
+    run on the database thread pool. State and data are written separately,
+    so setting one never overwrites a concurrent change to the other.
+    """
+    
+    def __init__(self, ttl=FSM_STATE_TTL_SECONDS):
+        self.ttl = ttl
+    
+    @abstractmethod
+    def _read(self, key_id):
+        """Return the stored record of a key, or None."""
+    
+    @abstractmethod
+    def _write(self, key_id, fields):
+        """Set fields ('s', 'd', 'e') of a record; None values clear a field."""
+    
+    @abstractmethod
+    def purge_expired(self, now=None):
+        """Delete expired records. Returns how many were deleted."""
+    
+    def _live_record(self, key_id):
+        """Read a record, treating an expired one as empty."""
+        record = self._read(key_id)
+        if not record:
+            return {}
+        
+        if (record.get('e') or 0) <= time.time():
+            # Delete it now, so a later write of one field can't revive the stale other one
+            self._write(key_id, {'s': None, 'd': None, 'e': None})
+            return {}
+        return record
+    
+    def _fields(self, field, value):
+        """Fields to write for one changed value; the expiry is pushed back on every write."""
+        return {field: value, 'e': int(time.time()) + self.ttl}
+    
+    async def set_state(self, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        await run_db(self._write, storage_key_id(key), self._fields('s', state))
+    
+    async def get_state(self, key):
+        record = await run_db(self._live_record, storage_key_id(key))
+        return record.get('s')
+    
+    async def set_data(self, key, data):
+        await run_db(self._write, storage_key_id(key), self._fields('d', encode_data(data)))
+    
+    async def get_data(self, key):
+        record = await run_db(self._live_record, storage_key_id(key))
+        return decode_data(record.get('d'))
+    
+    async def close(self):
+        pass
+
+class FirebaseStorage(TTLStorage):
+    """FSM storage in the fsm node of the Realtime Database ({key_id: record})."""
+    
+    def __init__(self, ttl=FSM_STATE_TTL_SECONDS, node="fsm"):
+        super().__init__(ttl)
+        self.node = node
+    
+    def _read(self, key_id):
+        try:
+            record = get_database().child(self.node).child(key_id).get()
+            return record if isinstance(record, dict) else None
+        except Exception as e:
+            print(f"Error reading FSM state {key_id}: {e}")
+            return None
+    
+    def _write(self, key_id, fields):
+        try:
+            # Multi-path update of the fields only; a None value deletes the child
+            get_database().child(self.node).child(key_id).update(fields)
+        except Exception as e:
+            print(f"Error writing FSM state {key_id}: {e}")
+    
+    def purge_expired(self, now=None):
+        now = int(now or time.time())
+        expired = query_children(self.node, 'e', end_at=now)
+        if not expired:
+            return 0
+        
+        with WriteBatch() as batch:
+            for key_id in expired:
+                batch.update(f"{self.node}/{key_id}", None)
+        return len(expired)
+
+class SQLiteStorage(TTLStorage):
+    """FSM storage in a local SQLite file, one row per conversation."""
+    
+    def __init__(self, path=FSM_SQLITE_PATH, ttl=FSM_STATE_TTL_SECONDS):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS fsm ("
+                "key TEXT PRIMARY KEY, s TEXT, d TEXT, e INTEGER)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS fsm_expires ON fsm (e)")
+    
+    def _read(self, key_id):
+        with self._lock:
+            row = self._connection.execute("SELECT s, d, e FROM fsm WHERE key = ?", (key_id,)).fetchone()
+        return dict(zip(('s', 'd', 'e'), row)) if row else None
+    
+    def _write(self, key_id, fields):
+        # Field names come from TTLStorage._fields, never from user input
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        assignments = ", ".join(f"{field} = excluded.{field}" for field in fields)
+        
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT INTO fsm (key, {columns}) VALUES (?, {placeholders}) "
+                f"ON CONFLICT(key) DO UPDATE SET {assignments}",
+                (key_id, *fields.values())
+            )
+            self._connection.execute("DELETE FROM fsm WHERE key = ? AND s IS NULL AND d IS NULL", (key_id,))
+    
+    def purge_expired(self, now=None):
+        now = int(now or time.time())
+        with self._lock, self._connection:
+            return self._connection.execute("DELETE FROM fsm WHERE e <= ?", (now,)).rowcount
+    
+    async def close(self):
+        with self._lock:
+            self._connection.close()
+
+def create_fsm_storage(kind=FSM_STORAGE):
+    """
+    Create the FSM storage selected by FSM_STORAGE.
+    
+    Returns:
+        BaseStorage: FirebaseStorage, SQLiteStorage or MemoryStorage
+    """
+    if kind == "firebase":
+        return FirebaseStorage()
+    if kind == "sqlite":
+        return SQLiteStorage()
+    if kind == "memory":
+        return MemoryStorage()
+    raise ValueError(f"FSM_STORAGE must be 'firebase', 'sqlite' or 'memory', not {kind!r}")
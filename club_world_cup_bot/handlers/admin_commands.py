@@ -2,16 +2,19 @@
 Command handlers for admin users.
 """
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import logging
+import os
 from datetime import datetime
 
 from club_world_cup_bot.messages.strings import (
     ADMIN_PANEL, ADMIN_ONLY, MATCH_ADDED, 
-    RESULT_SET, LEADERBOARD_UPDATED, CSV_EXPORTED,
+    RESULT_SET, LEADERBOARD_UPDATED, CSV_EXPORTED, DATA_EXPORTED,
+    CHANGES_EXPORTED, NO_EXPORT_CHANGES,
+    FIXTURES_IMPORTED, IMPORT_FIXTURES_INVALID_FORMAT, API_NOT_AVAILABLE,
     USER_WHITELISTED_SUCCESS, USER_ALREADY_WHITELISTED, 
     USER_NOT_FOUND, WHITELIST_INVALID_FORMAT
 )
@@ -21,16 +24,22 @@ from club_world_cup_bot.keyboards.prediction_keyboard import (
 from club_world_cup_bot.keyboards.persistent_keyboard import (
     get_admin_keyboard as get_admin_reply_keyboard
 )
+from club_world_cup_bot.keyboards.callbacks import AdminMatch, callback_filter
 from club_world_cup_bot.services.prediction import (
-    is_admin, is_admin_by_username, add_match, set_match_result, get_matches,
+    add_match, set_match_result, get_matches,
     set_whitelisted_by_username, is_whitelisted_by_username
 )
+from club_world_cup_bot.services.access import AccessDecision
+from club_world_cup_bot.firebase_helpers import run_db
 from club_world_cup_bot.services.scoring import update_leaderboard
-from club_world_cup_bot.services.export_csv import export_predictions_csv
+from club_world_cup_bot.services.export_csv import export_predictions_csv_file
+from club_world_cup_bot.services.export_columnar import export_columnar_file
+from club_world_cup_bot.services.export_delta import export_changes_file, commit_changes_export
 
 # Optional API Football integration
 try:
     from club_world_cup_bot.services.api_fetch import APIFootballClient, format_match_data
+    from club_world_cup_bot.services.fixture_import import import_league_fixtures
     API_AVAILABLE = True
 except (ImportError, ModuleNotFoundError):
     API_AVAILABLE = False
@@ -58,62 +67,63 @@ class WhitelistUserForm(StatesGroup):
 
 # Removed ExportedFilesForm as it's no longer needed with Firebase
 
-def check_admin_permissions(user):
-    """Check if user has admin permissions by ID or username."""
-    user_id = str(user.id)
-    username = user.username
-    
-    # First check by ID, then by username if available
-    if is_admin(user_id):
-        return True
-    
-    if username and is_admin_by_username(username):
-        return True
-    
-    return False
-
 # Button handlers for admin-specific buttons
 @router.message(F.text == "⚙️ Admin Panel")
-async def button_admin(message: Message):
+async def button_admin(message: Message, access: AccessDecision):
     """Handle the Admin Panel button."""
-    await cmd_admin(message)
+    await cmd_admin(message, access)
 
 @router.message(F.text == "🔄 Update Scores")
-async def button_update_leaderboard(message: Message):
+async def button_update_leaderboard(message: Message, access: AccessDecision):
     """Handle the Update Scores button."""
-    if not check_admin_permissions(message.from_user):
+    if not access.is_admin:
         await message.answer(ADMIN_ONLY)
         return
     
-    update_leaderboard()
+    await run_db(update_leaderboard)
     await message.answer(LEADERBOARD_UPDATED)
 
+async def send_export(message: Message, export_file, caption):
+    """Write an export to a temporary file with export_file and send it as a document."""
+    path, filename = await run_db(export_file)
+    
+    try:
+        await message.answer_document(
+            document=FSInputFile(path, filename=filename),
+            caption=f"✅ {caption}\n📊 Generated: {filename}"
+        )
+    finally:
+        os.remove(path)
+
+async def send_changes_export(message: Message, full=False):
+    """Send the changes since the last export, then move the export watermark."""
+    export = await run_db(export_changes_file, full)
+    if export is None:
+        await message.answer(NO_EXPORT_CHANGES)
+        return
+    
+    try:
+        await message.answer_document(
+            document=FSInputFile(export.path, filename=export.filename),
+            caption=(
+                f"✅ {CHANGES_EXPORTED}\n📊 Generated: {export.filename}\n"
+                f"🔁 {export.entry['predictions']} predictions, {export.entry['matches']} matches"
+            )
+        )
+        # Only a delivered export moves the watermark
+        await run_db(commit_changes_export, export)
+    finally:
+        os.remove(export.path)
+
 @router.message(F.text == "📊 Export CSV")
-async def button_export_csv(message: Message):
+async def button_export_csv(message: Message, access: AccessDecision):
     """Handle the Export CSV button."""
-    if not check_admin_permissions(message.from_user):
+    if not access.is_admin:
         await message.answer(ADMIN_ONLY)
         return
     
     try:
-        # Generate CSV
-        csv_data, filename = export_predictions_csv()
-        
-        # Create BytesIO object for file sending
-        from aiogram.types import BufferedInputFile
-        
-        # Convert CSV string to bytes
-        csv_bytes = csv_data.encode('utf-8')
-        
-        # Create input file for Telegram
-        input_file = BufferedInputFile(csv_bytes, filename)
-        
-        # Send the file
-        await message.answer_document(
-            document=input_file,
-            caption=f"✅ {CSV_EXPORTED}\n📊 Generated: {filename}"
-        )
-        
+        await send_export(message, export_predictions_csv_file, CSV_EXPORTED)
     except Exception as e:
         await message.answer(f"❌ Failed to export CSV: {str(e)}")
 
@@ -123,9 +133,9 @@ async def button_exported_files(message: Message, state: FSMContext):
     await message.answer("📁 Export functionality simplified.\n\nUse 'Export CSV' to save exports to Firebase.")
 
 @router.message(F.text == "👥 Whitelist User")
-async def button_whitelist_user(message: Message, state: FSMContext):
+async def button_whitelist_user(message: Message, state: FSMContext, access: AccessDecision):
     """Handle the Whitelist User button."""
-    if not check_admin_permissions(message.from_user):
+    if not access.is_admin:
         await message.answer(ADMIN_ONLY)
         return
     
@@ -134,9 +144,9 @@ async def button_whitelist_user(message: Message, state: FSMContext):
 
 # Original command handlers
 @router.message(Command("admin"))
-async def cmd_admin(message: Message):
+async def cmd_admin(message: Message, access: AccessDecision):
     """Handle the /admin command."""
-    if not check_admin_permissions(message.from_user):
+    if not access.is_admin:
         await message.answer(ADMIN_ONLY)
         return
     
@@ -152,11 +162,11 @@ async def cmd_admin(message: Message):
     )
 
 @router.callback_query(F.data == "admin_addmatch")
-async def process_add_match(callback: CallbackQuery, state: FSMContext):
+async def process_add_match(callback: CallbackQuery, state: FSMContext, access: AccessDecision):
     """Handle add match button click."""
     await callback.answer()
     
-    if not check_admin_permissions(callback.from_user):
+    if not access.is_admin:
         await callback.message.edit_text(ADMIN_ONLY)
         return
     
@@ -164,15 +174,15 @@ async def process_add_match(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text("Enter the home team name:")
 
 @router.callback_query(F.data == "admin_setresult")
-async def process_set_result(callback: CallbackQuery, state: FSMContext):
+async def process_set_result(callback: CallbackQuery, state: FSMContext, access: AccessDecision):
     """Handle set result button click."""
     await callback.answer()
     
-    if not check_admin_permissions(callback.from_user):
+    if not access.is_admin:
         await callback.message.edit_text(ADMIN_ONLY)
         return
     
-    matches = get_matches()
+    matches = await run_db(get_matches)
     if not matches:
         await callback.message.edit_text("No matches available.")
         return
@@ -184,54 +194,65 @@ async def process_set_result(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.callback_query(F.data == "admin_updateleaderboard")
-async def process_update_leaderboard(callback: CallbackQuery):
+async def process_update_leaderboard(callback: CallbackQuery, access: AccessDecision):
     """Handle update leaderboard button click."""
     await callback.answer()
     
-    if not check_admin_permissions(callback.from_user):
+    if not access.is_admin:
         await callback.message.edit_text(ADMIN_ONLY)
         return
     
-    update_leaderboard()
+    await run_db(update_leaderboard)
     await callback.message.edit_text(LEADERBOARD_UPDATED)
 
 @router.callback_query(F.data == "admin_exportcsv")
-async def process_export_csv(callback: CallbackQuery):
+async def process_export_csv(callback: CallbackQuery, access: AccessDecision):
     """Handle export CSV button click."""
     await callback.answer()
     
-    if not check_admin_permissions(callback.from_user):
+    if not access.is_admin:
         await callback.message.edit_text(ADMIN_ONLY)
         return
     
     try:
-        # Generate CSV
-        csv_data, filename = export_predictions_csv()
-        
-        # Create BytesIO object for file sending
-        from aiogram.types import BufferedInputFile
-        
-        # Convert CSV string to bytes
-        csv_bytes = csv_data.encode('utf-8')
-        
-        # Create input file for Telegram
-        input_file = BufferedInputFile(csv_bytes, filename)
-        
-        # Send the file
-        await callback.message.answer_document(
-            document=input_file,
-            caption=f"✅ {CSV_EXPORTED}\n📊 Generated: {filename}"
-        )
-        
+        await send_export(callback.message, export_predictions_csv_file, CSV_EXPORTED)
     except Exception as e:
         await callback.message.edit_text(f"❌ Failed to export CSV: {str(e)}")
 
+@router.callback_query(F.data == "admin_exportdata")
+async def process_export_data(callback: CallbackQuery, access: AccessDecision):
+    """Handle export data button click."""
+    await callback.answer()
+    
+    if not access.is_admin:
+        await callback.message.edit_text(ADMIN_ONLY)
+        return
+    
+    try:
+        await send_export(callback.message, export_columnar_file, DATA_EXPORTED)
+    except Exception as e:
+        await callback.message.edit_text(f"❌ Failed to export data: {str(e)}")
+
+@router.callback_query(F.data == "admin_exportchanges")
+async def process_export_changes(callback: CallbackQuery, access: AccessDecision):
+    """Handle export changes button click."""
+    await callback.answer()
+    
+    if not access.is_admin:
+        await callback.message.edit_text(ADMIN_ONLY)
+        return
+    
+    try:
+        await send_changes_export(callback.message)
+    except Exception as e:
+        await callback.message.edit_text(f"❌ Failed to export changes: {str(e)}")
+
 @router.callback_query(F.data == "admin_whitelist")
-async def process_whitelist_user(callback: CallbackQuery, state: FSMContext):
+async def process_whitelist_user(callback: CallbackQuery, state: FSMContext, access: AccessDecision):
     """Handle whitelist user button click."""
     await callback.answer()
     
-    if not check_admin_permissions(callback.from_user):
+    if not access.is_admin:
         await callback.message.edit_text(ADMIN_ONLY)
         return
     
@@ -250,13 +271,13 @@ async def process_whitelist_username(message: Message, state: FSMContext):
         username = username_input
     
     # Check if user is already whitelisted
-    if is_whitelisted_by_username(username):
+    if await run_db(is_whitelisted_by_username, username):
         await message.answer(USER_ALREADY_WHITELISTED.format(f"@{username}"))
         await state.clear()
         return
     
     # Try to whitelist the user
-    success = set_whitelisted_by_username(username, True)
+    success = await run_db(set_whitelisted_by_username, username, True)
     
     if success:
         await message.answer(USER_WHITELISTED_SUCCESS.format(f"@{username}"))
@@ -308,7 +329,7 @@ async def process_is_knockout(message: Message, state: FSMContext):
     time = data["time"]
     
     # Add the match
-    match_id = add_match(team1, team2, time, is_knockout)
+    match_id = await run_db(add_match, team1, team2, time, is_knockout)
     
     await state.clear()
     await message.answer(
@@ -319,13 +340,13 @@ async def process_is_knockout(message: Message, state: FSMContext):
         f"Knockout: {'Yes' if is_knockout else 'No'}"
     )
 
-@router.callback_query(F.data.startswith("adminmatch_"))
-async def process_admin_match_selection(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(callback_filter(AdminMatch))
+async def process_admin_match_selection(callback: CallbackQuery, callback_data: AdminMatch, state: FSMContext):
     """Handle match selection for setting result."""
     await callback.answer()
     
-    match_id = callback.data.split("_")[1]
-    matches = get_matches()
+    match_id = callback_data.match_id
+    matches = await run_db(get_matches)
     match = matches.get(match_id)
     
     if not match:
@@ -353,7 +374,7 @@ async def process_result_home_goals(message: Message, state: FSMContext):
         
         data = await state.get_data()
         match_id = data["match_id"]
-        matches = get_matches()
+        matches = await run_db(get_matches)
         match = matches.get(match_id)
         
         await message.answer(f"Enter goals for {match['team2']}:")
@@ -373,7 +394,7 @@ async def process_result_away_goals(message: Message, state: FSMContext):
         data = await state.get_data()
         match_id = data["match_id"]
         home_goals = data["home_goals"]
-        matches = get_matches()
+        matches = await run_db(get_matches)
         match = matches.get(match_id)
         
         if match.get("is_knockout", False):
@@ -389,7 +410,7 @@ async def process_result_away_goals(message: Message, state: FSMContext):
                 # If not a tie, set as FT with appropriate winner
                 winner = "1" if home_goals > away_goals else "2"
                 resolution_type = f"FT_{winner}"
-                set_match_result(match_id, home_goals, away_goals, resolution_type)
+                await run_db(set_match_result, match_id, home_goals, away_goals, resolution_type)
                 await state.clear()
                 
                 winner_name = match['team1'] if winner == "1" else match['team2']
@@ -401,7 +422,7 @@ async def process_result_away_goals(message: Message, state: FSMContext):
                 )
         else:
             # For group stage matches, set the result immediately
-            set_match_result(match_id, home_goals, away_goals)
+            await run_db(set_match_result, match_id, home_goals, away_goals)
             await state.clear()
             
             await message.answer(
@@ -430,7 +451,7 @@ async def process_result_resolution_type(message: Message, state: FSMContext):
     
     data = await state.get_data()
     match_id = data["match_id"]
-    matches = get_matches()
+    matches = await run_db(get_matches)
     match = matches.get(match_id)
     
     await message.answer(
@@ -455,14 +476,14 @@ async def process_knockout_winner(message: Message, state: FSMContext):
     away_goals = data["away_goals"]
     resolution_type = data["resolution_type"]
     
-    matches = get_matches()
+    matches = await run_db(get_matches)
     match = matches.get(match_id)
     
     # Combine resolution type and winner - handling more complex formats if needed
     full_resolution = f"{resolution_type}_{winner}"
     
     # Set the match result
-    set_match_result(match_id, home_goals, away_goals, full_resolution)
+    await run_db(set_match_result, match_id, home_goals, away_goals, full_resolution)
     await state.clear()
     
     # Get team name for display
@@ -476,15 +497,80 @@ async def process_knockout_winner(message: Message, state: FSMContext):
         f"{LEADERBOARD_UPDATED}"
     )
 
+@router.message(Command("exportdata"))
+async def cmd_export_data(message: Message, access: AccessDecision):
+    """Handle the /exportdata command."""
+    if not access.is_admin:
+        await message.answer(ADMIN_ONLY)
+        return
+    
+    try:
+        await send_export(message, export_columnar_file, DATA_EXPORTED)
+    except Exception as e:
+        await message.answer(f"❌ Failed to export data: {str(e)}")
+
+@router.message(Command("exportchanges"))
+async def cmd_export_changes(message: Message, access: AccessDecision):
+    """Handle the /exportchanges command. Use "/exportchanges full" to start a new chain."""
+    if not access.is_admin:
+        await message.answer(ADMIN_ONLY)
+        return
+    
+    full = message.text.split()[1:2] == ["full"]
+    
+    try:
+        await send_changes_export(message, full)
+    except Exception as e:
+        await message.answer(f"❌ Failed to export changes: {str(e)}")
+
+@router.message(Command("importfixtures"))
+async def cmd_import_fixtures(message: Message, access: AccessDecision):
+    """Handle the /importfixtures command to import a league season's fixtures from API-Football."""
+    if not access.is_admin:
+        await message.answer(ADMIN_ONLY)
+        return
+    
+    if not API_AVAILABLE:
+        await message.answer(API_NOT_AVAILABLE)
+        return
+    
+    command_parts = message.text.split()
+    
+    if len(command_parts) != 3 or not command_parts[1].isdigit() or not command_parts[2].isdigit():
+        await message.answer(IMPORT_FIXTURES_INVALID_FORMAT)
+        return
+    
+    try:
+        result = await run_db(import_league_fixtures, int(command_parts[1]), int(command_parts[2]))
+    except ValueError:
+        # Raised by APIFootballClient when API_FOOTBALL_KEY is not set
+        await message.answer(API_NOT_AVAILABLE)
+        return
+    except Exception as e:
+        await message.answer(f"❌ Failed to import fixtures: {str(e)}")
+        return
+    
+    if result is None:
+        await message.answer("❌ Failed to import fixtures. Please try again later.")
+        return
+    
+    # Finished fixtures are imported with their results
+    if result['with_results']:
+        await run_db(update_leaderboard)
+    
+    await message.answer(FIXTURES_IMPORTED.format(
+        len(result['added']), len(result['updated']), result['unchanged'], result['skipped']
+    ))
+
 @router.message(Command("exportedfiles"))
 async def cmd_exported_files(message: Message, state: FSMContext):
     """Handle the /exportedfiles command."""
     await button_exported_files(message, state)
 
 @router.message(Command("whitelist"))
-async def cmd_whitelist(message: Message):
+async def cmd_whitelist(message: Message, access: AccessDecision):
     """Handle the /whitelist command to whitelist users by username."""
-    if not check_admin_permissions(message.from_user):
+    if not access.is_admin:
         await message.answer(ADMIN_ONLY)
         return
     
@@ -504,12 +590,12 @@ async def cmd_whitelist(message: Message):
         username = username_input
     
     # Check if user is already whitelisted
-    if is_whitelisted_by_username(username):
+    if await run_db(is_whitelisted_by_username, username):
         await message.answer(USER_ALREADY_WHITELISTED.format(f"@{username}"))
         return
     
     # Try to whitelist the user
-    success = set_whitelisted_by_username(username, True)
+    success = await run_db(set_whitelisted_by_username, username, True)
     
     if success:
         await message.answer(USER_WHITELISTED_SUCCESS.format(f"@{username}"))
@@ -0,0 +1,121 @@
+"""
+Typed callback data for inline keyboard buttons.
+
+Each kind of button has a CallbackData factory with a two-letter prefix and
+its fields packed after it, e.g. Score(match_id="12", home=2, away=1) is sent
+as "sc:12:2:1". Handlers receive the decoded object instead of splitting
+callback.data themselves.
+
+Buttons on messages sent before this format still carry the old data
+(e.g. "away_12_2_1"); decode_callback maps those to the same objects.
+"""
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+
+class PredictMatch(CallbackData, prefix="pm"):
+    """Open the score grid of a match."""
+    match_id: str
+
+class OtherScore(CallbackData, prefix="os"):
+    """Enter a score that is not on the grid, one team at a time."""
+    match_id: str
+
+class HomeGoals(CallbackData, prefix="hg"):
+    """Home goals picked; ask for the away goals."""
+    match_id: str
+    home: int
+
+class Score(CallbackData, prefix="sc"):
+    """Full-time score picked (from the grid or the away goals keyboard)."""
+    match_id: str
+    home: int
+    away: int
+
+class Resolution(CallbackData, prefix="rs"):
+    """How a knockout tie is decided: ET or PEN, and the winner (1 or 2)."""
+    match_id: str
+    home: int
+    away: int
+    resolution: str
+    winner: int = 0
+
+class ViewMatch(CallbackData, prefix="vm"):
+    """Show a match's details."""
+    match_id: str
+
+class ViewResult(CallbackData, prefix="vr"):
+    """Show a finished match's result and the points earned."""
+    match_id: str
+
+class AdminMatch(CallbackData, prefix="am"):
+    """Pick a match to set its result (admin)."""
+    match_id: str
+
+CALLBACK_FACTORIES = {
+    factory.__prefix__: factory
+    for factory in (PredictMatch, OtherScore, HomeGoals, Score, Resolution, ViewMatch, ViewResult, AdminMatch)
+}
+
+# Old "{name}_{field}_{field}..." callback data, still on buttons of earlier messages
+LEGACY_CALLBACKS = {
+    "match": PredictMatch,
+    "home": HomeGoals,
+    "away": Score,
+    "resolution": Resolution,
+    "viewmatch": ViewMatch,
+    "viewresult": ViewResult,
+    "adminmatch": AdminMatch
+}
+
+def _decode_legacy(data):
+    """Decode old underscore-separated callback data, or return None."""
+    name, _, rest = data.partition("_")
+    factory = LEGACY_CALLBACKS.get(name)
+    if factory is None or not rest:
+        return None
+    
+    values = rest.split("_")
+    fields = list(factory.model_fields)
+    if len(values) > len(fields):
+        return None
+    return factory(**dict(zip(fields, values)))
+
+def decode_callback(data):
+    """
+    Decode callback data into its CallbackData object.
+    
+    Returns:
+        CallbackData or None: None for data that isn't one of the factories
+        (e.g. the static "admin_..." buttons)
+    """
+    if not data:
+        return None
+    
+    try:
+        # All factories use the default ":" separator
+        factory = CALLBACK_FACTORIES.get(data.partition(":")[0])
+        if factory is not None:
+            return factory.unpack(data)
+        return _decode_legacy(data)
+    except (TypeError, ValueError):
+        return None
+
+def callback_filter(*factories):
+    """
+    Build a filter for callback queries whose data decodes to one of factories.
+    
+    The decoded object is passed to the handler as callback_data. Unlike
+    Factory.filter(), this also matches the old callback data of earlier messages.
+    
+    Usage:
+        @router.callback_query(callback_filter(*CALLBACK_HANDLERS))
+    """
+    factories = frozenset(factories)
+    
+    def check(callback: CallbackQuery):
+        callback_data = decode_callback(callback.data)
+        if type(callback_data) in factories:
+            return {"callback_data": callback_data}
+        return False
+    
+    return check
@@ -4,6 +4,14 @@ Inline keyboards for match predictions.
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from .callbacks import (
+    PredictMatch, OtherScore, HomeGoals, Score, Resolution,
+    ViewMatch, ViewResult, AdminMatch
+)
+
+# Highest goal count on the one-tap score grid; other scores go through OtherScore
+SCORE_GRID_MAX_GOALS = 5
+
 def format_time_compact(time_str):
     """Format time for compact display in keyboards by removing year prefix."""
     if time_str.startswith("2025-"):
@@ -18,17 +26,34 @@ def get_matches_keyboard(matches):
         if not match.get("locked", False):
             formatted_time = format_time_compact(match['time'])
             button_text = f"{match['team1']} vs {match['team2']} - {formatted_time}"
-            kb.button(text=button_text, callback_data=f"match_{match_id}")
+            kb.button(text=button_text, callback_data=PredictMatch(match_id=match_id))
     
     return kb.adjust(1).as_markup()
 
+def get_score_grid_keyboard(match_id, max_goals=SCORE_GRID_MAX_GOALS):
+    """
+    Generate a grid of full-time scores, so a prediction takes a single tap.
+    
+    Rows are home goals and columns away goals, from 0 to max_goals. Higher
+    scores are entered one team at a time through the "Other score" button.
+    """
+    kb = InlineKeyboardBuilder()
+    
+    for home in range(max_goals + 1):
+        for away in range(max_goals + 1):
+            kb.button(text=f"{home}-{away}", callback_data=Score(match_id=match_id, home=home, away=away))
+    
+    kb.button(text="Other score", callback_data=OtherScore(match_id=match_id))
+    
+    return kb.adjust(*[max_goals + 1] * (max_goals + 1), 1).as_markup()
+
 def get_home_goals_keyboard(match_id):
     """Generate a keyboard for selecting home team goals."""
     kb = InlineKeyboardBuilder()
     
     # Goals from 0 to 9
     for i in range(10):
-        kb.button(text=str(i), callback_data=f"home_{match_id}_{i}")
+        kb.button(text=str(i), callback_data=HomeGoals(match_id=match_id, home=i))
     
     return kb.adjust(5).as_markup()
 
@@ -38,42 +63,45 @@ def get_away_goals_keyboard(match_id, home_goals):
     
     # Goals from 0 to 9
     for i in range(10):
-        kb.button(text=str(i), callback_data=f"away_{match_id}_{home_goals}_{i}")
+        kb.button(text=str(i), callback_data=Score(match_id=match_id, home=home_goals, away=i))
     
     return kb.adjust(5).as_markup()
 
-def get_resolution_type_keyboard(match_id, home_goals, away_goals):
+def get_resolution_type_keyboard(match_id, home_goals, away_goals, match=None):
     """Generate a keyboard for selecting resolution type (knockout matches only)."""
     kb = InlineKeyboardBuilder()
     
     # If it's a tie, show resolution types with team options
     if int(home_goals) == int(away_goals):
         # Get the match data to show team names
-        from club_world_cup_bot.services.prediction import get_matches
-        matches = get_matches()
-        match = matches.get(match_id, {})
-        team1 = match.get('team1', 'Home')
-        team2 = match.get('team2', 'Away')
+        if match is None:
+            from club_world_cup_bot.services.prediction import get_match_models
+            match = get_match_models().get(match_id)
+        team1 = match.team1 if match else 'Home'
+        team2 = match.team2 if match else 'Away'
         
         # Offer ET or PEN with team selection
         resolution_teams = [
-            (f"{team1} wins in ET", "ET_1"),
-            (f"{team2} wins in ET", "ET_2"),
-            (f"{team1} wins in PEN", "PEN_1"),
-            (f"{team2} wins in PEN", "PEN_2"),
+            (f"{team1} wins in ET", "ET", 1),
+            (f"{team2} wins in ET", "ET", 2),
+            (f"{team1} wins in PEN", "PEN", 1),
+            (f"{team2} wins in PEN", "PEN", 2),
         ]
         
-        for text, value in resolution_teams:
+        for text, resolution, winner in resolution_teams:
             kb.button(
                 text=text, 
-                callback_data=f"resolution_{match_id}_{home_goals}_{away_goals}_{value}"
+                callback_data=Resolution(
+                    match_id=match_id, home=home_goals, away=away_goals,
+                    resolution=resolution, winner=winner
+                )
             )
     else:
         # If not a tie, just set as FT automatically in the handler
         # This is a placeholder as we'll handle non-ties differently
         kb.button(
             text="Confirm", 
-            callback_data=f"resolution_{match_id}_{home_goals}_{away_goals}_FT"
+            callback_data=Resolution(match_id=match_id, home=home_goals, away=away_goals, resolution="FT")
         )
     
     return kb.adjust(1).as_markup()
@@ -87,6 +115,8 @@ def get_admin_keyboard():
         ("Set Result", "admin_setresult"),
         ("Update Leaderboard", "admin_updateleaderboard"),
         ("Export CSV", "admin_exportcsv"),
+        ("Export Data", "admin_exportdata"),
+        ("Export Changes", "admin_exportchanges"),
         ("Whitelist User", "admin_whitelist")
     ]
     
@@ -99,12 +129,13 @@ def get_match_list_keyboard(matches, is_admin=False):
     """Generate a keyboard with all matches (for viewing or admin actions)."""
     kb = InlineKeyboardBuilder()
     
+    factory = AdminMatch if is_admin else ViewMatch
+    
     for match_id, match in matches.items():
-        prefix = "adminmatch_" if is_admin else "viewmatch_"
         status = "🏁" if "result" in match else "⏳"
         formatted_time = format_time_compact(match['time'])
         button_text = f"{status} {match['team1']} vs {match['team2']} - {formatted_time}"
-        kb.button(text=button_text, callback_data=f"{prefix}{match_id}")
+        kb.button(text=button_text, callback_data=factory(match_id=match_id))
     
     return kb.adjust(1).as_markup()
 
@@ -113,8 +144,8 @@ def get_enhanced_matches_keyboard(matches, user_predictions=None):
     Generate an enhanced keyboard showing matches with prediction status and results.
     
     Args:
-        matches (dict): Dictionary of matches
-        user_predictions (dict, optional): Dictionary of user predictions
+        matches (dict): Match models keyed by match ID
+        user_predictions (dict, optional): Prediction models keyed by match ID
         
     Returns:
         InlineKeyboardMarkup: Keyboard markup
@@ -124,64 +155,51 @@ def get_enhanced_matches_keyboard(matches, user_predictions=None):
     
     for match_id, match in matches.items():
         # Determine match status
-        is_locked = match.get("locked", False)
-        has_result = "result" in match
         has_prediction = match_id in user_predictions
         
         # Choose appropriate emoji based on status
-        if has_result:
+        if match.has_result:
             # Completed match
             emoji = "🏁 "
-            callback = f"viewresult_{match_id}"
-        elif is_locked:
+            callback = ViewResult(match_id=match_id)
+        elif match.locked:
             # Locked but no result yet
             emoji = "🔒 "
-            callback = f"viewmatch_{match_id}"
+            callback = ViewMatch(match_id=match_id)
         elif has_prediction:
             # User has predicted this match
             emoji = "✅ "
-            callback = f"match_{match_id}"
+            callback = PredictMatch(match_id=match_id)
         else:
             # Open for prediction
             emoji = "⏳ "
-            callback = f"match_{match_id}"
+            callback = PredictMatch(match_id=match_id)
         
         # Format time to be more readable (compact for keyboards)
-        match_time = format_time_compact(match['time'])
+        match_time = format_time_compact(match.time)
         
         # Create button text with prediction info if available
-        button_text = f"{emoji}{match['team1']} vs {match['team2']} - {match_time}"
+        button_text = f"{emoji}{match.team1} vs {match.team2} - {match_time}"
         
         # Add prediction info if user has predicted
         if has_prediction:
-            try:
-                pred = user_predictions[match_id]
-                pred_text = f"{pred.get('home_goals', '?')}-{pred.get('away_goals', '?')}"
-                
-                if match.get("is_knockout", False):
-                    # For knockout matches, add resolution type
-                    home_goals = pred.get('home_goals', 0)
-                    away_goals = pred.get('away_goals', 0)
+            pred = user_predictions[match_id]
+            pred_text = f"{pred.home_goals}-{pred.away_goals}"
+            
+            if match.is_knockout:
+                # For knockout matches, add resolution type
+                if pred.is_draw:
+                    # For ties, display winner with resolution type
+                    res_short = {"ET": "ET", "PEN": "P"}
                     
-                    if int(home_goals) == int(away_goals):
-                        # For ties, display winner with resolution type
-                        res_type = pred.get('resolution_type', '')
-                        winner_id = pred.get('knockout_winner', '')
-                        
-                        if winner_id and res_type:
-                            winner_name = match['team1'][:3] if winner_id == '1' else match['team2'][:3]
-                            res_short = {"ET": "ET", "PEN": "P"}
-                            if res_type in res_short:
-                                pred_text += f" ({winner_name} {res_short.get(res_type)})"
-                    else:
-                        # For non-ties, display FT
-                        pred_text += " (FT)"
-                
-                button_text += f" [{pred_text}]"
-            except (KeyError, ValueError, TypeError) as e:
-                # If there's an issue with prediction data, just show the basic button
-                print(f"Warning: Issue with prediction data for match {match_id}: {e}")
-                pass
+                    if pred.knockout_winner and pred.resolution_type in res_short:
+                        winner_name = match.team1[:3] if pred.knockout_winner == '1' else match.team2[:3]
+                        pred_text += f" ({winner_name} {res_short[pred.resolution_type]})"
+                else:
+                    # For non-ties, display FT
+                    pred_text += " (FT)"
+            
+            button_text += f" [{pred_text}]"
         
         kb.button(text=button_text, callback_data=callback)
     
@@ -89,6 +89,9 @@ MATCH_LIST_HEADER = "📅 Upcoming Matches:"
 NO_UPCOMING_MATCHES = "There are no upcoming matches at the moment."
 MATCH_ADDED = "Match added successfully! ✅"
 RESULT_SET = "Match result set successfully! ✅"
+MATCH_REMINDER = """⏰ Reminder: {team1} vs {team2} kicks off at {time}.
+
+You haven't predicted this match yet. Tap ⚽ Matches to make your prediction before it locks!"""
 
 # Enhanced matches messages
 ENHANCED_MATCHES_HEADER = """⚽ All Matches:
@@ -112,16 +115,29 @@ ADMIN_PANEL = """
 ⚙️ Admin Panel
 
 Use the buttons below to manage the tournament:
-• Add Match
+• Add Match (or /importfixtures <league_id> <season>)
 • Set Result
 • Update Leaderboard
 • Export CSV
+• Export Data (columnar tables for analysis)
+• Export Changes (only what changed since the last export)
 • Whitelist User
 """
 
 ADMIN_ONLY = "This command is only available to admins."
 LEADERBOARD_UPDATED = "Leaderboard has been updated! ✅"
 CSV_EXPORTED = "CSV file has been exported! ✅"
+DATA_EXPORTED = "Data tables have been exported! ✅"
+CHANGES_EXPORTED = "Changes since the last export have been exported! ✅"
+FIXTURES_IMPORTED = """Fixtures imported! ✅
+
+➕ Added: {}
+✏️ Updated: {}
+✔️ Unchanged: {}
+⚠️ Skipped (invalid): {}"""
+IMPORT_FIXTURES_INVALID_FORMAT = "❌ Invalid format. Please use: /importfixtures <league_id> <season>"
+API_NOT_AVAILABLE = "❌ API-Football integration is not available. Set API_FOOTBALL_KEY to enable it."
+NO_EXPORT_CHANGES = "Nothing has changed since the last export. Use /exportchanges full for a full export."
 
 # Whitelisting messages
 USER_NOT_WHITELISTED = """
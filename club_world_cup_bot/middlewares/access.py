@@ -0,0 +1,28 @@
+"""
+Middleware that attaches the sender's access decision to handler data.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from club_world_cup_bot.services.access import AccessDecision, get_access_decision
+from club_world_cup_bot.firebase_helpers import run_db
+
+class AccessMiddleware(BaseMiddleware):
+    """Resolve the user's access once per update and expose it to handlers as `access`."""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        
+        if user is None:
+            data["access"] = AccessDecision()
+        else:
+            data["access"] = await run_db(get_access_decision, str(user.id), user.username)
+        
+        return await handler(event, data)
@@ -0,0 +1,24 @@
+"""
+Middleware that bounds how many updates are handled at the same time.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Let at most `limit` updates run their handlers concurrently; the rest wait their turn."""
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with self._semaphore:
+            return await handler(event, data)
@@ -0,0 +1,152 @@
+"""
+Typed domain models for the Club World Cup Bot.
+
+Records read from Firebase are validated and coerced once when they are loaded
+(see the get_*_models helpers in firebase_helpers), so the rest of the code can
+rely on plain attributes of the right type. The classes use __slots__ to keep
+large prediction sets compact in memory.
+"""
+from dataclasses import dataclass, fields
+from typing import Optional
+
+def _optional_str(value):
+    """Coerce a value to str, keeping None (and empty strings) as None."""
+    return str(value) if value not in (None, "") else None
+
+@dataclass(slots=True)
+class Scoreline:
+    """Goals after 90 minutes plus how a knockout match was decided."""
+    home_goals: int
+    away_goals: int
+    resolution_type: Optional[str] = None
+    knockout_winner: Optional[str] = None
+    
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build from a database record.
+        
+        Raises:
+            KeyError, TypeError, ValueError: If the goals are missing or not integers
+        """
+        return cls(
+            home_goals=int(data['home_goals']),
+            away_goals=int(data['away_goals']),
+            resolution_type=_optional_str(data.get('resolution_type')),
+            knockout_winner=_optional_str(data.get('knockout_winner'))
+        )
+    
+    @property
+    def is_draw(self):
+        """Whether the 90-minute score is a draw."""
+        return self.home_goals == self.away_goals
+    
+    @property
+    def winner(self):
+        """90-minute winner: 1 for home, 2 for away, 0 for a draw."""
+        return 1 if self.home_goals > self.away_goals else (2 if self.home_goals < self.away_goals else 0)
+    
+    def to_dict(self):
+        """Convert back to a database record, leaving out unset fields."""
+        return {field.name: getattr(self, field.name) for field in fields(self) if getattr(self, field.name) is not None}
+
+@dataclass(slots=True)
+class Result(Scoreline):
+    """Final result of a match."""
+
+@dataclass(slots=True)
+class Prediction(Scoreline):
+    """A user's prediction for a match."""
+
+@dataclass(slots=True)
+class Match:
+    """A match and, once played, its result."""
+    match_id: str
+    team1: str
+    team2: str
+    time: str
+    is_knockout: bool = False
+    locked: bool = False
+    result: Optional[Result] = None
+    api_fixture_id: Optional[int] = None
+    reminder_sent: bool = False
+    
+    @classmethod
+    def from_dict(cls, match_id, data):
+        """
+        Build from a database record.
+        
+        Raises:
+            KeyError, TypeError, ValueError: If required fields are missing or malformed
+        """
+        result = data.get('result')
+        
+        return cls(
+            match_id=str(match_id),
+            team1=str(data['team1']),
+            team2=str(data['team2']),
+            time=str(data['time']),
+            is_knockout=bool(data.get('is_knockout', False)),
+            locked=bool(data.get('locked', False)),
+            result=Result.from_dict(result) if isinstance(result, dict) else None,
+            api_fixture_id=data.get('api_fixture_id'),
+            reminder_sent=bool(data.get('reminder_sent', False))
+        )
+    
+    @property
+    def has_result(self):
+        """Whether the match has a final result."""
+        return self.result is not None
+    
+    def to_dict(self):
+        """Convert back to a database record, leaving out unset fields."""
+        data = {
+            'team1': self.team1,
+            'team2': self.team2,
+            'time': self.time,
+            'is_knockout': self.is_knockout,
+            'locked': self.locked
+        }
+        if self.result is not None:
+            data['result'] = self.result.to_dict()
+        if self.api_fixture_id is not None:
+            data['api_fixture_id'] = self.api_fixture_id
+        if self.reminder_sent:
+            data['reminder_sent'] = True
+        return data
+
+@dataclass(slots=True)
+class User:
+    """A registered Telegram user."""
+    user_id: str
+    username: Optional[str] = None
+    first_name: str = 'Unknown'
+    last_name: Optional[str] = None
+    is_admin: bool = False
+    whitelisted: bool = False
+    score: int = 0
+    registered_at: Optional[str] = None
+    
+    @classmethod
+    def from_dict(cls, user_id, data):
+        """
+        Build from a database record.
+        
+        Raises:
+            TypeError, ValueError: If the score is not a number
+        """
+        return cls(
+            user_id=str(user_id),
+            username=_optional_str(data.get('username')),
+            first_name=str(data.get('first_name') or 'Unknown'),
+            last_name=_optional_str(data.get('last_name')),
+            is_admin=bool(data.get('is_admin', False)),
+            whitelisted=bool(data.get('whitelisted', False)),
+            score=int(data.get('score', 0) or 0),
+            registered_at=_optional_str(data.get('registered_at'))
+        )
+    
+    @property
+    def has_access(self):
+        """Admins always have access, everyone else needs to be whitelisted."""
+        return self.is_admin or self.whitelisted
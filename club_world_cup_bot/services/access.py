@@ -0,0 +1,71 @@
+"""
+Service for deciding whether a user may use the bot, with a short-lived per-user cache.
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+from .prediction import is_admin, is_admin_by_username, is_whitelisted, is_whitelisted_by_username
+
+# How long an access decision is reused before it is checked against the database again
+ACCESS_CACHE_TTL_SECONDS = 60
+
+@dataclass(frozen=True)
+class AccessDecision:
+    """Access rights of a Telegram user."""
+    is_admin: bool = False
+    is_whitelisted: bool = False
+    
+    @property
+    def has_access(self):
+        """Admins always have access, everyone else needs to be whitelisted."""
+        return self.is_admin or self.is_whitelisted
+
+# user_id -> (expires_at, username, AccessDecision)
+_decisions = {}
+_lock = threading.Lock()
+
+def decide_access(user_id, username=None):
+    """Check a user's access rights against the database, bypassing the cache."""
+    admin = is_admin(user_id) or bool(username and is_admin_by_username(username))
+    whitelisted = admin or is_whitelisted(user_id) or bool(username and is_whitelisted_by_username(username))
+    return AccessDecision(is_admin=admin, is_whitelisted=whitelisted)
+
+def get_access_decision(user_id, username=None):
+    """Get a user's access rights, reusing a recent decision when available."""
+    user_id = str(user_id)
+    now = time.monotonic()
+    
+    with _lock:
+        entry = _decisions.get(user_id)
+        if entry and entry[0] > now and entry[1] == username:
+            return entry[2]
+    
+    decision = decide_access(user_id, username)
+    
+    with _lock:
+        _decisions[user_id] = (now + ACCESS_CACHE_TTL_SECONDS, username, decision)
+    
+    return decision
+
+def invalidate_access(user_id=None, username=None):
+    """
+    Forget cached decisions after a whitelist or admin change.
+    
+    Args:
+        user_id (str, optional): Drop the decision for this user ID
+        username (str, optional): Drop the decisions of every user with this username
+    
+    Without arguments, every cached decision is dropped.
+    """
+    with _lock:
+        if user_id is None and username is None:
+            _decisions.clear()
+            return
+        
+        if user_id is not None:
+            _decisions.pop(str(user_id), None)
+        
+        if username:
+            for cached_user_id in [key for key, entry in _decisions.items() if entry[1] == username]:
+                del _decisions[cached_user_id]
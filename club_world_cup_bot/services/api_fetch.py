@@ -1,16 +1,173 @@
 """
 Service for fetching match data from the API-Football API.
+
+Requests share one pooled HTTP session with bounded timeouts and jittered
+retries on 429/5xx responses. Successful responses are cached in memory (and
+on disk if API_FOOTBALL_CACHE_DIR is set) with a TTL per endpoint, so repeated
+lookups don't spend the API's request quota.
 """
+import hashlib
+import json
 import os
-import requests
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Most fixture IDs accepted by one /fixtures?ids= request
+MAX_FIXTURE_IDS_PER_REQUEST = 20
+
+# Fixture statuses of finished matches, mapped to our resolution types
+FINISHED_STATUSES = {"FT": "FT", "AET": "ET", "PEN": "PEN"}
+
+# (connect, read) timeouts in seconds for every request
+API_TIMEOUT = (5, 20)
+
+# Retries for failed connections and 429/5xx responses, with jittered exponential backoff.
+# A Retry-After header sent by the API takes precedence.
+API_RETRIES = 3
+API_RETRY_BACKOFF = 0.5
+API_RETRY_JITTER = 0.5
+API_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Connections kept open to the API host
+API_POOL_SIZE = 4
+
+# How long responses are cached, per endpoint
+API_CACHE_TTLS = {
+    "teams": 7 * 24 * 3600,
+    "fixtures": 60 * 60
+}
+
+# Single fixtures are looked up to follow live results, so they expire quickly
+LIVE_FIXTURE_CACHE_TTL = 60
+
+# Maximum number of responses kept in memory
+API_CACHE_MAX_ENTRIES = 256
+
+# Directory for the on-disk response cache (disabled when unset)
+API_CACHE_DIR = os.environ.get("API_FOOTBALL_CACHE_DIR")
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Get the shared HTTP session, creating its connection pool on first use."""
+    global _session
+    
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=API_RETRIES,
+                backoff_factor=API_RETRY_BACKOFF,
+                backoff_jitter=API_RETRY_JITTER,
+                status_forcelist=API_RETRY_STATUSES,
+                allowed_methods=frozenset(["GET"]),
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+            
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        
+        return _session
+
+def cache_ttl(path, params):
+    """Cache TTL in seconds for a request, or 0 if it should not be cached."""
+    if path == "fixtures" and ("id" in params or "ids" in params):
+        return LIVE_FIXTURE_CACHE_TTL
+    return API_CACHE_TTLS.get(path, 0)
+
+class ResponseCache:
+    """Thread-safe TTL cache of decoded API responses, optionally persisted to a directory."""
+    
+    def __init__(self, directory=None, max_entries=API_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    
+    def _file(self, key):
+        """Path of the on-disk entry for key."""
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+    
+    def get(self, key):
+        """Return the cached data for key, or None if absent or expired."""
+        now = time.time()
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+        
+        if not self.directory:
+            return None
+        
+        try:
+            with open(self._file(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        if entry.get("expires", 0) < now:
+            return None
+        
+        self._store(key, entry["expires"], entry["data"])
+        return entry["data"]
+    
+    def _store(self, key, expires, data):
+        """Keep an entry in memory, evicting the least recently used ones."""
+        with self._lock:
+            self._entries[key] = (expires, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def set(self, key, data, ttl):
+        """Cache data under key for ttl seconds."""
+        expires = time.time() + ttl
+        self._store(key, expires, data)
+        
+        if not self.directory:
+            return
+        
+        try:
+            # Write then rename, so readers never see a partial file
+            path = self._file(key)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"key": key, "expires": expires, "data": data}, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Error writing API cache entry: {e}")
+    
+    def clear(self):
+        """Drop the in-memory entries."""
+        with self._lock:
+            self._entries.clear()
+
+_response_cache = ResponseCache(API_CACHE_DIR)
 
 class APIFootballClient:
     """Client for interacting with the API-Football API."""
     
-    BASE_URL = "https://api-football-v1.p.rapidapi.com/v3"
+    # Can be pointed at a local stand-in server for testing
+    BASE_URL = os.environ.get("API_FOOTBALL_BASE_URL", "https://api-football-v1.p.rapidapi.com/v3")
     
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, cache=None):
         """Initialize the API client."""
         self.api_key = api_key or os.environ.get("API_FOOTBALL_KEY")
         if not self.api_key:
@@ -20,34 +177,109 @@ class APIFootballClient:
             "X-RapidAPI-Key": self.api_key,
             "X-RapidAPI-Host": "api-football-v1.p.rapidapi.com"
         }
+        self.session = get_session()
+        self.cache = cache or _response_cache
+        
+        # Daily quota, as reported by the last response (None until known)
+        self.requests_limit = None
+        self.requests_remaining = None
+    
+    def _record_quota(self, response):
+        """Remember the daily request quota reported in the response headers."""
+        for header, attribute in (
+            ("x-ratelimit-requests-limit", "requests_limit"),
+            ("x-ratelimit-requests-remaining", "requests_remaining")
+        ):
+            value = response.headers.get(header)
+            if value is not None and value.isdigit():
+                setattr(self, attribute, int(value))
+    
+    def _get(self, path, params):
+        """
+        GET an endpoint and return the decoded JSON, serving it from the cache when fresh.
+        
+        Returns:
+            dict: Response body, or None if the request failed
+        """
+        key = f"{path}?{urlencode(sorted(params.items()))}"
+        ttl = cache_ttl(path, params)
+        
+        if ttl:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        try:
+            response = self.session.get(f"{self.BASE_URL}/{path}", headers=self.headers, params=params, timeout=API_TIMEOUT)
+        except requests.RequestException as e:
+            print(f"Error requesting {path}: {e}")
+            return None
+        
+        self._record_quota(response)
+        
+        if response.status_code != 200:
+            print(f"Error requesting {path}: HTTP {response.status_code}")
+            return None
+        
+        try:
+            data = response.json()
+        except ValueError as e:
+            print(f"Error requesting {path}: invalid JSON ({e})")
+            return None
+        
+        if not isinstance(data, dict):
+            print(f"Error requesting {path}: unexpected response {data!r:.100}")
+            return None
+        
+        # API-Football reports problems such as an exhausted quota in "errors" with a 200 status
+        if data.get("errors"):
+            print(f"Error requesting {path}: {data['errors']}")
+            return None
+        
+        if ttl:
+            self.cache.set(key, data, ttl)
+        return data
     
     def fetch_matches(self, league_id, season):
         """Fetch matches for a specific league and season."""
-        url = f"{self.BASE_URL}/fixtures"
-        
         params = {
             "league": league_id,
             "season": season
         }
         
-        response = requests.get(url, headers=self.headers, params=params)
+        data = self._get("fixtures", params)
         
-        if response.status_code == 200:
-            data = response.json()
+        if data is not None:
+            return data["response"]
+        
+        return None
+    
+    def fetch_fixtures(self, fixture_ids):
+        """
+        Fetch several fixtures in one request.
+        
+        Args:
+            fixture_ids (list): Up to MAX_FIXTURE_IDS_PER_REQUEST fixture IDs
+        
+        Returns:
+            list: Fixtures, or None if the request failed
+        """
+        params = {"ids": "-".join(str(fixture_id) for fixture_id in fixture_ids)}
+        
+        data = self._get("fixtures", params)
+        
+        if data is not None:
             return data["response"]
         
         return None
     
     def fetch_match_result(self, fixture_id):
         """Fetch result for a specific match."""
-        url = f"{self.BASE_URL}/fixtures"
-        
         params = {"id": fixture_id}
         
-        response = requests.get(url, headers=self.headers, params=params)
+        data = self._get("fixtures", params)
         
-        if response.status_code == 200:
-            data = response.json()
+        if data is not None:
             if data["results"] > 0:
                 return data["response"][0]
         
@@ -55,14 +287,11 @@ class APIFootballClient:
     
     def search_teams(self, name):
         """Search for teams by name."""
-        url = f"{self.BASE_URL}/teams"
-        
         params = {"search": name}
         
-        response = requests.get(url, headers=self.headers, params=params)
+        data = self._get("teams", params)
         
-        if response.status_code == 200:
-            data = response.json()
+        if data is not None:
             return data["response"]
         
         return None
@@ -94,18 +323,18 @@ def format_match_data(api_data):
         }
         
         # Check if match has results
-        if api_data["fixture"]["status"]["short"] in ["FT", "AET", "PEN"]:
-            # Extract goals
-            home_goals = api_data["goals"]["home"]
-            away_goals = api_data["goals"]["away"]
+        status = api_data["fixture"]["status"]["short"]
+        if status in FINISHED_STATUSES:
+            # Predictions are scored on the 90-minute score; "goals" includes extra time
+            fulltime = (api_data.get("score") or {}).get("fulltime") or {}
+            home_goals = fulltime.get("home")
+            away_goals = fulltime.get("away")
+            if home_goals is None or away_goals is None:
+                home_goals = api_data["goals"]["home"]
+                away_goals = api_data["goals"]["away"]
             
-            # Extract resolution type
-            status = api_data["fixture"]["status"]["short"]
-            resolution_type = "FT"
-            if status == "AET":
-                resolution_type = "ET"
-            elif status == "PEN":
-                resolution_type = "PEN"
+            if home_goals is None or away_goals is None:
+                raise ValueError(f"finished fixture {api_data['fixture']['id']} has no score")
             
             # Add result
             match_data["result"] = {
@@ -114,7 +343,13 @@ def format_match_data(api_data):
             }
             
             if is_knockout:
-                match_data["result"]["resolution_type"] = resolution_type
+                match_data["result"]["resolution_type"] = FINISHED_STATUSES[status]
+                
+                # Team that went through, '1' for home and '2' for away
+                if api_data["teams"]["home"].get("winner"):
+                    match_data["result"]["knockout_winner"] = "1"
+                elif api_data["teams"]["away"].get("winner"):
+                    match_data["result"]["knockout_winner"] = "2"
             
             match_data["locked"] = True
         
@@ -0,0 +1,134 @@
+"""
+Service for sending the same kind of message to many users without hitting Telegram's flood limits.
+
+Messages go through an async queue drained by a few workers. A shared rate
+limiter keeps sends under Telegram's global limit (about 30 messages per
+second) and at most one message per second per chat. When Telegram answers
+with RetryAfter, every worker pauses for the requested time before retrying.
+"""
+import asyncio
+import logging
+
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest,
+    TelegramNetworkError, TelegramServerError
+)
+
+# Messages per second across all chats (Telegram allows about 30)
+BROADCAST_MESSAGES_PER_SECOND = 25
+
+# Minimum seconds between two messages to the same chat
+BROADCAST_PER_CHAT_INTERVAL = 1.0
+
+# Concurrent senders draining the queue
+BROADCAST_WORKERS = 8
+
+# Attempts per message for network and server errors
+BROADCAST_MAX_ATTEMPTS = 3
+
+class RateLimiter:
+    """Hands out send slots that respect a global rate and a per-chat interval."""
+    
+    def __init__(self, per_second=BROADCAST_MESSAGES_PER_SECOND, per_chat_interval=BROADCAST_PER_CHAT_INTERVAL):
+        self.interval = 1 / per_second
+        self.per_chat_interval = per_chat_interval
+        self._next_slot = 0.0
+        self._chat_slots = {}    # chat_id -> earliest time of the next send to the chat
+        self._lock = asyncio.Lock()
+    
+    async def wait(self, chat_id):
+        """Sleep until a message may be sent to chat_id."""
+        loop = asyncio.get_running_loop()
+        
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_slot, self._chat_slots.get(chat_id, 0.0))
+            self._next_slot = slot + self.interval
+            self._chat_slots[chat_id] = slot + self.per_chat_interval
+            
+            # Forget chats whose interval has passed
+            if len(self._chat_slots) > 10000:
+                self._chat_slots = {chat: until for chat, until in self._chat_slots.items() if until > now}
+        
+        await asyncio.sleep(slot - now)
+    
+    def pause(self, seconds):
+        """Hold back every send for the given number of seconds (flood control)."""
+        resume = asyncio.get_running_loop().time() + seconds
+        self._next_slot = max(self._next_slot, resume)
+
+# Shared by every broadcast so concurrent ones stay under the global limit together
+rate_limiter = RateLimiter()
+
+async def _send(bot, chat_id, text, reply_markup=None):
+    """
+    Send one message, retrying on flood control and transient errors.
+    
+    Returns:
+        bool: True if the message was delivered
+    """
+    attempts = 0
+    
+    while True:
+        await rate_limiter.wait(chat_id)
+        
+        try:
+            await bot.send_message(chat_id, text, reply_markup=reply_markup)
+            return True
+        except TelegramRetryAfter as e:
+            # Doesn't count as an attempt; Telegram tells us exactly when to retry
+            logging.warning(f"Flood control hit, pausing broadcast for {e.retry_after}s")
+            rate_limiter.pause(e.retry_after)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Blocked the bot, deleted account or chat not found: retrying won't help
+            logging.info(f"Not delivering to {chat_id}: {e}")
+            return False
+        except (TelegramNetworkError, TelegramServerError) as e:
+            attempts += 1
+            if attempts >= BROADCAST_MAX_ATTEMPTS:
+                logging.error(f"Giving up on {chat_id} after {attempts} attempts: {e}")
+                return False
+            await asyncio.sleep(2 ** attempts)
+
+async def broadcast(bot, messages, on_delivered=None, workers=BROADCAST_WORKERS):
+    """
+    Send messages through a rate-limited queue and wait until all are handled.
+    
+    Args:
+        bot: Bot used to send the messages
+        messages (iterable): (chat_id, text) or (chat_id, text, reply_markup) tuples
+        on_delivered (coroutine function, optional): Awaited with each chat_id that received its message
+        workers (int): Number of concurrent senders
+    
+    Returns:
+        tuple: (delivered chat IDs, failed chat IDs)
+    """
+    queue = asyncio.Queue()
+    for message in messages:
+        queue.put_nowait(message)
+    
+    delivered = []
+    failed = []
+    
+    async def worker():
+        while True:
+            try:
+                chat_id, text, *rest = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            
+            try:
+                if await _send(bot, chat_id, text, *rest):
+                    delivered.append(chat_id)
+                    if on_delivered:
+                        await on_delivered(chat_id)
+                else:
+                    failed.append(chat_id)
+            except Exception as e:
+                logging.error(f"Error broadcasting to {chat_id}: {e}")
+                failed.append(chat_id)
+            finally:
+                queue.task_done()
+    
+    await asyncio.gather(*(worker() for _ in range(min(workers, queue.qsize()))))
+    return delivered, failed
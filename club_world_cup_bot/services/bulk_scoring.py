@@ -0,0 +1,294 @@
+"""
+Vectorized scoring engine for recomputing every user's score in one pass.
+
+Predictions are packed into parallel NumPy arrays (goals, resolution codes,
+knockout winner codes, user and match indices) and scored against the match
+results by gathering from the same score tables as scoring.calculate_score.
+If NumPy is not installed, compute_user_totals falls back to calculate_score.
+"""
+# Optional NumPy acceleration
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except (ImportError, ModuleNotFoundError):
+    NUMPY_AVAILABLE = False
+
+# Codes for resolution types and knockout winners; 0 means "not set".
+# These also index the knockout bonus table in scoring.
+RESOLUTION_CODES = {"FT": 1, "ET": 2, "PEN": 3}
+KNOCKOUT_WINNER_CODES = {"1": 1, "2": 2}
+
+def _encode(codes, value):
+    """Encode a string value, assigning a fresh code to values outside the table."""
+    if value is None:
+        return 0
+    
+    value = str(value)
+    if value not in codes:
+        codes[value] = len(codes) + 1
+    return codes[value]
+
+class PackedPredictions:
+    """Predictions and match results packed into parallel NumPy arrays."""
+    
+    def __init__(self, user_ids, match_ids, predictions, matches, resolution_codes=None, knockout_winner_codes=None):
+        # Prediction columns (one row per prediction)
+        self.user_ids = user_ids
+        self.match_ids = match_ids
+        self.home_goals = predictions["home_goals"]
+        self.away_goals = predictions["away_goals"]
+        self.resolution = predictions["resolution"]
+        self.knockout_winner = predictions["knockout_winner"]
+        self.user_index = predictions["user_index"]
+        self.match_index = predictions["match_index"]
+        
+        # Match columns (one row per match)
+        self.is_knockout = matches["is_knockout"]
+        self.has_result = matches["has_result"]
+        self.result_home_goals = matches["home_goals"]
+        self.result_away_goals = matches["away_goals"]
+        self.result_resolution = matches["resolution"]
+        self.result_knockout_winner = matches["knockout_winner"]
+        
+        # Code tables used for the resolution and knockout winner columns
+        self.resolution_codes = resolution_codes or dict(RESOLUTION_CODES)
+        self.knockout_winner_codes = knockout_winner_codes or dict(KNOCKOUT_WINNER_CODES)
+    
+    def __len__(self):
+        return len(self.home_goals)
+
+def pack_predictions(predictions, matches):
+    """
+    Pack nested prediction and match dictionaries into a PackedPredictions.
+    
+    Args:
+        predictions (dict): {user_id: {match_id: prediction}}
+        matches (dict): {match_id: match}
+    
+    Returns:
+        PackedPredictions: Arrays ready for score_packed
+    """
+    resolution_codes = dict(RESOLUTION_CODES)
+    winner_codes = dict(KNOCKOUT_WINNER_CODES)
+    
+    match_ids = list(matches.keys())
+    match_positions = {match_id: i for i, match_id in enumerate(match_ids)}
+    match_columns = {
+        "is_knockout": [], "has_result": [], "home_goals": [],
+        "away_goals": [], "resolution": [], "knockout_winner": []
+    }
+    
+    for match_id in match_ids:
+        match = matches[match_id] or {}
+        result = match.get("result")
+        has_result = isinstance(result, dict)
+        result = result if has_result else {}
+        
+        try:
+            home_goals = int(result.get("home_goals", 0))
+            away_goals = int(result.get("away_goals", 0))
+        except (TypeError, ValueError) as e:
+            print(f"Error packing result for match {match_id}: {e}")
+            has_result, home_goals, away_goals = False, 0, 0
+        
+        match_columns["is_knockout"].append(bool(match.get("is_knockout", False)))
+        match_columns["has_result"].append(has_result)
+        match_columns["home_goals"].append(home_goals)
+        match_columns["away_goals"].append(away_goals)
+        match_columns["resolution"].append(_encode(resolution_codes, result.get("resolution_type")))
+        match_columns["knockout_winner"].append(_encode(winner_codes, result.get("knockout_winner")))
+    
+    user_ids = []
+    prediction_columns = {
+        "home_goals": [], "away_goals": [], "resolution": [],
+        "knockout_winner": [], "user_index": [], "match_index": []
+    }
+    
+    for user_id, user_predictions in predictions.items():
+        if not isinstance(user_predictions, dict):
+            continue
+        
+        user_index = len(user_ids)
+        user_ids.append(user_id)
+        
+        for match_id, prediction in user_predictions.items():
+            match_index = match_positions.get(match_id)
+            if match_index is None or not isinstance(prediction, dict):
+                continue
+            
+            try:
+                home_goals = int(prediction["home_goals"])
+                away_goals = int(prediction["away_goals"])
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Error packing prediction for user {user_id}, match {match_id}: {e}")
+                continue
+            
+            prediction_columns["home_goals"].append(home_goals)
+            prediction_columns["away_goals"].append(away_goals)
+            prediction_columns["resolution"].append(_encode(resolution_codes, prediction.get("resolution_type")))
+            prediction_columns["knockout_winner"].append(_encode(winner_codes, prediction.get("knockout_winner")))
+            prediction_columns["user_index"].append(user_index)
+            prediction_columns["match_index"].append(match_index)
+    
+    packed_predictions = {
+        key: np.asarray(values, dtype=np.int32 if key.endswith("_index") else np.int16)
+        for key, values in prediction_columns.items()
+    }
+    packed_matches = {
+        key: np.asarray(values, dtype=bool if key in ("is_knockout", "has_result") else np.int16)
+        for key, values in match_columns.items()
+    }
+    
+    return PackedPredictions(
+        user_ids, match_ids, packed_predictions, packed_matches,
+        resolution_codes=resolution_codes, knockout_winner_codes=winner_codes
+    )
+
+def _winner(home_goals, away_goals):
+    """Winner code per row: 1 for home, 2 for away, 0 for a draw."""
+    return (home_goals > away_goals).astype(np.int16) + np.int16(2) * (home_goals < away_goals)
+
+def score_packed(packed, rules=None):
+    """
+    Score every packed prediction in one vectorized pass.
+    
+    Points are gathered from the precomputed score tables; rows outside the
+    tables (10+ goals, unknown resolution types) are scored by formula.
+    Predictions for matches without a result score 0.
+    
+    Returns:
+        numpy.ndarray: Points per prediction, aligned with the packed rows
+    """
+    from .scoring import SCORE_TABLE_GOALS, KNOCKOUT_CODES, knockout_code, build_score_tables, get_score_tables
+    
+    tables = get_score_tables() if rules is None else build_score_tables(rules)
+    base_table = np.asarray(tables.base, dtype=np.int16)
+    knockout_table = np.asarray(tables.knockout, dtype=np.int16)
+    goals = SCORE_TABLE_GOALS
+    match_index = packed.match_index
+    
+    # Result-side table offsets are computed once per match, then gathered per prediction
+    result_home = packed.result_home_goals
+    result_away = packed.result_away_goals
+    result_in_table = (
+        (result_home >= 0) & (result_home < goals) & (result_away >= 0) & (result_away < goals)
+        & (packed.result_resolution <= 3) & (packed.result_knockout_winner <= 2)
+    )
+    result_offset = (np.clip(result_home, 0, goals - 1) * goals + np.clip(result_away, 0, goals - 1)).astype(np.int32)
+    result_code = knockout_code(
+        _winner(result_home, result_away).astype(np.int32),
+        np.clip(packed.result_knockout_winner, 0, 2),
+        np.clip(packed.result_resolution, 0, 3)
+    )
+    # Group matches and knockout results without a resolution type use the all-zero code
+    result_code = np.where(packed.is_knockout & (packed.result_resolution > 0), result_code, KNOCKOUT_CODES)
+    
+    pred_home = packed.home_goals
+    pred_away = packed.away_goals
+    pred_in_table = (
+        (pred_home >= 0) & (pred_home < goals) & (pred_away >= 0) & (pred_away < goals)
+        & (packed.resolution <= 3) & (packed.knockout_winner <= 2)
+    )
+    pred_offset = (np.clip(pred_home, 0, goals - 1) * goals + np.clip(pred_away, 0, goals - 1)).astype(np.int32)
+    pred_code = knockout_code(
+        _winner(pred_home, pred_away).astype(np.int32),
+        np.clip(packed.knockout_winner, 0, 2),
+        np.clip(packed.resolution, 0, 3)
+    )
+    
+    points = (
+        base_table[pred_offset * (goals * goals) + result_offset[match_index]]
+        + knockout_table[pred_code * (KNOCKOUT_CODES + 1) + result_code[match_index]]
+    )
+    
+    in_table = pred_in_table & result_in_table[match_index]
+    if not in_table.all():
+        points = np.where(in_table, points, _score_packed_formula(packed, tables.rules))
+    
+    return points * packed.has_result[match_index]
+
+def _score_packed_formula(packed, rules):
+    """Score packed predictions by evaluating the rules, for rows outside the score tables."""
+    rules = {key: np.int16(value) for key, value in rules.items()}
+    match_index = packed.match_index
+    
+    # Result-side features are computed once per match, then gathered per prediction
+    result_winner = _winner(packed.result_home_goals, packed.result_away_goals)
+    final_result_winner = result_winner + (result_winner == 0) * packed.result_knockout_winner
+    knockout_result = packed.is_knockout & (packed.result_resolution > 0)
+    
+    result_home = packed.result_home_goals[match_index]
+    result_away = packed.result_away_goals[match_index]
+    
+    pred_home = packed.home_goals
+    pred_away = packed.away_goals
+    pred_winner = _winner(pred_home, pred_away)
+    
+    correct_winner = pred_winner == result_winner[match_index]
+    correct_diff = (pred_home - pred_away) == (result_home - result_away)
+    exact_score = (pred_home == result_home) & (pred_away == result_away)
+    
+    # A wrong winner rules out a correct goal difference or exact score,
+    # so group and knockout matches share the 90-minute part
+    points = (
+        rules["WRONG_PREDICTION"]
+        + correct_winner * (rules["CORRECT_WINNER"] - rules["WRONG_PREDICTION"])
+        + correct_diff * rules["CORRECT_GOAL_DIFF"]
+        + exact_score * rules["EXACT_SCORE"]
+    )
+    
+    # Knockout winner and resolution bonuses, only when both sides have a resolution type
+    pred_resolution = packed.resolution
+    knockout = knockout_result[match_index] & (pred_resolution > 0)
+    final_pred_winner = pred_winner + (pred_winner == 0) * packed.knockout_winner
+    
+    bonus = (
+        (final_pred_winner == final_result_winner[match_index]) * rules["CORRECT_KO_WINNER"]
+        + ((pred_resolution == packed.result_resolution[match_index]) & correct_winner) * rules["CORRECT_KO_RESOLUTION"]
+    )
+    return points + knockout * bonus
+
+def compute_user_totals(predictions, matches):
+    """
+    Compute each user's total score over every match with a result.
+    
+    Args:
+        predictions (dict): {user_id: {match_id: prediction}}
+        matches (dict): {match_id: match}
+    
+    Returns:
+        dict: {user_id: total_score} for every user in predictions
+    """
+    if not NUMPY_AVAILABLE:
+        return _compute_user_totals_python(predictions, matches)
+    
+    packed = pack_predictions(predictions, matches)
+    if not packed.user_ids:
+        return {}
+    
+    points = score_packed(packed)
+    totals = np.bincount(packed.user_index, weights=points, minlength=len(packed.user_ids))
+    
+    return {user_id: int(round(total)) for user_id, total in zip(packed.user_ids, totals)}
+
+def _compute_user_totals_python(predictions, matches):
+    """Fallback used when NumPy is not installed."""
+    from .scoring import calculate_score
+    
+    totals = {}
+    for user_id, user_predictions in predictions.items():
+        if not isinstance(user_predictions, dict):
+            continue
+        
+        total_score = 0
+        for match_id, prediction in user_predictions.items():
+            try:
+                if match_id in matches and 'result' in matches[match_id]:
+                    total_score += calculate_score(prediction, matches[match_id]['result'], matches[match_id])
+            except Exception as e:
+                print(f"Error calculating score for user {user_id}, match {match_id}: {e}")
+                continue
+        
+        totals[user_id] = total_score
+    
+    return totals
@@ -0,0 +1,162 @@
+"""
+Service for exporting normalized tables in a columnar format for analytics.
+
+Users, matches and predictions are exported as long-form tables with numeric
+columns, and every prediction carries the points it earned under the current
+scoring rules. The export is a zip of Parquet files (one per table) when
+pyarrow is installed, otherwise a compressed NumPy .npz archive whose keys
+are "<table>/<column>".
+"""
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+
+from ..firebase_helpers import get_all_users, get_all_matches, get_all_predictions
+from .bulk_scoring import NUMPY_AVAILABLE, pack_predictions, score_packed
+from .schedule import parse_kickoff
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+# Optional Parquet output
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except (ImportError, ModuleNotFoundError):
+    PYARROW_AVAILABLE = False
+
+def _strings(values):
+    """Build a NumPy unicode column (loadable from .npz without pickle)."""
+    return np.asarray([str(value) if value is not None else "" for value in values], dtype=np.str_)
+
+def _kickoff(match):
+    """Kickoff as UTC epoch seconds, or NaN if the match time is invalid."""
+    try:
+        return parse_kickoff(match['time'])
+    except (ValueError, KeyError, TypeError):
+        return float("nan")
+
+def _code_table(codes):
+    """Turn a {name: code} dictionary into a lookup table, including code 0."""
+    items = [(0, "")] + sorted((code, name) for name, code in codes.items())
+    return {
+        "code": np.asarray([code for code, _ in items], dtype=np.int16),
+        "name": _strings(name for _, name in items)
+    }
+
+def build_export_tables():
+    """
+    Build the users, matches and predictions tables as NumPy columns.
+    
+    Returns:
+        dict: {table_name: {column_name: numpy.ndarray}}
+    """
+    users = get_all_users()
+    matches = get_all_matches()
+    predictions = get_all_predictions()
+    
+    packed = pack_predictions(predictions, matches)
+    points = score_packed(packed)
+    
+    user_ids = list(users.keys())
+    users_table = {
+        "user_id": _strings(user_ids),
+        "username": _strings(users[user_id].get('username') for user_id in user_ids),
+        "first_name": _strings(users[user_id].get('first_name') for user_id in user_ids),
+        "last_name": _strings(users[user_id].get('last_name') for user_id in user_ids),
+        "score": np.asarray([users[user_id].get('score', 0) or 0 for user_id in user_ids], dtype=np.int32),
+        "is_admin": np.asarray([bool(users[user_id].get('is_admin', False)) for user_id in user_ids]),
+        "whitelisted": np.asarray([bool(users[user_id].get('whitelisted', False)) for user_id in user_ids])
+    }
+    
+    match_records = [matches[match_id] or {} for match_id in packed.match_ids]
+    matches_table = {
+        "match_id": _strings(packed.match_ids),
+        "team1": _strings(match.get('team1') for match in match_records),
+        "team2": _strings(match.get('team2') for match in match_records),
+        "kickoff_utc": np.asarray([_kickoff(match) for match in match_records], dtype=np.float64),
+        "is_knockout": packed.is_knockout,
+        "locked": np.asarray([bool(match.get('locked', False)) for match in match_records]),
+        "has_result": packed.has_result,
+        "result_home_goals": packed.result_home_goals,
+        "result_away_goals": packed.result_away_goals,
+        "result_resolution": packed.result_resolution,
+        "result_knockout_winner": packed.result_knockout_winner
+    }
+    
+    predictions_table = {
+        "user_id": _strings(packed.user_ids)[packed.user_index],
+        "match_id": _strings(packed.match_ids)[packed.match_index],
+        "home_goals": packed.home_goals,
+        "away_goals": packed.away_goals,
+        "resolution": packed.resolution,
+        "knockout_winner": packed.knockout_winner,
+        "points": points.astype(np.int16)
+    }
+    
+    return {
+        "users": users_table,
+        "matches": matches_table,
+        "predictions": predictions_table,
+        "resolution_codes": _code_table(packed.resolution_codes),
+        "knockout_winner_codes": _code_table(packed.knockout_winner_codes)
+    }
+
+def _write_parquet(path, tables):
+    """Write each table as a Parquet file inside a zip archive."""
+    # Parquet pages are already compressed
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, columns in tables.items():
+            with archive.open(f"{name}.parquet", "w") as output:
+                pq.write_table(pa.table(columns), output)
+
+def _write_npz(path, tables):
+    """Write every column into one compressed .npz archive."""
+    with open(path, "wb") as output:
+        np.savez_compressed(output, **{
+            f"{name}/{column}": values
+            for name, columns in tables.items()
+            for column, values in columns.items()
+        })
+
+def export_columnar_file(file_format=None):
+    """
+    Export users, matches and scored predictions to a temporary columnar file.
+    
+    Args:
+        file_format (str, optional): "parquet" or "npz"; defaults to Parquet when pyarrow is installed
+    
+    Returns:
+        tuple: (path, filename). The caller must delete the file at path when done.
+    
+    Raises:
+        RuntimeError: If NumPy (or pyarrow for Parquet) is not installed
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("NumPy is required for columnar exports")
+    
+    file_format = file_format or ("parquet" if PYARROW_AVAILABLE else "npz")
+    if file_format == "parquet" and not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is required for Parquet exports")
+    
+    suffix = ".parquet.zip" if file_format == "parquet" else ".npz"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"cwc_data_{timestamp}{suffix}"
+    
+    tables = build_export_tables()
+    
+    handle, path = tempfile.mkstemp(prefix="cwc_export_", suffix=suffix)
+    os.close(handle)
+    
+    try:
+        if file_format == "parquet":
+            _write_parquet(path, tables)
+        else:
+            _write_npz(path, tables)
+    except Exception:
+        os.remove(path)
+        raise
+    
+    return path, filename
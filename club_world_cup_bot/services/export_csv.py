@@ -1,72 +1,121 @@
 """
 Service for exporting data to CSV format using Firebase Realtime Database.
+
+Rows are produced by a generator and written straight to a temporary file, so
+the export never holds the CSV text in memory. Predictions are read a page of
+users at a time, so memory grows with the number of users and matches, not
+with every user's predictions at once.
 """
 import csv
-import io
+import gzip
+import os
+import tempfile
 from datetime import datetime
 
 from ..firebase_helpers import (
-    get_all_users, get_all_matches, get_all_predictions
+    get_all_users, get_all_matches, iter_predictions_by_user
 )
 
+# Set EXPORT_CSV_GZIP=1 to send CSV exports gzip-compressed
+EXPORT_CSV_GZIP = os.getenv("EXPORT_CSV_GZIP", "0") == "1"
+
 def generate_export_filename():
     """Generate a filename for the export with timestamp."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     return f"cwc_predictions_{timestamp}.csv"
 
-def export_predictions_csv():
-    """Export all predictions and scores to a CSV file for immediate download."""
-    predictions = get_all_predictions()
-    matches = get_all_matches()
-    users = get_all_users()
+def _prediction_row(user_id, user_data, match_columns, user_predictions):
+    """Build the export row of one user."""
+    row = [
+        user_id,
+        user_data.get('username', ''),
+        f"{user_data.get('first_name', '')} {user_data.get('last_name', '')}".strip(),
+        user_data.get('score', 0)
+    ]
     
-    # Create a CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
+    # Add prediction for each match
+    for match_id in match_columns:
+        if match_id in user_predictions:
+            pred = user_predictions[match_id]
+            prediction_text = f"{pred['home_goals']}-{pred['away_goals']}"
+            
+            # Add resolution type for knockout matches
+            if 'resolution_type' in pred:
+                prediction_text += f" ({pred['resolution_type']})"
+            
+            row.append(prediction_text)
+        else:
+            row.append("")
     
-    # Write header row
+    return row
+
+def iter_prediction_rows(users, matches, user_predictions):
+    """
+    Yield the header and one row per user for the predictions export.
+    
+    Users with predictions come first, in the order of user_predictions,
+    followed by the users without any.
+    
+    Args:
+        users (dict): {user_id: user}
+        matches (dict): {match_id: match}
+        user_predictions (iterable): (user_id, {match_id: prediction}) pairs,
+            e.g. from iter_predictions_by_user
+    """
     header = ["User ID", "Username", "Name", "Score"]
     
     # Add a column for each match
     match_columns = []
     for match_id, match in sorted(matches.items(), key=lambda x: x[0]):
         column_name = f"{match['team1']} vs {match['team2']}"
-        match_columns.append((match_id, column_name))
+        match_columns.append(match_id)
         header.append(column_name)
     
-    writer.writerow(header)
+    yield header
+    
+    exported = set()
+    for user_id, predictions in user_predictions:
+        if user_id in users and user_id not in exported:
+            exported.add(user_id)
+            yield _prediction_row(user_id, users[user_id], match_columns, predictions)
     
-    # Write data rows
     for user_id, user_data in users.items():
-        row = [
-            user_id,
-            user_data.get('username', ''),
-            f"{user_data.get('first_name', '')} {user_data.get('last_name', '')}".strip(),
-            user_data.get('score', 0)
-        ]
-        
-        # Add prediction for each match
-        user_predictions = predictions.get(user_id, {})
-        for match_id, _ in match_columns:
-            if match_id in user_predictions:
-                pred = user_predictions[match_id]
-                prediction_text = f"{pred['home_goals']}-{pred['away_goals']}"
-                
-                # Add resolution type for knockout matches
-                if 'resolution_type' in pred:
-                    prediction_text += f" ({pred['resolution_type']})"
-                
-                row.append(prediction_text)
-            else:
-                row.append("")
-        
+        if user_id not in exported:
+            yield _prediction_row(user_id, user_data, match_columns, {})
+
+def write_predictions_csv(output):
+    """Write the predictions export to a text file object, one row at a time."""
+    writer = csv.writer(output)
+    rows = iter_prediction_rows(get_all_users(), get_all_matches(), iter_predictions_by_user())
+    
+    for row in rows:
         writer.writerow(row)
+
+def export_predictions_csv_file(compress=None):
+    """
+    Export all predictions and scores to a temporary CSV file.
+    
+    Args:
+        compress (bool, optional): Gzip the file; defaults to EXPORT_CSV_GZIP
+    
+    Returns:
+        tuple: (path, filename). The caller must delete the file at path when done.
+    """
+    compress = EXPORT_CSV_GZIP if compress is None else compress
+    filename = generate_export_filename() + (".gz" if compress else "")
     
-    # Get CSV data and create filename
-    csv_data = output.getvalue()
-    output.close()
+    handle, path = tempfile.mkstemp(prefix="cwc_export_", suffix=".csv.gz" if compress else ".csv")
+    os.close(handle)
     
-    timestamp = datetime.now()
-    filename = f"cwc_predictions_{timestamp.strftime('%Y%m%d_%H%M%S')}.csv"
+    try:
+        if compress:
+            with gzip.open(path, "wt", encoding="utf-8", newline="") as output:
+                write_predictions_csv(output)
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as output:
+                write_predictions_csv(output)
+    except Exception:
+        os.remove(path)
+        raise
     
-    return csv_data, filename 
\ No newline at end of file
+    return path, filename
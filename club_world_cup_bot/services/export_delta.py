@@ -0,0 +1,213 @@
+"""
+Service for incremental exports of the predictions and results that changed.
+
+Every saved prediction and match carries a server-side updated_at (epoch
+milliseconds), and saved predictions are also logged in prediction_changes.
+Each export records a watermark in Firebase; the next export only reads the
+changes after it, so late in the tournament an export is proportional
+to what changed rather than to the whole history.
+
+Exports form a manifest chain: a full export followed by deltas. Replaying the
+files of the chain in order (later rows replace earlier ones, keyed by
+user_id/match_id) rebuilds the full state.
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+
+from ..firebase_helpers import (
+    get_all_matches, get_all_predictions, get_prediction_changes,
+    get_export_state, invalidate_path, update_multiple, WriteBatch
+)
+
+PREDICTION_COLUMNS = [
+    "user_id", "match_id", "home_goals", "away_goals",
+    "resolution_type", "knockout_winner", "updated_at"
+]
+
+MATCH_COLUMNS = [
+    "match_id", "team1", "team2", "time", "is_knockout", "locked",
+    "result_home_goals", "result_away_goals", "result_resolution_type",
+    "result_knockout_winner", "updated_at"
+]
+
+class ChangesExport:
+    """A changes export written to a temporary file, not yet recorded in Firebase."""
+    __slots__ = ("path", "filename", "entry")
+    
+    def __init__(self, path, filename, entry):
+        self.path = path
+        self.filename = filename
+        self.entry = entry      # manifest entry recorded by commit_changes_export
+
+def _updated_at(record):
+    """Server timestamp of a record, or None for records written before it was tracked."""
+    value = record.get('updated_at')
+    return value if isinstance(value, int) else None
+
+def _prediction_row(user_id, match_id, prediction):
+    """Build a predictions.csv row."""
+    return [
+        user_id, match_id,
+        prediction.get('home_goals'), prediction.get('away_goals'),
+        prediction.get('resolution_type', ''), prediction.get('knockout_winner', ''),
+        _updated_at(prediction) or ''
+    ]
+
+def _match_row(match_id, match):
+    """Build a matches.csv row."""
+    result = match.get('result') or {}
+    return [
+        match_id, match.get('team1', ''), match.get('team2', ''), match.get('time', ''),
+        bool(match.get('is_knockout', False)), bool(match.get('locked', False)),
+        result.get('home_goals', ''), result.get('away_goals', ''),
+        result.get('resolution_type', ''), result.get('knockout_winner', ''),
+        _updated_at(match) or ''
+    ]
+
+def collect_changes(since=None):
+    """
+    Collect the prediction and match rows changed after a watermark.
+    
+    Args:
+        since (int, optional): Watermark in epoch milliseconds; everything if None
+    
+    Returns:
+        tuple: (prediction_rows, match_rows, watermark), where watermark is the
+        newest updated_at seen (or since if nothing newer was found)
+    """
+    # Matches are read fresh, a stale snapshot could hide a result older than the new watermark
+    invalidate_path('matches')
+    matches = get_all_matches()
+    
+    timestamps = [since or 0]
+    prediction_rows = []
+    
+    if since is None:
+        for user_id, user_predictions in sorted(get_all_predictions().items()):
+            for match_id, prediction in sorted(user_predictions.items()):
+                if isinstance(prediction, dict):
+                    prediction_rows.append(_prediction_row(user_id, match_id, prediction))
+                    timestamps.append(_updated_at(prediction) or 0)
+    else:
+        changes = get_prediction_changes(since + 1)
+        for change in sorted(changes.values(), key=lambda change: change.get('updated_at', 0)):
+            prediction_rows.append(_prediction_row(change.get('user_id'), change.get('match_id'), change))
+            timestamps.append(_updated_at(change) or 0)
+    
+    match_rows = []
+    for match_id, match in sorted(matches.items()):
+        if not isinstance(match, dict):
+            continue
+        
+        updated_at = _updated_at(match)
+        if since is None or (updated_at is not None and updated_at > since):
+            match_rows.append(_match_row(match_id, match))
+            timestamps.append(updated_at or 0)
+    
+    return prediction_rows, match_rows, max(timestamps)
+
+def _csv_text(header, rows):
+    """Render a header and rows as CSV text."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return output.getvalue()
+
+def export_changes_file(full=False):
+    """
+    Export the predictions and results changed since the last export to a temporary zip.
+    
+    The zip holds predictions.csv, matches.csv and manifest.json, which lists the
+    files to replay, in order, to rebuild the full state. The watermark is not
+    moved until commit_changes_export is called, so a failed delivery can simply
+    be retried.
+    
+    Args:
+        full (bool): Export everything and start a new manifest chain
+    
+    Returns:
+        ChangesExport or None: None if nothing changed since the last export.
+        The caller must delete the file at its path when done.
+    """
+    state = get_export_state()
+    manifest = state.get('manifest') or {}
+    if isinstance(manifest, list):
+        manifest = {str(i): entry for i, entry in enumerate(manifest) if entry is not None}
+    
+    full = full or not manifest
+    since = None if full else state.get('watermark', 0)
+    
+    prediction_rows, match_rows, watermark = collect_changes(since)
+    if not full and not prediction_rows and not match_rows:
+        return None
+    
+    export_id = max((int(key) for key in manifest), default=0) + 1
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"cwc_{'full' if full else 'changes'}_{export_id:03d}_{timestamp}.zip"
+    
+    entry = {
+        'export_id': export_id,
+        'kind': 'full' if full else 'delta',
+        'since': since or 0,
+        'watermark': watermark,
+        'filename': filename,
+        'predictions': len(prediction_rows),
+        'matches': len(match_rows),
+        'created_at': datetime.now().isoformat()
+    }
+    
+    # A full export resets the manifest, so it always holds the current chain
+    chain = [] if full else [
+        manifest[key] for key in sorted(manifest, key=int)
+        if isinstance(manifest[key], dict)
+    ]
+    
+    handle, path = tempfile.mkstemp(prefix="cwc_export_", suffix=".zip")
+    os.close(handle)
+    
+    try:
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("predictions.csv", _csv_text(PREDICTION_COLUMNS, prediction_rows))
+            archive.writestr("matches.csv", _csv_text(MATCH_COLUMNS, match_rows))
+            archive.writestr("manifest.json", json.dumps({
+                'export': entry,
+                'chain': [previous['filename'] for previous in chain] + [filename]
+            }, indent=2))
+    except Exception:
+        os.remove(path)
+        raise
+    
+    return ChangesExport(path, filename, entry)
+
+def commit_changes_export(export):
+    """
+    Record a delivered export: move the watermark and append it to the manifest.
+    
+    Log entries up to the new watermark are included in this export, so they are pruned.
+    
+    Returns:
+        bool: True if the export state was saved
+    """
+    entry = export.entry
+    updates = {'exports/watermark': entry['watermark']}
+    
+    # A full export starts a new chain
+    if entry['kind'] == 'full':
+        updates['exports/manifest'] = {str(entry['export_id']): entry}
+    else:
+        updates[f"exports/manifest/{entry['export_id']}"] = entry
+    
+    if not update_multiple(updates):
+        return False
+    
+    with WriteBatch() as batch:
+        for key in get_prediction_changes(before=entry['watermark'] + 1):
+            batch.update(f"prediction_changes/{key}", None)
+    
+    return True
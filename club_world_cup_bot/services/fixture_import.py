@@ -0,0 +1,197 @@
+"""
+Service for importing a league's fixtures from API-Football in bulk.
+
+Fixtures are mapped with format_match_data and deduplicated on api_fixture_id
+through the fixture_index node ({api_fixture_id: match_id}), so only the
+matches the fixtures map to are read. New matches get IDs from one
+allocation, and all new and changed matches are written in a single
+multi-path update.
+"""
+import json
+from datetime import datetime, timezone
+
+from ..firebase_helpers import (
+    get_all_matches, get_match, get_fixture_index, allocate_match_ids,
+    SERVER_TIMESTAMP, WriteBatch
+)
+from .api_fetch import APIFootballClient, format_match_data
+from .lock_scheduler import reschedule_match_locks
+from .schedule import MATCH_TIME_FORMAT, format_kickoff
+
+# Match fields kept in sync with the API for matches that were already imported.
+# Results are left to set_match_result, which also applies the scores.
+SYNCED_FIELDS = ('team1', 'team2', 'time', 'is_knockout')
+
+def load_fixtures(path):
+    """
+    Load recorded fixtures from a JSON file, for importing without the API.
+    
+    Accepts either a raw API-Football /fixtures response or a list of fixtures.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    
+    return data["response"] if isinstance(data, dict) else data
+
+def map_fixture(fixture):
+    """
+    Map an API-Football fixture to a match record, or None if it is malformed.
+    
+    format_match_data gives kickoff times in UTC; they are converted to
+    MATCH_TIMEZONE, the timezone match times are stored in.
+    """
+    match = format_match_data(fixture)
+    if match is None:
+        return None
+    
+    kickoff = datetime.strptime(match['time'], MATCH_TIME_FORMAT).replace(tzinfo=timezone.utc)
+    match['time'] = format_kickoff(kickoff.timestamp())
+    return match
+
+def get_indexed_matches(fixtures, fixture_index):
+    """
+    Read the existing matches that fixtures map to in fixture_index, one match at a time.
+    
+    Returns:
+        dict: {match_id: match}, leaving out indexed matches that were deleted
+    """
+    matches = {}
+    for fixture in fixtures:
+        try:
+            match_id = fixture_index.get(str(fixture['fixture']['id']))
+        except (KeyError, TypeError):
+            # Malformed fixtures are counted as skipped by plan_fixture_import
+            continue
+        
+        if match_id is not None and str(match_id) not in matches:
+            match = get_match(match_id)
+            if match:
+                matches[str(match_id)] = match
+    
+    return matches
+
+def plan_fixture_import(fixtures, matches, fixture_index):
+    """
+    Work out which fixtures are new and which existing matches changed.
+    
+    Args:
+        fixtures (list): API-Football fixtures
+        matches (dict): Existing {match_id: match}, at least those fixture_index maps the fixtures to
+        fixture_index (dict): Existing {api_fixture_id: match_id}
+    
+    Returns:
+        dict: {
+            'new': [match, ...],
+            'changed': {match_id: {field: value}},
+            'index': {api_fixture_id: match_id} entries missing from fixture_index,
+            'unchanged': int,
+            'skipped': int
+        }
+    """
+    # Matches imported before the index existed are found by their api_fixture_id
+    known = {
+        str(match['api_fixture_id']): match_id
+        for match_id, match in matches.items()
+        if isinstance(match, dict) and match.get('api_fixture_id') is not None
+    }
+    missing_index = {fixture_id: match_id for fixture_id, match_id in known.items() if fixture_id not in fixture_index}
+    known.update({str(fixture_id): str(match_id) for fixture_id, match_id in fixture_index.items()})
+    
+    plan = {'new': [], 'changed': {}, 'index': missing_index, 'unchanged': 0, 'skipped': 0}
+    seen = set()
+    
+    for fixture in fixtures:
+        match = map_fixture(fixture)
+        if match is None:
+            plan['skipped'] += 1
+            continue
+        
+        fixture_id = str(match['api_fixture_id'])
+        if fixture_id in seen:
+            continue
+        seen.add(fixture_id)
+        
+        match_id = known.get(fixture_id)
+        existing = matches.get(match_id) if match_id is not None else None
+        
+        if not isinstance(existing, dict):
+            plan['new'].append(match)
+            continue
+        
+        changes = {field: match[field] for field in SYNCED_FIELDS if existing.get(field) != match[field]}
+        if changes:
+            plan['changed'][match_id] = changes
+        else:
+            plan['unchanged'] += 1
+    
+    return plan
+
+def import_fixtures(fixtures):
+    """
+    Import fixtures: add new matches and update changed ones in one batched write.
+    
+    Args:
+        fixtures (list): API-Football fixtures, e.g. from APIFootballClient.fetch_matches
+    
+    Returns:
+        dict: {'added': [match_id, ...], 'updated': [match_id, ...], 'unchanged': int,
+        'skipped': int, 'with_results': int}, or None if the write failed
+    """
+    fixture_index = get_fixture_index()
+    if fixture_index:
+        matches = get_indexed_matches(fixtures, fixture_index)
+    else:
+        # Matches imported before the index existed can only be found by reading
+        # them all; this import indexes them, so that only happens once
+        matches = get_all_matches()
+    
+    plan = plan_fixture_import(fixtures, matches, fixture_index)
+    
+    match_ids = allocate_match_ids(len(plan['new']))
+    if len(match_ids) != len(plan['new']):
+        return None
+    
+    batch = WriteBatch()
+    
+    for match_id, match in zip(match_ids, plan['new']):
+        batch.update(f"matches/{match_id}", {**match, 'updated_at': SERVER_TIMESTAMP})
+        batch.update(f"fixture_index/{match['api_fixture_id']}", match_id)
+    
+    for match_id, changes in plan['changed'].items():
+        for field, value in changes.items():
+            batch.update(f"matches/{match_id}/{field}", value)
+        batch.update(f"matches/{match_id}/updated_at", SERVER_TIMESTAMP)
+    
+    for fixture_id, match_id in plan['index'].items():
+        batch.update(f"fixture_index/{fixture_id}", match_id)
+    
+    if batch and not batch.flush():
+        return None
+    
+    if match_ids or plan['changed']:
+        # Kickoff times may have been added or moved
+        reschedule_match_locks()
+    
+    return {
+        'added': match_ids,
+        'updated': list(plan['changed']),
+        'unchanged': plan['unchanged'],
+        'skipped': plan['skipped'],
+        'with_results': sum(1 for match in plan['new'] if 'result' in match)
+    }
+
+def import_league_fixtures(league_id, season, client=None):
+    """
+    Fetch a league season's fixtures from API-Football and import them.
+    
+    Returns:
+        dict: See import_fixtures, or None if the fixtures could not be fetched or written
+    """
+    client = client or APIFootballClient()
+    fixtures = client.fetch_matches(league_id, season)
+    
+    if fixtures is None:
+        print(f"Error fetching fixtures for league {league_id}, season {season}")
+        return None
+    
+    return import_fixtures(fixtures)
@@ -0,0 +1,102 @@
+"""
+Service for electing the one worker that runs the scheduled jobs.
+
+When several bot workers run at once, every worker still handles updates, but
+jobs such as match locks, reminders and result polling must only run once.
+Workers compete for a lease stored in the leader node of Firebase:
+    
+    {"holder": "web.1", "expires": 1750000060}
+
+The lease is taken and renewed with a transaction, so two workers can never
+both hold it. A worker that stops renewing loses it when it expires, and
+another worker takes over on its next renewal.
+"""
+import functools
+import os
+import socket
+import threading
+import time
+
+from ..firebase_helpers import run_transaction
+
+# Name of this worker in the lease; Heroku sets DYNO (e.g. "web.1")
+WORKER_ID = os.environ.get("WORKER_ID") or os.environ.get("DYNO") or socket.gethostname()
+
+# How long a lease is valid without renewal
+LEADER_LEASE_SECONDS = 60
+
+# How often the lease is renewed (or a free one is claimed)
+LEADER_RENEW_SECONDS = 20
+
+# Stop acting as leader this long before the lease expires, to allow for clock skew
+LEADER_SAFETY_MARGIN_SECONDS = 10
+
+class LeaderLease:
+    """A renewable lease that at most one worker holds at a time."""
+    
+    def __init__(self, worker_id=WORKER_ID, lease_seconds=LEADER_LEASE_SECONDS, node="leader"):
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.node = node
+        self._lock = threading.Lock()
+        self._valid_until = 0.0     # local monotonic time the lease can be relied on until
+    
+    @property
+    def is_leader(self):
+        """True while this worker holds an unexpired lease."""
+        with self._lock:
+            return time.monotonic() < self._valid_until
+    
+    def renew(self, now=None):
+        """
+        Claim the lease if it is free or expired, or extend it if this worker holds it.
+        
+        Returns:
+            bool: True if this worker holds the lease
+        """
+        now = int(now or time.time())
+        started = time.monotonic()
+        
+        def claim(current):
+            if (
+                isinstance(current, dict)
+                and current.get('holder') != self.worker_id
+                and (current.get('expires') or 0) > now
+            ):
+                return current
+            return {'holder': self.worker_id, 'expires': now + self.lease_seconds}
+        
+        lease = run_transaction(self.node, claim)
+        held = isinstance(lease, dict) and lease.get('holder') == self.worker_id
+        with self._lock:
+            was_leader = time.monotonic() < self._valid_until
+            self._valid_until = (
+                started + self.lease_seconds - LEADER_SAFETY_MARGIN_SECONDS if held else 0.0
+            )
+        
+        if held != was_leader:
+            print(f"Worker {self.worker_id} {'is now' if held else 'is no longer'} the leader")
+        return held
+    
+    def release(self):
+        """Give the lease up (e.g. on shutdown) so another worker can take over right away."""
+        def give_up(current):
+            if isinstance(current, dict) and current.get('holder') == self.worker_id:
+                return None
+            return current
+        
+        with self._lock:
+            self._valid_until = 0.0
+        
+        run_transaction(self.node, give_up)
+
+leader_lease = LeaderLease()
+
+def leader_only(job):
+    """Wrap a scheduler coroutine so it only runs on the worker holding the lease."""
+    @functools.wraps(job)
+    async def run_if_leader(*args, **kwargs):
+        if leader_lease.is_leader:
+            return await job(*args, **kwargs)
+    
+    return run_if_leader
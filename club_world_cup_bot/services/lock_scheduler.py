@@ -0,0 +1,226 @@
+"""
+Service for locking predictions exactly at each match's lock deadline.
+
+Pending deadlines are kept in a min-heap and one APScheduler 'date' job is armed
+per match, so matches are locked on time without polling the database.
+"""
+import heapq
+import threading
+from datetime import datetime, timezone
+
+from ..firebase_helpers import run_db, get_match, get_unlocked_matches, SERVER_TIMESTAMP, WriteBatch
+from .prediction import get_lock_time
+from .schedule import parse_kickoff, now_epoch
+
+# Prefix of the APScheduler job IDs armed for match locks
+LOCK_JOB_PREFIX = "lock_"
+
+# How long to wait before retrying locks that could not be written
+LOCK_RETRY_SECONDS = 60
+
+# ID of the job that rebuilds the schedule after matches change (must not start with LOCK_JOB_PREFIX)
+REBUILD_JOB_ID = "rebuild_match_locks"
+
+# Changes to matches within this many seconds are handled by one rebuild
+REBUILD_DELAY_SECONDS = 5
+
+class LockScheduler:
+    """Min-heap of pending lock deadlines, with one scheduler job per match."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []          # [(deadline epoch, match_id)]
+        self._deadlines = {}     # match_id -> deadline
+        self._scheduler = None
+        self._on_locked = None
+        self._is_active = None
+    
+    def attach(self, scheduler, on_locked=None, is_active=None):
+        """
+        Arm lock jobs on an APScheduler scheduler.
+        
+        Args:
+            scheduler: Scheduler that runs the lock jobs
+            on_locked (coroutine function, optional): Awaited with the locked match IDs
+            is_active (callable, optional): Lock jobs do nothing while it returns False
+                (e.g. on workers that are not the leader)
+        """
+        self._scheduler = scheduler
+        self._on_locked = on_locked
+        self._is_active = is_active
+    
+    def rebuild(self):
+        """
+        Rebuild the deadline heap from the database and re-arm the lock jobs.
+        
+        Call this whenever a match is added or its time is edited. Matches whose
+        deadline has already passed are locked right away.
+        
+        Returns:
+            int: Number of matches waiting to be locked
+        """
+        heap = []
+        
+        # Only unlocked matches are downloaded
+        for match_id, match in get_unlocked_matches().items():
+            try:
+                heap.append((get_lock_time(parse_kickoff(match['time'])), match_id))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Error processing match {match_id}: {e}")
+        
+        heapq.heapify(heap)
+        
+        with self._lock:
+            self._heap = heap
+            self._deadlines = {match_id: deadline for deadline, match_id in heap}
+        
+        self._arm_jobs()
+        return len(heap)
+    
+    def request_rebuild(self, delay=REBUILD_DELAY_SECONDS):
+        """
+        Rebuild the schedule shortly, e.g. after another worker added or edited a match.
+        
+        Safe to call from any thread. Requests made while a rebuild is pending
+        are merged into it, and the rebuild is skipped while the scheduler is
+        not active.
+        """
+        if self._scheduler is None or self._scheduler.get_job(REBUILD_JOB_ID) is not None:
+            return
+        
+        self._scheduler.add_job(
+            self._run_rebuild, 'date',
+            run_date=datetime.fromtimestamp(now_epoch() + delay, tz=timezone.utc),
+            id=REBUILD_JOB_ID,
+            replace_existing=True
+        )
+    
+    async def _run_rebuild(self):
+        """Scheduler job: rebuild the schedule after matches changed."""
+        if self._is_active and not self._is_active():
+            return
+        
+        await run_db(self.rebuild)
+    
+    def _arm_job(self, match_id, run_date):
+        """Add or move the scheduler job that locks one match."""
+        self._scheduler.add_job(
+            self._run_due_locks, 'date',
+            args=[run_date],
+            run_date=datetime.fromtimestamp(max(run_date, now_epoch()), tz=timezone.utc),
+            id=f"{LOCK_JOB_PREFIX}{match_id}",
+            replace_existing=True,
+            misfire_grace_time=None
+        )
+    
+    def _arm_jobs(self):
+        """Add, move or remove scheduler jobs so they match the heap."""
+        if self._scheduler is None:
+            return
+        
+        with self._lock:
+            deadlines = dict(self._deadlines)
+        
+        for job in self._scheduler.get_jobs():
+            if job.id.startswith(LOCK_JOB_PREFIX) and job.id[len(LOCK_JOB_PREFIX):] not in deadlines:
+                job.remove()
+        
+        for match_id, deadline in deadlines.items():
+            self._arm_job(match_id, deadline)
+    
+    def next_deadline(self):
+        """Get the earliest pending lock deadline, or None if nothing is pending."""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+    
+    def lock_due_matches(self, now=None):
+        """
+        Lock every match whose deadline has passed, in one multi-path write.
+        
+        Returns:
+            list: IDs of the matches that were locked
+        """
+        now = now or now_epoch()
+        due = []
+        
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, match_id = heapq.heappop(self._heap)
+                
+                # Skip entries superseded by a newer deadline for the same match
+                if self._deadlines.get(match_id) != deadline:
+                    continue
+                
+                del self._deadlines[match_id]
+                due.append(match_id)
+        
+        if not due:
+            return []
+        
+        # The heap may predate a kickoff change made by another worker
+        due = self._recheck_deadlines(due, now)
+        if not due:
+            return []
+        
+        batch = WriteBatch()
+        for match_id in due:
+            batch.update(f"matches/{match_id}/locked", True)
+            batch.update(f"matches/{match_id}/updated_at", SERVER_TIMESTAMP)
+        
+        if not batch.flush():
+            # Put the deadlines back and retry a little later
+            retry_at = now + LOCK_RETRY_SECONDS
+            with self._lock:
+                for match_id in due:
+                    self._deadlines[match_id] = retry_at
+                    heapq.heappush(self._heap, (retry_at, match_id))
+            
+            if self._scheduler is not None:
+                for match_id in due:
+                    self._arm_job(match_id, retry_at)
+            return []
+        
+        return due
+    
+    def _recheck_deadlines(self, due, now):
+        """Re-arm due matches whose current kickoff moves their deadline later; return the rest."""
+        confirmed = []
+        
+        for match_id in due:
+            match = get_match(match_id)
+            if not match or match.get('locked', False):
+                continue
+            
+            try:
+                deadline = get_lock_time(parse_kickoff(match['time']))
+            except (ValueError, KeyError, TypeError):
+                deadline = now
+            
+            if deadline <= now:
+                confirmed.append(match_id)
+                continue
+            
+            with self._lock:
+                self._deadlines[match_id] = deadline
+                heapq.heappush(self._heap, (deadline, match_id))
+            
+            if self._scheduler is not None:
+                self._arm_job(match_id, deadline)
+        
+        return confirmed
+    
+    async def _run_due_locks(self, deadline):
+        """Scheduler job: lock the matches that are due and notify the callback."""
+        if self._is_active and not self._is_active():
+            return
+        
+        # Never run ahead of the clock, but don't miss the deadline that armed this job to rounding
+        locked = await run_db(self.lock_due_matches, max(now_epoch(), deadline))
+        if locked and self._on_locked:
+            await self._on_locked(locked)
+
+lock_scheduler = LockScheduler()
+
+def reschedule_match_locks():
+    """Rebuild the lock schedule after a match is added or edited."""
+    return lock_scheduler.rebuild()
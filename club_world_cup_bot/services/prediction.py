@@ -1,12 +1,14 @@
 """
 Service for handling match predictions using Firebase Realtime Database.
 """
-from datetime import datetime, timedelta
+from datetime import datetime
 from ..firebase_helpers import (
-    get_all_users, save_user, get_user,
-    get_all_matches, save_match, add_match, update_match,
-    get_all_predictions, get_predictions, save_prediction
+    save_user, get_user, get_user_model, get_username_entries,
+    get_all_matches, get_match, get_match_models, get_prediction_models, save_match, swap_match_result, add_match, update_match,
+    get_all_predictions, get_predictions, save_prediction,
+    SERVER_TIMESTAMP, WriteBatch
 )
+from .schedule import get_match_schedule, now_epoch
 
 # Configuration: How many hours before match start to lock predictions
 PREDICTION_LOCK_HOURS_BEFORE = 3
@@ -15,28 +17,25 @@ def get_matches():
     """Get all matches."""
     return get_all_matches()
 
+def get_lock_time(kickoff):
+    """Time (UTC epoch seconds) at which predictions close for a kickoff."""
+    return kickoff - PREDICTION_LOCK_HOURS_BEFORE * 3600
+
+def get_lock_cutoff(now=None):
+    """Latest kickoff (UTC epoch seconds) whose predictions are already closed."""
+    # Lock matches configured hours before they start (timezone hotfix)
+    return (now or now_epoch()) + PREDICTION_LOCK_HOURS_BEFORE * 3600
+
 def get_upcoming_matches():
     """Get matches that haven't started yet."""
-    matches = get_matches()
-    
-    # Handle case where get_matches returns None or empty
-    if not matches or not isinstance(matches, dict):
-        return {}
-    
-    now = datetime.now()
-    upcoming = {}
-    
-    for match_id, match in matches.items():
-        try:
-            match_time = datetime.strptime(match['time'], '%Y-%m-%d %H:%M')
-            # Allow predictions until configured hours before match starts (timezone hotfix)
-            if match_time - timedelta(hours=PREDICTION_LOCK_HOURS_BEFORE) > now and not match.get('locked', False):
-                upcoming[match_id] = match
-        except (ValueError, KeyError) as e:
-            print(f"Error processing match {match_id}: {e}")
-            continue
+    # Allow predictions until configured hours before match starts
+    upcoming = get_match_schedule().between(start=get_lock_cutoff())
     
-    return upcoming
+    return {
+        entry.match_id: dict(entry.match)
+        for entry in upcoming
+        if not entry.match.get('locked', False)
+    }
 
 def add_match(team1, team2, time, is_knockout=False):
     """Add a new match."""
@@ -50,43 +49,56 @@ def add_match(team1, team2, time, is_knockout=False):
         'locked': False
     }
     
-    return firebase_add_match(match_data)
+    match_id = firebase_add_match(match_data)
+    if match_id:
+        _reschedule_locks()
+    
+    return match_id
+
+def _reschedule_locks():
+    """Re-arm the lock jobs after a match is added or its time changes."""
+    from .lock_scheduler import reschedule_match_locks
+    reschedule_match_locks()
 
 def set_match_result(match_id, home_goals, away_goals, resolution_type=None):
     """Set the result for a match."""
-    matches = get_matches()
+    match = get_match(match_id)
     
-    if match_id not in matches:
+    if not match:
         return False
     
-    match_data = matches[match_id].copy()
-    match_data['result'] = {
+    result = {
         'home_goals': home_goals,
         'away_goals': away_goals
     }
     
-    if match_data.get('is_knockout', False) and resolution_type:
+    if match.get('is_knockout', False) and resolution_type:
         # Parse resolution_type for knockout winner if available
         if "_" in resolution_type:
             parts = resolution_type.split("_", 1)  # Split only on first underscore
             res_type = parts[0]
             knockout_winner = parts[1]
-            match_data['result']['resolution_type'] = res_type
-            match_data['result']['knockout_winner'] = knockout_winner
+            result['resolution_type'] = res_type
+            result['knockout_winner'] = knockout_winner
         else:
-            match_data['result']['resolution_type'] = resolution_type
-    
-    match_data['locked'] = True
-    
-    # Save the updated match to Firebase
-    if not save_match(match_id, match_data):
-        return False
+            result['resolution_type'] = resolution_type
     
-    # Update leaderboard after setting match result
-    from .scoring import update_leaderboard
-    update_leaderboard()
+    from .scoring import apply_match_result, update_leaderboard, SCORE_WRITE_LOCK
     
-    return True
+    # No full recompute may land between saving the result and applying its score change
+    with SCORE_WRITE_LOCK:
+        # Save the result atomically, getting back the result it replaced
+        previous_match, match_data = swap_match_result(match_id, result)
+        if match_data is None:
+            return False
+        
+        # Apply the score change for this match only
+        if apply_match_result(match_id, match_data, previous_match):
+            return True
+        
+        # The result is saved, so recomputing every score from scratch makes them right again
+        print(f"Error applying the score change of match {match_id}, recomputing all scores")
+        return update_leaderboard()
 
 def save_prediction(user_id, match_id, home_goals, away_goals, resolution_type=None):
     """Save a user's prediction for a match."""
@@ -97,8 +109,7 @@ def save_prediction(user_id, match_id, home_goals, away_goals, resolution_type=N
         'away_goals': away_goals
     }
     
-    matches = get_matches()
-    if matches.get(match_id, {}).get('is_knockout', False) and resolution_type:
+    if resolution_type and get_match(match_id).get('is_knockout', False):
         # Parse resolution_type for knockout winner if available
         if "_" in resolution_type:
             parts = resolution_type.split("_", 1)  # Split only on first underscore
@@ -115,65 +126,75 @@ def get_user_predictions(user_id):
     """Get all predictions for a user."""
     return get_predictions(user_id)
 
+def get_user_prediction_models(user_id):
+    """Get all predictions for a user as Prediction models."""
+    return get_prediction_models(user_id)
+
 def register_user(user_id, username, first_name, last_name=None):
     """Register a new user or update existing user info."""
     user_data = {
         'username': username,
         'first_name': first_name,
-        'last_name': last_name,
+        'last_name': last_name
+    }
+    
+    # Only set for new users; a returning user keeps their roles and score
+    defaults = {
         'registered_at': datetime.now().isoformat(),
-        'is_admin': False,  # Default value
-        'whitelisted': False,  # Default value - users start not whitelisted
-        'score': 0  # Default score
+        'is_admin': False,
+        'whitelisted': False,  # Users start not whitelisted
+        'score': 0
     }
     
-    return save_user(user_id, user_data)
+    saved = save_user(user_id, user_data, defaults=defaults)
+    _invalidate_access(user_id, username)
+    _invalidate_rank_index()
+    return saved
+
+def _invalidate_access(user_id=None, username=None):
+    """Drop cached access decisions affected by a role change."""
+    from .access import invalidate_access
+    invalidate_access(user_id, username)
+
+def _invalidate_rank_index():
+    """Rebuild the rank index after a user's name or score is reset."""
+    from .ranking import invalidate_rank_index
+    invalidate_rank_index()
 
 def is_admin(user_id):
     """Check if a user is an admin by ID."""
-    user = get_user(user_id)
-    return user.get('is_admin', False)
+    user = get_user_model(user_id)
+    return bool(user and user.is_admin)
 
 def is_whitelisted(user_id):
     """Check if a user is whitelisted by ID."""
-    user = get_user(user_id)
-    return user.get('whitelisted', False)
+    user = get_user_model(user_id)
+    return bool(user and user.whitelisted)
 
 def is_whitelisted_by_username(username):
     """Check if a user is whitelisted by username."""
     if not username:
         return False
-        
-    users = get_all_users()
-    
-    # Look for a user with matching username
-    for user_data in users.values():
-        if user_data.get('username') == username and user_data.get('whitelisted', False):
-            return True
     
-    return False
+    entries = get_username_entries(username)
+    return any(entry.get('whitelisted', False) for entry in entries.values())
 
 def is_admin_by_username(username):
     """Check if a user is an admin by username."""
     if not username:
         return False
-        
-    users = get_all_users()
-    
-    # Look for a user with matching username
-    for user_data in users.values():
-        if user_data.get('username') == username and user_data.get('is_admin', False):
-            return True
     
-    return False
+    entries = get_username_entries(username)
+    return any(entry.get('is_admin', False) for entry in entries.values())
 
 def set_admin(user_id, is_admin_value=True):
     """Set a user as admin by ID."""
     user = get_user(user_id)
     
     if user:
-        user['is_admin'] = is_admin_value
-        return save_user(user_id, user)
+        saved = save_user(user_id, {'is_admin': is_admin_value})
+        _invalidate_access(user_id, user.get('username'))
+        return saved
     
     return False
 
@@ -182,8 +203,9 @@ def set_whitelisted(user_id, whitelisted_value=True):
     user = get_user(user_id)
     
     if user:
-        user['whitelisted'] = whitelisted_value
-        return save_user(user_id, user)
+        saved = save_user(user_id, {'whitelisted': whitelisted_value})
+        _invalidate_access(user_id, user.get('username'))
+        return saved
     
     return False
 
@@ -191,33 +213,30 @@ def set_whitelisted_by_username(username, whitelisted_value=True):
     """Set a user as whitelisted by username."""
     if not username:
         return False
-        
-    users = get_all_users()
+    
     found = False
     
-    # Look for a user with matching username
-    for user_id, user_data in users.items():
-        if user_data.get('username') == username:
-            user_data['whitelisted'] = whitelisted_value
-            save_user(user_id, user_data)
-            found = True
+    # Update every user registered under this username
+    for user_id in get_username_entries(username):
+        save_user(user_id, {'whitelisted': whitelisted_value})
+        found = True
     
+    _invalidate_access(username=username)
     return found
 
 def set_admin_by_username(username, is_admin_value=True):
     """Set a user as admin by username."""
     if not username:
         return False
-        
-    users = get_all_users()
+    
     found = False
     
-    # Look for a user with matching username
-    for user_id, user_data in users.items():
-        if user_data.get('username') == username:
-            user_data['is_admin'] = is_admin_value
-            save_user(user_id, user_data)
-            found = True
+    # Update every user registered under this username
+    for user_id in get_username_entries(username):
+        save_user(user_id, {'is_admin': is_admin_value})
+        found = True
+    
+    _invalidate_access(username=username)
     
     if found:
         return True
@@ -237,25 +256,14 @@ def set_admin_by_username(username, is_admin_value=True):
 
 def lock_expired_matches():
     """Lock matches that have already started."""
-    matches = get_matches()
-    
-    # Handle case where get_matches returns None or empty
-    if not matches or not isinstance(matches, dict):
-        return False
+    batch = WriteBatch()
     
-    now = datetime.now()
-    updated = False
+    for entry in get_match_schedule().between(end=get_lock_cutoff()):
+        if not entry.match.get('locked', False):
+            batch.update(f"matches/{entry.match_id}/locked", True)
+            batch.update(f"matches/{entry.match_id}/updated_at", SERVER_TIMESTAMP)
     
-    for match_id, match in matches.items():
-        try:
-            match_time = datetime.strptime(match['time'], '%Y-%m-%d %H:%M')
-            # Lock matches configured hours before they start (timezone hotfix)
-            if match_time - timedelta(hours=PREDICTION_LOCK_HOURS_BEFORE) <= now and not match.get('locked', False):
-                match['locked'] = True
-                save_match(match_id, match)
-                updated = True
-        except (ValueError, KeyError) as e:
-            print(f"Error processing match {match_id}: {e}")
-            continue
+    if not batch:
+        return False
     
-    return updated 
\ No newline at end of file
+    return batch.flush() 
\ No newline at end of file
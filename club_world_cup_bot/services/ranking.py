@@ -0,0 +1,259 @@
+"""
+Service for keeping users ordered by score, so ranks and the top of the leaderboard
+can be read without sorting every user.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+
+from ..firebase_helpers import get_all_users
+
+# How long the index is trusted before it is rebuilt from the database
+RANK_INDEX_TTL_SECONDS = 300
+
+# Rebuild the index in one pass, instead of moving users one at a time, when
+# at least this share of the users change score at once (e.g. a full recompute)
+RANK_INDEX_REBUILD_SHARE = 0.1
+
+# Extra score buckets added on each side when a score falls outside the tree
+SCORE_BUCKET_MARGIN = 64
+
+class FenwickTree:
+    """Counts per bucket with O(log n) updates and prefix sums."""
+    
+    def __init__(self, counts):
+        """Build the tree from a list of bucket counts in one O(n) pass."""
+        tree = [0] + list(counts)
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+    
+    def __len__(self):
+        return len(self._tree) - 1
+    
+    def add(self, index, delta):
+        """Add delta to the count of bucket index."""
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+    
+    def prefix(self, end):
+        """Sum of the counts of buckets [0, end)."""
+        total = 0
+        i = end
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+class RankIndex:
+    """
+    Users with a score, kept in leaderboard order.
+    
+    Users are ordered by (-score, order), where order is the user's position in
+    the users node. This reproduces the stable sort used by get_leaderboard, so
+    tied users keep the same relative order and ranks.
+    
+    A Fenwick tree counts the users per score, so the users ahead of a score
+    are found in O(log n); each score also keeps its tied users sorted by order.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}     # user_id -> (score, order)
+        self._tied = {}        # score -> sorted [(order, user_id)]
+        self._profiles = {}    # user_id -> (name, username)
+        self._counts = FenwickTree([])
+        self._low = 0          # score of bucket 0 of the tree
+        self._next_order = 0
+        self._expires_at = 0
+    
+    def is_fresh(self):
+        """Check whether the index has been built and has not expired."""
+        return time.monotonic() < self._expires_at
+    
+    def load(self, users):
+        """Rebuild the index from a {user_id: user} dictionary."""
+        entries = {}
+        profiles = {}
+        
+        for order, (user_id, user) in enumerate(users.items()):
+            if not isinstance(user, dict) or 'score' not in user:
+                continue
+            
+            entries[user_id] = (int(user['score']), order)
+            profiles[user_id] = (user.get('first_name', 'Unknown'), user.get('username', ''))
+        
+        with self._lock:
+            self._entries = entries
+            self._profiles = profiles
+            self._next_order = len(users)
+            self._rebuild()
+            self._expires_at = time.monotonic() + RANK_INDEX_TTL_SECONDS
+    
+    def invalidate(self):
+        """Force a rebuild on the next read."""
+        with self._lock:
+            self._expires_at = 0
+    
+    def _rebuild(self, low=None, high=None):
+        """Rebuild the tie lists and the tree from _entries, covering at least scores low..high."""
+        tied = {}
+        for user_id, (score, order) in self._entries.items():
+            tied.setdefault(score, []).append((order, user_id))
+        for users in tied.values():
+            users.sort()
+        
+        scores = list(tied) + [score for score in (low, high) if score is not None]
+        self._low = min(scores, default=0) - SCORE_BUCKET_MARGIN
+        size = max(scores, default=0) + SCORE_BUCKET_MARGIN + 1 - self._low
+        
+        counts = [0] * size
+        for score, users in tied.items():
+            counts[score - self._low] = len(users)
+        
+        self._tied = tied
+        self._counts = FenwickTree(counts)
+    
+    def _remove(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            score, order = entry
+            users = self._tied[score]
+            del users[bisect_left(users, (order, user_id))]
+            if not users:
+                del self._tied[score]
+            self._counts.add(score - self._low, -1)
+        return entry
+    
+    def _order(self, user_id):
+        """The tie order of a user, assigning the next one to a new user."""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            return entry[1]
+        
+        order = self._next_order
+        self._next_order += 1
+        return order
+    
+    def _insert(self, user_id, score):
+        order = self._order(user_id)
+        self._remove(user_id)
+        
+        if not 0 <= score - self._low < len(self._counts):
+            self._entries[user_id] = (score, order)
+            self._rebuild(score, score)
+            return
+        
+        insort(self._tied.setdefault(score, []), (order, user_id))
+        self._counts.add(score - self._low, 1)
+        self._entries[user_id] = (score, order)
+    
+    def set_score(self, user_id, score):
+        """Move a user to the position for a new score, keeping their tie order."""
+        with self._lock:
+            self._insert(str(user_id), score)
+    
+    def add_score(self, user_id, delta):
+        """Change a user's score by delta."""
+        user_id = str(user_id)
+        
+        with self._lock:
+            entry = self._entries.get(user_id)
+            self._insert(user_id, (entry[0] if entry else 0) + delta)
+    
+    def update_scores(self, scores=None, deltas=None):
+        """
+        Apply many score changes at once.
+        
+        When a large share of the users change, the new scores are written to
+        the entries and the index is rebuilt in one pass.
+        """
+        scores = {str(user_id): score for user_id, score in (scores or {}).items()}
+        deltas = {str(user_id): delta for user_id, delta in (deltas or {}).items()}
+        
+        with self._lock:
+            if len(scores) + len(deltas) < RANK_INDEX_REBUILD_SHARE * len(self._entries):
+                for user_id, score in scores.items():
+                    self._insert(user_id, score)
+                for user_id, delta in deltas.items():
+                    entry = self._entries.get(user_id)
+                    self._insert(user_id, (entry[0] if entry else 0) + delta)
+                return
+            
+            for user_id, score in scores.items():
+                self._entries[user_id] = (score, self._order(user_id))
+            for user_id, delta in deltas.items():
+                entry = self._entries.get(user_id)
+                self._entries[user_id] = ((entry[0] if entry else 0) + delta, self._order(user_id))
+            self._rebuild()
+    
+    def rank(self, user_id):
+        """
+        Get a user's rank and score.
+        
+        Returns:
+            tuple: (rank, score), or (None, 0) if the user has no score
+        """
+        user_id = str(user_id)
+        
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None, 0
+            
+            score, order = entry
+            ahead = len(self._entries) - self._counts.prefix(score - self._low + 1)
+            return ahead + bisect_left(self._tied[score], (order, user_id)) + 1, score
+    
+    def top(self, limit=None):
+        """Get the first entries of the leaderboard, or all of them without a limit."""
+        with self._lock:
+            leaderboard = []
+            
+            for score in sorted(self._tied, reverse=True):
+                for _, user_id in self._tied[score]:
+                    if limit is not None and len(leaderboard) >= limit:
+                        return leaderboard
+                    
+                    name, username = self._profiles.get(user_id, ('Unknown', ''))
+                    leaderboard.append({
+                        'user_id': user_id,
+                        'name': name,
+                        'username': username,
+                        'score': score,
+                        'rank': len(leaderboard) + 1
+                    })
+            
+            return leaderboard
+
+_rank_index = RankIndex()
+
+def get_rank_index():
+    """Get the rank index, rebuilding it from the database if it has expired."""
+    if not _rank_index.is_fresh():
+        users = get_all_users()
+        if isinstance(users, dict):
+            _rank_index.load(users)
+    
+    return _rank_index
+
+def invalidate_rank_index():
+    """Rebuild the rank index on the next read, e.g. after users are added or renamed."""
+    _rank_index.invalidate()
+
+def record_score_changes(scores=None, deltas=None):
+    """
+    Apply score writes to the rank index if it is loaded.
+    
+    Args:
+        scores (dict, optional): {user_id: new_score}
+        deltas (dict, optional): {user_id: score_change}
+    """
+    if not _rank_index.is_fresh():
+        return
+    
+    _rank_index.update_scores(scores, deltas)
@@ -0,0 +1,82 @@
+"""
+Service for reminding users to predict upcoming matches.
+
+Reminders go to users with access who have not predicted the match yet (looked
+up in the match_predictions index) through the rate-limited broadcast queue.
+Each delivery is recorded under reminders/{match_id}, so a restarted job only
+sends to the users it missed, and matches/{match_id}/reminder_sent is set once
+the match is done.
+"""
+from ..firebase_helpers import (
+    run_db, get_all_users, get_match_prediction_user_ids, get_reminded_user_ids, WriteBatch
+)
+from ..messages.strings import MATCH_REMINDER
+from ..models import User
+from .broadcast import broadcast
+from .prediction import get_lock_cutoff
+from .schedule import query_matches_between, now_epoch
+
+# How long before kickoff reminders start going out
+REMINDER_HOURS_BEFORE = 24
+
+# Deliveries recorded per database write while a broadcast is running
+REMINDER_FLUSH_EVERY = 100
+
+def get_reminder_recipients(match_id):
+    """Get the IDs of the users with access who have neither predicted nor been reminded about a match."""
+    skip = get_match_prediction_user_ids(match_id) | get_reminded_user_ids(match_id)
+    recipients = []
+    
+    for user_id, user in get_all_users().items():
+        if user_id in skip or not isinstance(user, dict):
+            continue
+        
+        # Placeholder records (e.g. placeholder_<username> admins) have no chat to send to
+        if not user_id.isdigit():
+            continue
+        
+        try:
+            if User.from_dict(user_id, user).has_access:
+                recipients.append(user_id)
+        except (TypeError, ValueError) as e:
+            print(f"Skipping invalid user {user_id}: {e}")
+    
+    return recipients
+
+def get_matches_to_remind(now=None):
+    """Get open matches kicking off within REMINDER_HOURS_BEFORE whose reminders are not done."""
+    now = now or now_epoch()
+    window = query_matches_between(get_lock_cutoff(now), now + REMINDER_HOURS_BEFORE * 3600)
+    
+    return [
+        entry for entry in window
+        if not entry.match.get('locked', False) and not entry.match.get('reminder_sent', False)
+    ]
+
+async def send_match_reminder(bot, match_id, match):
+    """
+    Remind every user who has not predicted a match yet.
+    
+    Returns:
+        tuple: (number of reminders delivered, number that failed)
+    """
+    recipients = await run_db(get_reminder_recipients, match_id)
+    text = MATCH_REMINDER.format(team1=match['team1'], team2=match['team2'], time=match['time'])
+    batch = WriteBatch()
+    
+    async def record_delivery(user_id):
+        nonlocal batch
+        batch.update(f"reminders/{match_id}/{user_id}", True)
+        
+        # Swap in a new batch so deliveries aren't added while this one is written
+        if len(batch) >= REMINDER_FLUSH_EVERY:
+            full, batch = batch, WriteBatch()
+            await run_db(full.flush)
+    
+    delivered, failed = await broadcast(bot, ((int(user_id), text) for user_id in recipients), record_delivery)
+    
+    # Users that could not be reached (e.g. blocked the bot) are not retried for this match
+    batch.update(f"matches/{match_id}/reminder_sent", True)
+    await run_db(batch.flush)
+    
+    return len(delivered), len(failed)
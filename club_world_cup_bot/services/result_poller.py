@@ -0,0 +1,170 @@
+"""
+Service for ingesting match results from API-Football automatically.
+
+A scheduled job polls only the matches that have kicked off, have no result
+and were imported with an api_fixture_id. Due fixtures are fetched in batches
+with one /fixtures?ids= request each, matches that are not finished yet are
+polled again with an exponential backoff, and polling pauses until the quota
+resets when the API's daily request quota runs low.
+"""
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from .api_fetch import APIFootballClient, format_match_data, MAX_FIXTURE_IDS_PER_REQUEST
+from .prediction import set_match_result
+from .schedule import get_match_schedule, now_epoch
+
+# How often the polling job runs
+RESULT_POLL_INTERVAL_MINUTES = int(os.getenv("RESULT_POLL_INTERVAL_MINUTES", "5"))
+
+# A match cannot be over before this long after kickoff
+MIN_MATCH_MINUTES = 110
+
+# Backoff between polls of a match that is not finished yet, doubling up to the maximum
+RESULT_POLL_BACKOFF_SECONDS = 5 * 60
+RESULT_POLL_MAX_BACKOFF_SECONDS = 60 * 60
+
+# Stop polling matches this long after kickoff (postponed or abandoned)
+RESULT_POLL_GIVE_UP_HOURS = 48
+
+# Requests of the daily quota kept for admins' manual API use
+RESULT_POLL_QUOTA_RESERVE = int(os.getenv("RESULT_POLL_QUOTA_RESERVE", "10"))
+
+def _next_quota_reset(now):
+    """API-Football's daily quota resets at midnight UTC."""
+    today = datetime.fromtimestamp(now, tz=timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (today + timedelta(days=1)).timestamp()
+
+class ResultPoller:
+    """Polls API-Football for the results of matches that should have finished."""
+    
+    def __init__(self, client=None):
+        self._client = client
+        self._lock = threading.Lock()
+        self._attempts = {}      # match_id -> polls that found no result
+        self._next_poll = {}     # match_id -> earliest epoch of the next poll
+        self._paused_until = 0
+    
+    @property
+    def client(self):
+        """API client, created on first use (raises ValueError without API_FOOTBALL_KEY)."""
+        if self._client is None:
+            self._client = APIFootballClient()
+        return self._client
+    
+    def due_matches(self, now):
+        """
+        Get the matches that need a poll now.
+        
+        Returns:
+            dict: {api_fixture_id (str): match_id}
+        """
+        window = get_match_schedule().between(
+            start=now - RESULT_POLL_GIVE_UP_HOURS * 3600,
+            end=now - MIN_MATCH_MINUTES * 60
+        )
+        
+        with self._lock:
+            return {
+                str(entry.match['api_fixture_id']): entry.match_id
+                for entry in window
+                if 'result' not in entry.match
+                and entry.match.get('api_fixture_id') is not None
+                and self._next_poll.get(entry.match_id, 0) <= now
+            }
+    
+    def _back_off(self, match_id, now):
+        """Schedule the next poll of a match that has not finished."""
+        with self._lock:
+            attempts = self._attempts.get(match_id, 0)
+            self._attempts[match_id] = attempts + 1
+            delay = min(RESULT_POLL_BACKOFF_SECONDS * 2 ** attempts, RESULT_POLL_MAX_BACKOFF_SECONDS)
+            self._next_poll[match_id] = now + delay
+    
+    def _forget(self, match_id):
+        """Drop the backoff state of a match that has its result."""
+        with self._lock:
+            self._attempts.pop(match_id, None)
+            self._next_poll.pop(match_id, None)
+    
+    def _quota_exhausted(self, now):
+        """Pause polling until the quota resets if too few requests are left."""
+        remaining = self.client.requests_remaining
+        if remaining is None or remaining > RESULT_POLL_QUOTA_RESERVE:
+            return False
+        
+        self._paused_until = _next_quota_reset(now)
+        print(f"API-Football quota low ({remaining} requests left), pausing result polling")
+        return True
+    
+    def _apply_result(self, match_id, fixture):
+        """
+        Set the result of a match from a fixture if it has finished.
+        
+        Returns:
+            bool: True if the result was set
+        """
+        match_data = format_match_data(fixture)
+        if not match_data or 'result' not in match_data:
+            return False
+        
+        result = match_data['result']
+        resolution_type = result.get('resolution_type')
+        if resolution_type and result.get('knockout_winner'):
+            resolution_type = f"{resolution_type}_{result['knockout_winner']}"
+        
+        # Applies the score change of this match only
+        return set_match_result(match_id, result['home_goals'], result['away_goals'], resolution_type)
+    
+    def poll(self, now=None):
+        """
+        Poll the due matches once.
+        
+        Returns:
+            list: IDs of the matches whose results were set
+        """
+        now = now or now_epoch()
+        if now < self._paused_until:
+            return []
+        
+        if self._paused_until:
+            # The quota has been reset; the remaining count from before the pause is stale
+            self._paused_until = 0
+            self.client.requests_remaining = None
+        
+        due = self.due_matches(now)
+        fixture_ids = list(due)
+        finished = []
+        
+        for start in range(0, len(fixture_ids), MAX_FIXTURE_IDS_PER_REQUEST):
+            if self._quota_exhausted(now):
+                break
+            
+            chunk = fixture_ids[start:start + MAX_FIXTURE_IDS_PER_REQUEST]
+            
+            try:
+                fixtures = self.client.fetch_fixtures(chunk) or []
+            except Exception as e:
+                print(f"Error fetching fixtures {', '.join(chunk)}: {e}")
+                fixtures = []
+            
+            for fixture in fixtures:
+                match_id = due.pop(str(fixture.get('fixture', {}).get('id')), None)
+                if match_id is None:
+                    continue
+                
+                if self._apply_result(match_id, fixture):
+                    self._forget(match_id)
+                    finished.append(match_id)
+                else:
+                    self._back_off(match_id, now)
+            
+            # Fixtures missing from the response (or a failed request) are retried later
+            for fixture_id in chunk:
+                if fixture_id in due:
+                    self._back_off(due.pop(fixture_id), now)
+        
+        return finished
+
+result_poller = ResultPoller()
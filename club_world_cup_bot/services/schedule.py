@@ -0,0 +1,162 @@
+"""
+Service for match kickoff times.
+
+Match times are stored as 'YYYY-MM-DD HH:MM' strings in MATCH_TIMEZONE. They are
+parsed once into UTC epoch seconds and kept in a list sorted by kickoff, so
+time-window queries are binary searches instead of a parse and scan of every match.
+"""
+import os
+import threading
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+from ..firebase_helpers import get_all_matches, get_matches_version, query_matches
+
+# Format of the 'time' field of a match
+MATCH_TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+# Timezone match times are entered in, e.g. "Europe/London".
+# When unset, times are read in the server's local timezone.
+MATCH_TIMEZONE = os.getenv("MATCH_TIMEZONE")
+
+@dataclass(frozen=True)
+class MatchTime:
+    """Kickoff of a match as UTC epoch seconds, stored alongside the raw match record."""
+    match_id: str
+    kickoff: float
+    match: dict
+    
+    @property
+    def kickoff_utc(self):
+        """Kickoff as a timezone-aware UTC datetime."""
+        return datetime.fromtimestamp(self.kickoff, tz=timezone.utc)
+
+@lru_cache(maxsize=4096)
+def parse_kickoff(time_str):
+    """
+    Parse a match time string into UTC epoch seconds.
+    
+    Raises:
+        ValueError: If the string does not match MATCH_TIME_FORMAT
+    """
+    kickoff = datetime.strptime(time_str, MATCH_TIME_FORMAT)
+    
+    if MATCH_TIMEZONE:
+        kickoff = kickoff.replace(tzinfo=ZoneInfo(MATCH_TIMEZONE))
+    else:
+        kickoff = kickoff.astimezone()
+    
+    return kickoff.timestamp()
+
+def format_kickoff(epoch):
+    """Format UTC epoch seconds as a match time string in MATCH_TIMEZONE (inverse of parse_kickoff)."""
+    tz = ZoneInfo(MATCH_TIMEZONE) if MATCH_TIMEZONE else None
+    kickoff = datetime.fromtimestamp(epoch, tz=timezone.utc).astimezone(tz)
+    return kickoff.strftime(MATCH_TIME_FORMAT)
+
+def query_matches_between(start, end):
+    """
+    Get matches with start < kickoff <= end straight from a 'time' range query.
+    
+    Unlike the cached schedule this only downloads the matches in the window,
+    which suits jobs that look at a short window once in a while.
+    
+    Args:
+        start (float): UTC epoch seconds
+        end (float): UTC epoch seconds
+    
+    Returns:
+        list: MatchTime entries in kickoff order
+    """
+    # Match times sort lexicographically; pad the window by an hour for DST changes
+    # and apply the exact bounds after parsing
+    padding = timedelta(hours=1).total_seconds()
+    matches = query_matches('time', start_at=format_kickoff(start - padding), end_at=format_kickoff(end + padding))
+    
+    entries = []
+    for match_id, match in matches.items():
+        try:
+            kickoff = parse_kickoff(match['time'])
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Error processing match {match_id}: {e}")
+            continue
+        
+        if start < kickoff <= end:
+            entries.append(MatchTime(match_id, kickoff, match))
+    
+    entries.sort(key=lambda entry: entry.kickoff)
+    return entries
+
+class MatchSchedule:
+    """Matches sorted by kickoff, rebuilt when the cached matches snapshot changes."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._kickoffs = []      # sorted kickoff epochs
+        self._entries = []       # MatchTime, aligned with _kickoffs
+        self._by_id = {}         # match_id -> MatchTime
+    
+    def load(self, matches):
+        """Parse and index a {match_id: match} dictionary."""
+        entries = []
+        
+        for match_id, match in matches.items():
+            if not isinstance(match, dict):
+                continue
+            
+            try:
+                entries.append(MatchTime(match_id, parse_kickoff(match['time']), match))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Error processing match {match_id}: {e}")
+                continue
+        
+        entries.sort(key=lambda entry: entry.kickoff)
+        
+        with self._lock:
+            self._entries = entries
+            self._kickoffs = [entry.kickoff for entry in entries]
+            self._by_id = {entry.match_id: entry for entry in entries}
+    
+    def refresh(self):
+        """Rebuild the index if the matches snapshot has changed since it was built."""
+        version = get_matches_version()
+        if version is not None and version == self._version:
+            return self
+        
+        matches = get_all_matches()
+        self.load(matches if isinstance(matches, dict) else {})
+        self._version = get_matches_version()
+        return self
+    
+    def get(self, match_id):
+        """Get the MatchTime of a match, or None if it has no valid time."""
+        with self._lock:
+            return self._by_id.get(match_id)
+    
+    def between(self, start=None, end=None):
+        """
+        Get matches with start < kickoff <= end, in kickoff order.
+        
+        Args:
+            start (float, optional): UTC epoch seconds; unbounded if None
+            end (float, optional): UTC epoch seconds; unbounded if None
+        """
+        with self._lock:
+            low = 0 if start is None else bisect_right(self._kickoffs, start)
+            high = len(self._kickoffs) if end is None else bisect_right(self._kickoffs, end)
+            return self._entries[low:high]
+
+_schedule = MatchSchedule()
+
+def get_match_schedule():
+    """Get the kickoff index, rebuilt if the matches have changed."""
+    return _schedule.refresh()
+
+def now_epoch():
+    """Current time as UTC epoch seconds."""
+    return time.time()
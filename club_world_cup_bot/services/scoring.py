@@ -1,18 +1,194 @@
 """
 Service for calculating scores and updating the leaderboard using Firebase Realtime Database.
 """
+import threading
 from datetime import datetime
 from club_world_cup_bot.config.scoring_rules import SCORING_RULES
 
 # Import Firebase helpers
 from ..firebase_helpers import (
-    get_all_users, save_user,
+    get_all_users, get_user_ids,
     get_all_matches,
-    get_all_predictions
+    get_all_predictions, get_match_prediction_models,
+    increment_value, WriteBatch
 )
+from ..models import Match
+from .bulk_scoring import compute_user_totals, RESOLUTION_CODES, KNOCKOUT_WINNER_CODES
+from .ranking import get_rank_index, record_score_changes
+
+# Serializes score writes in this process. A full recompute writes absolute scores,
+# so it must not run between a result being saved and its score change being applied.
+SCORE_WRITE_LOCK = threading.RLock()
+
+# Goals per side covered by the precomputed score table (the keyboards offer 0-9)
+SCORE_TABLE_GOALS = 10
+
+# Number of distinct prediction (or result) codes in the knockout bonus table:
+# winner (3) x knockout winner (3) x resolution type (4)
+KNOCKOUT_CODES = 36
+
+class ScoreTables:
+    """Points for every prediction/result combination under one set of scoring rules."""
+    
+    __slots__ = ('rules', 'base', 'knockout')
+    
+    def __init__(self, rules, base, knockout):
+        # Snapshot of the rules the tables were built from
+        self.rules = rules
+        
+        # 90-minute points indexed by ((pred_home * G + pred_away) * G + result_home) * G + result_away
+        self.base = base
+        
+        # Knockout bonus indexed by prediction_code * (KNOCKOUT_CODES + 1) + result_code;
+        # the extra last result code always scores 0
+        self.knockout = knockout
+
+_score_tables = None
+
+def _winner_code(home_goals, away_goals):
+    """Winner code: 1 for home, 2 for away, 0 for a draw."""
+    return 1 if home_goals > away_goals else (2 if home_goals < away_goals else 0)
+
+def knockout_code(winner, knockout_winner, resolution):
+    """Combine winner, knockout winner and resolution codes into a knockout table code."""
+    return (winner * 3 + knockout_winner) * 4 + resolution
+
+def build_score_tables(rules=None):
+    """
+    Build the score lookup tables by evaluating every combination once.
+    
+    The tables are derived from calculate_score_direct, so a lookup always
+    gives the same points as the direct calculation.
+    """
+    rules = dict(rules or SCORING_RULES)
+    goals = SCORE_TABLE_GOALS
+    
+    base = [0] * goals ** 4
+    for pred_home in range(goals):
+        for pred_away in range(goals):
+            prediction = {'home_goals': pred_home, 'away_goals': pred_away}
+            for result_home in range(goals):
+                for result_away in range(goals):
+                    result = {'home_goals': result_home, 'away_goals': result_away}
+                    index = ((pred_home * goals + pred_away) * goals + result_home) * goals + result_away
+                    base[index] = calculate_score_direct(prediction, result, None, rules)
+    
+    # Representative 90-minute scores for each winner code
+    sample_goals = {0: (1, 1), 1: (1, 0), 2: (0, 1)}
+    resolutions = {0: None, **{code: name for name, code in RESOLUTION_CODES.items()}}
+    winners = {0: None, **{code: name for name, code in KNOCKOUT_WINNER_CODES.items()}}
+    
+    def sample(winner, knockout_winner, resolution):
+        home_goals, away_goals = sample_goals[winner]
+        data = {'home_goals': home_goals, 'away_goals': away_goals}
+        if resolutions[resolution] is not None:
+            data['resolution_type'] = resolutions[resolution]
+        if winners[knockout_winner] is not None:
+            data['knockout_winner'] = winners[knockout_winner]
+        return data
+    
+    codes = [(w, k, r) for w in range(3) for k in range(3) for r in range(4)]
+    knockout = [0] * (KNOCKOUT_CODES * (KNOCKOUT_CODES + 1))
+    for pred_codes in codes:
+        prediction = sample(*pred_codes)
+        for result_codes in codes:
+            result = sample(*result_codes)
+            bonus = (
+                calculate_score_direct(prediction, result, {'is_knockout': True}, rules)
+                - calculate_score_direct(prediction, result, None, rules)
+            )
+            index = knockout_code(*pred_codes) * (KNOCKOUT_CODES + 1) + knockout_code(*result_codes)
+            knockout[index] = bonus
+    
+    return ScoreTables(rules, base, knockout)
+
+def get_score_tables():
+    """Get the score tables, rebuilding them if SCORING_RULES has been edited."""
+    global _score_tables
+    
+    if _score_tables is None or _score_tables.rules != SCORING_RULES:
+        _score_tables = build_score_tables()
+    
+    return _score_tables
+
+def _table_goals(*values):
+    """Check that goal values are plain ints covered by the score table."""
+    return all(type(value) is int and 0 <= value < SCORE_TABLE_GOALS for value in values)
+
+def _knockout_lookup_code(home_goals, away_goals, resolution_type, knockout_winner):
+    """Knockout table code for a prediction or result, or None if it is not covered."""
+    resolution = RESOLUTION_CODES.get(resolution_type)
+    winner_index = KNOCKOUT_WINNER_CODES.get(knockout_winner, 0 if knockout_winner is None else None)
+    
+    if resolution is None or winner_index is None:
+        return None
+    
+    return knockout_code(_winner_code(home_goals, away_goals), winner_index, resolution)
 
 def calculate_score(prediction, result, match=None):
-    """Calculate score for a single prediction."""
+    """Calculate score for a single prediction using the precomputed score tables."""
+    pred_home = prediction['home_goals']
+    pred_away = prediction['away_goals']
+    result_home = result['home_goals']
+    result_away = result['away_goals']
+    
+    if not _table_goals(pred_home, pred_away, result_home, result_away):
+        return calculate_score_direct(prediction, result, match)
+    
+    tables = get_score_tables()
+    goals = SCORE_TABLE_GOALS
+    score = tables.base[((pred_home * goals + pred_away) * goals + result_home) * goals + result_away]
+    
+    is_knockout = match and match.get('is_knockout', False)
+    if not is_knockout or 'resolution_type' not in result or 'resolution_type' not in prediction:
+        return score
+    
+    pred_code = _knockout_lookup_code(
+        pred_home, pred_away, prediction['resolution_type'], prediction.get('knockout_winner')
+    )
+    result_code = _knockout_lookup_code(
+        result_home, result_away, result['resolution_type'], result.get('knockout_winner')
+    )
+    if pred_code is None or result_code is None:
+        return calculate_score_direct(prediction, result, match)
+    
+    return score + tables.knockout[pred_code * (KNOCKOUT_CODES + 1) + result_code]
+
+def score_prediction(prediction, match):
+    """
+    Score a Prediction model against a Match model's result.
+    
+    Models are validated when they are loaded, so only the table range is
+    checked here. Returns 0 if the match has no result.
+    """
+    result = match.result
+    if result is None:
+        return 0
+    
+    pred_home, pred_away = prediction.home_goals, prediction.away_goals
+    result_home, result_away = result.home_goals, result.away_goals
+    goals = SCORE_TABLE_GOALS
+    
+    if not (0 <= min(pred_home, pred_away, result_home, result_away)
+            and max(pred_home, pred_away, result_home, result_away) < goals):
+        return calculate_score_direct(prediction.to_dict(), result.to_dict(), match.to_dict())
+    
+    tables = get_score_tables()
+    score = tables.base[((pred_home * goals + pred_away) * goals + result_home) * goals + result_away]
+    
+    if not match.is_knockout or result.resolution_type is None or prediction.resolution_type is None:
+        return score
+    
+    pred_code = _knockout_lookup_code(pred_home, pred_away, prediction.resolution_type, prediction.knockout_winner)
+    result_code = _knockout_lookup_code(result_home, result_away, result.resolution_type, result.knockout_winner)
+    if pred_code is None or result_code is None:
+        return calculate_score_direct(prediction.to_dict(), result.to_dict(), match.to_dict())
+    
+    return score + tables.knockout[pred_code * (KNOCKOUT_CODES + 1) + result_code]
+
+def calculate_score_direct(prediction, result, match=None, rules=None):
+    """Calculate score for a single prediction by evaluating the rules directly."""
+    rules = rules or SCORING_RULES
     score = 0
     
     # Extract prediction values
@@ -35,20 +211,20 @@ def calculate_score(prediction, result, match=None):
         
         # Check if prediction is completely wrong for 90 minutes result
         if pred_winner != result_winner:
-            score += SCORING_RULES["WRONG_PREDICTION"]
+            score += rules["WRONG_PREDICTION"]
         else:
             # Correct winner for 90 minutes
-            score += SCORING_RULES["CORRECT_WINNER"]
+            score += rules["CORRECT_WINNER"]
         
         # Correct goal difference
         pred_diff = pred_home - pred_away
         result_diff = result_home - result_away
         if pred_diff == result_diff:
-            score += SCORING_RULES["CORRECT_GOAL_DIFF"]
+            score += rules["CORRECT_GOAL_DIFF"]
         
         # Exact score
         if pred_home == result_home and pred_away == result_away:
-            score += SCORING_RULES["EXACT_SCORE"]
+            score += rules["EXACT_SCORE"]
         
         # NEW: Separate knockout winner and resolution scoring
         if 'resolution_type' in result and 'resolution_type' in prediction:
@@ -65,41 +241,46 @@ def calculate_score(prediction, result, match=None):
             
             # Award points for correct knockout winner
             if final_pred_winner == final_result_winner:
-                score += SCORING_RULES["CORRECT_KO_WINNER"]
+                score += rules["CORRECT_KO_WINNER"]
             
             # Award points for correct resolution type
             # Only award resolution points if they got the 90-minute winner correct
             # (to prevent getting resolution bonus when completely wrong)
             if prediction['resolution_type'] == result['resolution_type'] and pred_winner == result_winner:
-                score += SCORING_RULES["CORRECT_KO_RESOLUTION"]
+                score += rules["CORRECT_KO_RESOLUTION"]
     
     else:
         # === ORIGINAL SCORING LOGIC FOR GROUP STAGE ===
         
         # Check if prediction is completely wrong for 90 minutes result
         if pred_winner != result_winner:
-            return SCORING_RULES["WRONG_PREDICTION"]
+            return rules["WRONG_PREDICTION"]
         
         # Correct winner for 90 minutes
-        score += SCORING_RULES["CORRECT_WINNER"]
+        score += rules["CORRECT_WINNER"]
         
         # Correct goal difference
         pred_diff = pred_home - pred_away
         result_diff = result_home - result_away
         if pred_diff == result_diff:
-            score += SCORING_RULES["CORRECT_GOAL_DIFF"]
+            score += rules["CORRECT_GOAL_DIFF"]
         
         # Exact score
         if pred_home == result_home and pred_away == result_away:
-            score += SCORING_RULES["EXACT_SCORE"]
+            score += rules["EXACT_SCORE"]
     
     return score
 
 def update_leaderboard():
     """Update scores for all users based on match results."""
+    with SCORE_WRITE_LOCK:
+        return _recompute_scores()
+
+def _recompute_scores():
+    """Recompute and write every user's score; call with SCORE_WRITE_LOCK held."""
     predictions = get_all_predictions()
     matches = get_all_matches()
-    users = get_all_users()
+    user_ids = get_user_ids()
     
     # Ensure we have proper dictionaries
     if not isinstance(predictions, dict):
@@ -110,71 +291,102 @@ def update_leaderboard():
         print(f"Warning: matches is not a dict, got {type(matches)}")
         return False
     
-    if not isinstance(users, dict):
-        print(f"Warning: users is not a dict, got {type(users)}")
-        return False
-    
-    # Calculate scores for each user and match
-    for user_id, user_predictions in predictions.items():
-        if user_id not in users:
+    # Only score users that still exist
+    user_predictions = {}
+    for user_id, predictions_for_user in predictions.items():
+        if user_id not in user_ids:
             continue
         
         # Ensure user_predictions is a dictionary
-        if not isinstance(user_predictions, dict):
-            print(f"Warning: user_predictions for user {user_id} is not a dict, got {type(user_predictions)}")
+        if not isinstance(predictions_for_user, dict):
+            print(f"Warning: user_predictions for user {user_id} is not a dict, got {type(predictions_for_user)}")
             continue
-            
-        total_score = 0
-        for match_id, prediction in user_predictions.items():
-            try:
-                if match_id in matches and 'result' in matches[match_id]:
-                    match_score = calculate_score(prediction, matches[match_id]['result'], matches[match_id])
-                    total_score += match_score
-            except Exception as e:
-                print(f"Error calculating score for user {user_id}, match {match_id}: {e}")
-                continue
         
-        # Update user score in Firebase
-        try:
-            user_data = users[user_id].copy()
-            user_data['score'] = total_score
-            save_user(user_id, user_data)
-        except Exception as e:
-            print(f"Error updating score for user {user_id}: {e}")
-            continue
+        user_predictions[user_id] = predictions_for_user
+    
+    # Score every prediction in one vectorized pass and write all scores in one batch
+    totals = compute_user_totals(user_predictions, matches)
+    scores = {user_id: totals.get(user_id, 0) for user_id in user_predictions}
+    batch = WriteBatch()
+    
+    for user_id, score in scores.items():
+        batch.update(f"users/{user_id}/score", score)
     
-    return True
+    updated = batch.flush()
+    if updated:
+        record_score_changes(scores=scores)
+    
+    return updated
 
-def get_leaderboard():
-    """Get sorted leaderboard with user scores."""
-    users = get_all_users()
+def apply_match_result(match_id, match, previous_match=None):
+    """
+    Apply the score change caused by a single match result.
     
-    # Filter out users without scores and sort by score
-    leaderboard = [
-        {
-            'user_id': user_id,
-            'name': user.get('first_name', 'Unknown'),
-            'username': user.get('username', ''),
-            'score': user.get('score', 0)
-        }
-        for user_id, user in users.items()
-        if 'score' in user
-    ]
+    Only the predictions for this match are scored. Each affected user's score is
+    adjusted by the difference between the new and the previous result's points,
+    and all adjustments are sent as one multi-path write.
     
-    leaderboard.sort(key=lambda x: x['score'], reverse=True)
+    Args:
+        match_id (str): ID of the match whose result changed
+        match (dict): Match data including the new result
+        previous_match (dict, optional): Match data before the change, if it had a result
+        
+    Returns:
+        bool: True if the scores were updated successfully
+    """
+    try:
+        match = Match.from_dict(match_id, match)
+        previous_match = Match.from_dict(match_id, previous_match) if previous_match else None
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Error reading match {match_id}: {e}")
+        return False
     
-    # Add rank
-    for i, entry in enumerate(leaderboard):
-        entry['rank'] = i + 1
+    if not match.has_result and not (previous_match and previous_match.has_result):
+        return True
     
-    return leaderboard
+    with SCORE_WRITE_LOCK:
+        return _apply_score_deltas(match_id, match, previous_match)
 
-def get_user_rank(user_id):
-    """Get a user's rank in the leaderboard."""
-    leaderboard = get_leaderboard()
+def _apply_score_deltas(match_id, match, previous_match):
+    """Write the score changes of one match result; call with SCORE_WRITE_LOCK held."""
+    predictions = get_match_prediction_models(match_id)
+    if not predictions:
+        return True
+    
+    user_ids = get_user_ids()
+    batch = WriteBatch()
+    deltas = {}
+    
+    for user_id, prediction in predictions.items():
+        if user_id not in user_ids:
+            continue
+        
+        delta = score_prediction(prediction, match)
+        if previous_match:
+            delta -= score_prediction(prediction, previous_match)
+        
+        if delta:
+            batch.update(f"users/{user_id}/score", increment_value(delta))
+            deltas[user_id] = delta
     
-    for entry in leaderboard:
-        if entry['user_id'] == str(user_id):
-            return entry['rank'], entry['score']
+    updated = batch.flush()
+    if updated:
+        record_score_changes(deltas=deltas)
+    
+    return updated
+
+def get_leaderboard(limit=None):
+    """
+    Get sorted leaderboard with user scores.
     
-    return None, 0 
\ No newline at end of file
+    Args:
+        limit (int, optional): Only return the top entries
+    """
+    return get_rank_index().top(limit)
+
+def get_user_rank(user_id):
+    """Get a user's rank in the leaderboard."""
+    return get_rank_index().rank(user_id)
+
+# Build the score tables once at import time; get_score_tables rebuilds them if the rules change
+get_score_tables()
@@ -0,0 +1,125 @@
+"""
+Service for routing each user's updates to one worker in webhook mode.
+
+Telegram posts every update to a single webhook URL, and a load balancer may
+hand it to any worker. With WORKER_URLS set, the worker that receives an
+update looks up the user's owner on a consistent-hash ring of the workers and
+forwards the update there, so all of one user's updates hit the same worker's
+warm caches. Updates are still handled in the background, so they are not
+serialized: two updates from one user may be handled concurrently. Adding or
+removing a worker only moves about 1/n of the users.
+
+Forwarding is an optimization, not a requirement: all state is shared through
+Firebase, so an update that cannot be forwarded is simply handled locally.
+"""
+import bisect
+import hashlib
+import logging
+import os
+
+import aiohttp
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+# Base URLs of all workers (comma-separated), e.g. "http://10.0.0.1:8080,http://10.0.0.2:8080"
+WORKER_URLS = [url.strip().rstrip("/") for url in os.environ.get("WORKER_URLS", "").split(",") if url.strip()]
+
+# This worker's own entry in WORKER_URLS
+WORKER_URL = os.environ.get("WORKER_URL", "").rstrip("/")
+
+# Points per worker on the hash ring; more points spread users more evenly
+HASH_RING_REPLICAS = 100
+
+# Marks a forwarded update, which is always handled where it arrives
+FORWARDED_HEADER = "X-Forwarded-By-Worker"
+
+# How long to wait for the owner to accept a forwarded update
+FORWARD_TIMEOUT_SECONDS = 5
+
+def _hash(value):
+    """Stable 64-bit hash of a string (the same in every process, unlike hash())."""
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+class HashRing:
+    """Consistent-hash ring mapping keys (user IDs) to nodes (worker URLs)."""
+    
+    def __init__(self, nodes, replicas=HASH_RING_REPLICAS):
+        self.nodes = list(nodes)
+        ring = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+    
+    def node_for(self, key):
+        """Get the node owning a key, or None if the ring is empty."""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[index]
+
+def update_user_id(update):
+    """
+    Get the ID of the user who caused a raw update, or None (e.g. channel posts).
+    
+    Every update has update_id and one event object, which names its user
+    'from' (messages, callback queries, ...) or 'user' (poll answers, reactions).
+    """
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if isinstance(user, dict):
+            return user.get("id")
+    return None
+
+class ShardedRequestHandler(SimpleRequestHandler):
+    """Webhook handler that forwards each update to the worker owning its user."""
+    
+    def __init__(self, dispatcher, bot, ring, worker_url, path, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, **kwargs)
+        self.ring = ring
+        self.worker_url = worker_url
+        self.path = path
+        self._session = None
+    
+    async def _forward(self, owner, body):
+        """
+        Post a raw update to its owner's webhook endpoint.
+        
+        Returns:
+            bool: True if the owner accepted it
+        """
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=FORWARD_TIMEOUT_SECONDS)
+            )
+        
+        headers = {"Content-Type": "application/json", FORWARDED_HEADER: self.worker_url}
+        if self.secret_token:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.secret_token
+        
+        try:
+            async with self._session.post(f"{owner}{self.path}", data=body, headers=headers) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, TimeoutError) as e:
+            logging.warning(f"Could not forward update to {owner}, handling it here: {e}")
+            return False
+    
+    async def handle(self, request):
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        
+        if FORWARDED_HEADER not in request.headers:
+            body = await request.read()
+            user_id = update_user_id(await request.json())
+            owner = self.ring.node_for(user_id) if user_id is not None else None
+            if owner and owner != self.worker_url and await self._forward(owner, body):
+                return web.json_response({})
+        
+        # The request body is cached, so the base handler can read it again
+        return await super().handle(request)
+    
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+        await super().close()
@@ -16,8 +16,9 @@ from .firebase_helpers import (
     get_all_users, save_user,
     get_all_matches, save_match,
     get_all_predictions, save_prediction,
-    clear_all_data
+    clear_all_data, WriteBatch
 )
+from .services.bulk_scoring import compute_user_totals
 
 def create_test_users():
     """Create test users."""
@@ -218,68 +219,16 @@ def calculate_scores(predictions, matches):
     """Calculate scores based on predictions and match results."""
     print("Calculating scores...")
     
-    # Scoring rules
-    SCORING_RULES = {
-        "CORRECT_WINNER": 2,
-        "CORRECT_GOAL_DIFF": 1,
-        "EXACT_SCORE": 2,
-        "CORRECT_RESOLUTION_TYPE": 1,
-        "WRONG_PREDICTION": -1
-    }
-    
-    # Calculate scores for each user
+    # Score every prediction with the bot's scoring rules in one vectorized pass
     users = get_all_users()
-    
-    for user_id, user_predictions in predictions.items():
-        total_score = 0
-        
-        for match_id, prediction in user_predictions.items():
-            match = matches.get(match_id)
-            
-            # Skip if no result yet
-            if not match or "result" not in match:
-                continue
-            
-            result = match["result"]
-            
-            # Extract values
-            pred_home = prediction["home_goals"]
-            pred_away = prediction["away_goals"]
-            result_home = result["home_goals"]
-            result_away = result["away_goals"]
-            
-            # Determine winners
-            pred_winner = 1 if pred_home > pred_away else (2 if pred_home < pred_away else 0)
-            result_winner = 1 if result_home > result_away else (2 if result_home < result_away else 0)
-            
-            # Calculate score
-            if pred_winner != result_winner:
-                total_score += SCORING_RULES["WRONG_PREDICTION"]
-                continue
-            
-            # Correct winner
-            total_score += SCORING_RULES["CORRECT_WINNER"]
-            
-            # Correct goal difference
-            pred_diff = pred_home - pred_away
-            result_diff = result_home - result_away
-            if pred_diff == result_diff:
-                total_score += SCORING_RULES["CORRECT_GOAL_DIFF"]
-            
-            # Exact score
-            if pred_home == result_home and pred_away == result_away:
-                total_score += SCORING_RULES["EXACT_SCORE"]
-            
-            # Resolution type (knockout only)
-            if match.get("is_knockout", False) and "resolution_type" in result and "resolution_type" in prediction:
-                if prediction["resolution_type"] == result["resolution_type"]:
-                    total_score += SCORING_RULES["CORRECT_RESOLUTION_TYPE"]
-        
-        # Save user score
-        if user_id in users:
-            users[user_id]["score"] = total_score
-            # Update user score in Firebase
-            save_user(user_id, users[user_id])
+    totals = compute_user_totals(predictions, matches)
+    
+    # Save all user scores in one batched write
+    with WriteBatch() as batch:
+        for user_id, total_score in totals.items():
+            if user_id in users:
+                users[user_id]["score"] = total_score
+                batch.update(f"users/{user_id}/score", total_score)
     
     print("Scores calculated and saved.")
 
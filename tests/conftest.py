@@ -0,0 +1,192 @@
+"""
+Shared test setup.
+
+club_world_cup_bot.firebase_init connects to Firebase when it is imported, so
+an in-memory database is installed in its place before any bot module is
+imported. The `database` fixture clears it (and the firebase_helpers caches)
+for every test; nodes added to UNINDEXED reject queries like a database
+without the ".indexOn" rules.
+"""
+import copy
+import os
+import sys
+import time
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _parts(path):
+    return [part for part in str(path).split('/') if part]
+
+def _order(value):
+    """Realtime Database query ordering: null, false, true, numbers, strings, objects."""
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1 + value,)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5,)
+
+# Nodes whose queries fail as if their ".indexOn" rule were missing
+UNINDEXED = set()
+
+class FakeQuery:
+    """order_by_child / order_by_key query with the filters the bot uses."""
+    
+    def __init__(self, reference, order_by):
+        self.reference = reference
+        self.order_by = order_by
+        self.start = self.end = self.equal = self.limit = None
+    
+    def start_at(self, value):
+        self.start = value
+        return self
+    
+    def end_at(self, value):
+        self.end = value
+        return self
+    
+    def equal_to(self, value):
+        self.equal = value
+        return self
+    
+    def limit_to_first(self, limit):
+        self.limit = limit
+        return self
+    
+    def _value(self, key, child):
+        if self.order_by is None:
+            return key
+        for part in _parts(self.order_by):
+            child = child.get(part) if isinstance(child, dict) else None
+        return child
+    
+    def get(self):
+        if self.order_by is not None and self.reference.path in UNINDEXED:
+            raise ValueError(f'Index not defined, add ".indexOn": "{self.order_by}" for path "/{self.reference.path}"')
+        
+        children = self.reference._raw()
+        if not isinstance(children, dict):
+            return {}
+        
+        result = {}
+        for key, child in sorted(children.items(), key=lambda item: (_order(self._value(*item)), item[0])):
+            value = _order(self._value(key, child))
+            if self.equal is not None and value != _order(self.equal):
+                continue
+            if self.start is not None and value < _order(self.start):
+                continue
+            if self.end is not None and value > _order(self.end):
+                continue
+            if self.limit is not None and len(result) >= self.limit:
+                break
+            result[key] = copy.deepcopy(child)
+        return result
+
+class FakeReference:
+    """In-memory stand-in for a firebase_admin.db.Reference."""
+    
+    def __init__(self, store, path=''):
+        self.store = store
+        self.path = '/'.join(_parts(path))
+    
+    @property
+    def key(self):
+        parts = _parts(self.path)
+        return parts[-1] if parts else None
+    
+    def child(self, path):
+        return FakeReference(self.store, f"{self.path}/{path}")
+    
+    def _raw(self):
+        node = self.store
+        for part in _parts(self.path):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+    
+    def _set(self, parts, value):
+        node = self.store
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is None or value == {}:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+    
+    def _resolve(self, parts, value):
+        """Apply server values (timestamp, increment) the way the server would."""
+        if isinstance(value, dict) and '.sv' in value:
+            if value['.sv'] == 'timestamp':
+                return int(time.time() * 1000)
+            current = FakeReference(self.store, '/'.join(parts))._raw() or 0
+            return current + value['.sv']['increment']
+        if isinstance(value, dict):
+            return {key: self._resolve(parts + [key], child) for key, child in value.items()}
+        return value
+    
+    def get(self, etag=False, shallow=False):
+        value = copy.deepcopy(self._raw())
+        if shallow and isinstance(value, dict):
+            value = {key: True for key in value}
+        return value
+    
+    def set(self, value):
+        parts = _parts(self.path)
+        if not parts:
+            self.store.clear()
+            self.store.update(copy.deepcopy(value or {}))
+            return
+        self._set(parts, copy.deepcopy(self._resolve(parts, value)))
+    
+    def update(self, value):
+        for path, child in value.items():
+            parts = _parts(self.path) + _parts(path)
+            self._set(parts, copy.deepcopy(self._resolve(parts, child)))
+    
+    def delete(self):
+        self._set(_parts(self.path), None)
+    
+    def transaction(self, update):
+        value = update(copy.deepcopy(self._raw()))
+        self._set(_parts(self.path), copy.deepcopy(self._resolve(_parts(self.path), value)))
+        return value
+    
+    def order_by_child(self, path):
+        return FakeQuery(self, path)
+    
+    def order_by_key(self):
+        return FakeQuery(self, None)
+    
+    def listen(self, callback):
+        return types.SimpleNamespace(close=lambda: None)
+
+STORE = {}
+ROOT = FakeReference(STORE)
+
+firebase_init = types.ModuleType('club_world_cup_bot.firebase_init')
+firebase_init.get_database = lambda: ROOT
+firebase_init.initialize_firebase = lambda: ROOT
+firebase_init.database = ROOT
+sys.modules['club_world_cup_bot.firebase_init'] = firebase_init
+
+@pytest.fixture
+def database():
+    """The in-memory database root, emptied before each test."""
+    from club_world_cup_bot import firebase_helpers
+    
+    STORE.clear()
+    UNINDEXED.clear()
+    firebase_helpers.invalidate_path("")
+    yield ROOT
+    STORE.clear()
+    UNINDEXED.clear()
+    firebase_helpers.invalidate_path("")
@@ -0,0 +1,86 @@
+"""
+compute_user_totals must give every user the same total as adding up
+calculate_score over their predictions, whichever path (table lookup or
+formula) each row takes.
+"""
+import random
+
+import pytest
+
+from club_world_cup_bot.services import bulk_scoring
+from club_world_cup_bot.services.scoring import SCORE_TABLE_GOALS, calculate_score
+
+# Includes resolution types and winners the score tables don't cover
+RESOLUTION_TYPES = ["FT", "ET", "PEN", "AET", "GG"]
+KNOCKOUT_WINNERS = ["1", "2", "3"]
+
+def random_goals(rng):
+    """Mostly table-sized goals, sometimes past the end of the table."""
+    if rng.random() < 0.1:
+        return rng.randint(SCORE_TABLE_GOALS, SCORE_TABLE_GOALS + 5)
+    return rng.randint(0, 4)
+
+def random_outcome(rng, is_knockout):
+    """A result or prediction dict the way set_match_result and save_prediction store it."""
+    outcome = {'home_goals': random_goals(rng), 'away_goals': random_goals(rng)}
+    if is_knockout and rng.random() < 0.8:
+        outcome['resolution_type'] = rng.choice(RESOLUTION_TYPES)
+        if rng.random() < 0.7:
+            outcome['knockout_winner'] = rng.choice(KNOCKOUT_WINNERS)
+    return outcome
+
+def random_tournament(rng, match_count=40, user_count=30):
+    matches = {}
+    for match_id in range(1, match_count + 1):
+        is_knockout = rng.random() < 0.5
+        match = {'team1': f"Team {match_id}A", 'team2': f"Team {match_id}B", 'is_knockout': is_knockout}
+        if rng.random() < 0.8:
+            match['result'] = random_outcome(rng, is_knockout)
+        matches[str(match_id)] = match
+    
+    predictions = {}
+    for user_id in range(1, user_count + 1):
+        predictions[str(user_id)] = {
+            match_id: random_outcome(rng, match['is_knockout'])
+            for match_id, match in matches.items()
+            if rng.random() < 0.7
+        }
+    return predictions, matches
+
+def expected_totals(predictions, matches):
+    return {
+        user_id: sum(
+            calculate_score(prediction, matches[match_id]['result'], matches[match_id])
+            for match_id, prediction in user_predictions.items()
+            if 'result' in matches[match_id]
+        )
+        for user_id, user_predictions in predictions.items()
+    }
+
+@pytest.mark.parametrize("seed", range(25))
+def test_compute_user_totals_matches_calculate_score(seed):
+    predictions, matches = random_tournament(random.Random(seed))
+    
+    assert bulk_scoring.compute_user_totals(predictions, matches) == expected_totals(predictions, matches)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_python_fallback_matches_calculate_score(seed):
+    predictions, matches = random_tournament(random.Random(seed))
+    
+    assert bulk_scoring._compute_user_totals_python(predictions, matches) == expected_totals(predictions, matches)
+
+def test_knockout_cases_match_calculate_score():
+    # Every combination of resolution type and winner on both sides, for a draw and a win
+    match = {'is_knockout': True}
+    outcomes = [{'home_goals': 1, 'away_goals': 1}, {'home_goals': 2, 'away_goals': 0}]
+    for resolution_type in RESOLUTION_TYPES:
+        outcomes.append({'home_goals': 1, 'away_goals': 1, 'resolution_type': resolution_type})
+        outcomes.append({'home_goals': 2, 'away_goals': 1, 'resolution_type': resolution_type})
+        for winner in KNOCKOUT_WINNERS:
+            outcomes.append({'home_goals': 1, 'away_goals': 1, 'resolution_type': resolution_type, 'knockout_winner': winner})
+    
+    for result in outcomes:
+        matches = {'1': dict(match, result=result)}
+        predictions = {str(i): {'1': prediction} for i, prediction in enumerate(outcomes)}
+        
+        assert bulk_scoring.compute_user_totals(predictions, matches) == expected_totals(predictions, matches), result
@@ -0,0 +1,109 @@
+"""
+Importing a recorded API-Football /fixtures response into an empty database,
+then importing it again, must add each fixture exactly once.
+"""
+import copy
+import os
+
+from club_world_cup_bot.services.fixture_import import import_fixtures, load_fixtures
+from club_world_cup_bot.services.schedule import format_kickoff
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "data", "fixtures_league_15_2025.json")
+
+def matches_by_fixture(database):
+    matches = database.child('matches').get() or {}
+    return {match['api_fixture_id']: (match_id, match) for match_id, match in matches.items()}
+
+def test_import_recorded_fixtures(database):
+    fixtures = load_fixtures(FIXTURES_PATH)
+    
+    report = import_fixtures(fixtures)
+    
+    assert report['added'] == ['1', '2', '3', '4', '5', '6']
+    assert report['updated'] == []
+    assert report['unchanged'] == 0
+    assert report['skipped'] == 1
+    assert report['with_results'] == 4
+    
+    matches = matches_by_fixture(database)
+    assert len(matches) == 6
+    assert database.child('fixture_index').get() == {
+        str(fixture_id): match_id for fixture_id, (match_id, _) in matches.items()
+    }
+    
+    _, group = matches[1321601]
+    assert group['team1'] == "Chelsea" and group['team2'] == "Los Angeles FC"
+    assert group['is_knockout'] is False and group['locked'] is True
+    assert group['result'] == {'home_goals': 2, 'away_goals': 0}
+    # Kickoffs are stored in MATCH_TIMEZONE
+    assert group['time'] == format_kickoff(1750100400)
+    
+    _, penalties = matches[1321700]
+    assert penalties['result'] == {'home_goals': 1, 'away_goals': 1, 'resolution_type': "PEN", 'knockout_winner': "1"}
+    
+    _, extra_time = matches[1321701]
+    # Predictions are scored on the 90-minute score, not the score after extra time
+    assert extra_time['result'] == {'home_goals': 1, 'away_goals': 1, 'resolution_type': "ET", 'knockout_winner': "2"}
+    
+    _, final = matches[1321800]
+    assert final['is_knockout'] is True and final['locked'] is False and 'result' not in final
+
+def test_second_import_creates_no_duplicates(database):
+    fixtures = load_fixtures(FIXTURES_PATH)
+    import_fixtures(fixtures)
+    first = matches_by_fixture(database)
+    
+    report = import_fixtures(fixtures)
+    
+    assert report['added'] == []
+    assert report['updated'] == []
+    assert report['unchanged'] == 6
+    assert report['skipped'] == 1
+    assert {fixture_id: match_id for fixture_id, (match_id, _) in matches_by_fixture(database).items()} == {
+        fixture_id: match_id for fixture_id, (match_id, _) in first.items()
+    }
+    assert database.child('counters').child('matches').get() == 6
+
+def test_reimport_updates_changed_fixture(database):
+    fixtures = load_fixtures(FIXTURES_PATH)
+    import_fixtures(fixtures)
+    match_id, _ = matches_by_fixture(database)[1321800]
+    
+    # The final is moved by a day
+    moved = copy.deepcopy(fixtures)
+    moved[4]['fixture']['date'] = "2030-07-14T19:00:00+00:00"
+    report = import_fixtures(moved)
+    
+    assert report['added'] == []
+    assert report['updated'] == [match_id]
+    assert report['unchanged'] == 5
+    assert len(matches_by_fixture(database)) == 6
+    assert database.child('matches').child(match_id).child('time').get() == format_kickoff(1910286000)
+
+def test_reimport_reads_only_indexed_matches(database, monkeypatch):
+    from club_world_cup_bot.services import fixture_import
+    
+    fixtures = load_fixtures(FIXTURES_PATH)
+    import_fixtures(fixtures)
+    
+    def get_all_matches():
+        raise AssertionError("read every match")
+    monkeypatch.setattr(fixture_import, 'get_all_matches', get_all_matches)
+    report = import_fixtures(fixtures)
+    
+    assert report['added'] == [] and report['unchanged'] == 6
+
+def test_first_import_indexes_existing_matches(database):
+    fixtures = load_fixtures(FIXTURES_PATH)
+    # Imported before the fixture index existed
+    database.child('matches').child('1').set({
+        'team1': "Chelsea", 'team2': "Los Angeles FC", 'time': "old", 'is_knockout': False, 'api_fixture_id': 1321601
+    })
+    database.child('counters').child('matches').set(1)
+    
+    report = import_fixtures(fixtures)
+    
+    assert report['updated'] == ['1']
+    assert len(report['added']) == 5
+    assert database.child('fixture_index').child('1321601').get() == '1'
+    assert len(matches_by_fixture(database)) == 6
@@ -0,0 +1,68 @@
+"""
+Indexed queries must return the same children whether the server runs them
+or, when the ".indexOn" rule is missing, the whole node is filtered locally.
+"""
+import time
+
+import pytest
+
+from club_world_cup_bot import firebase_helpers
+from club_world_cup_bot.firebase_helpers import get_prediction_changes, get_unlocked_matches
+from club_world_cup_bot.fsm_storage import FirebaseStorage
+from club_world_cup_bot.services.schedule import format_kickoff, query_matches_between
+
+from conftest import UNINDEXED
+
+@pytest.fixture(params=[True, False], ids=["indexed", "unindexed"])
+def indexed(request, database):
+    if not request.param:
+        UNINDEXED.update({'matches', 'prediction_changes', 'fsm'})
+    return request.param
+
+def test_unlocked_matches_include_matches_without_locked(database, indexed):
+    database.child('matches').set({
+        '1': {'team1': "A", 'team2': "B", 'time': "2030-01-01 12:00", 'locked': False},
+        '2': {'team1': "C", 'team2': "D", 'time': "2030-01-01 15:00", 'locked': True},
+        '3': {'team1': "E", 'team2': "F", 'time': "2030-01-01 18:00"}
+    })
+    
+    assert sorted(get_unlocked_matches()) == ['1', '3']
+
+def test_matches_between(database, indexed):
+    now = time.time()
+    database.child('matches').set({
+        str(hours): {'team1': "A", 'team2': "B", 'time': format_kickoff(now + hours * 3600)}
+        for hours in (1, 5, 30)
+    })
+    
+    matches = query_matches_between(now, now + 6 * 3600)
+    
+    assert [entry.match_id for entry in matches] == ['1', '5']
+
+def test_prediction_changes(database, indexed):
+    database.child('prediction_changes').set({
+        f"u_{i}": {'user_id': "u", 'match_id': str(i), 'updated_at': 1000 * i}
+        for i in range(1, 6)
+    })
+    
+    assert list(get_prediction_changes(since=2000, before=5000)) == ['u_2', 'u_3', 'u_4']
+    assert list(get_prediction_changes(before=2000)) == ['u_1']
+
+def test_fsm_purge_expired(database, indexed):
+    now = int(time.time())
+    database.child('fsm').set({
+        'old': {'s': "AddMatchForm:team2", 'e': now - 10},
+        'live': {'s': "AddMatchForm:team2", 'e': now + 3600}
+    })
+    
+    assert FirebaseStorage().purge_expired(now) == 1
+    assert list(database.child('fsm').get()) == ['live']
+
+def test_query_uses_cached_snapshot_when_unindexed(database):
+    database.child('matches').set({'1': {'team1': "A", 'team2': "B", 'time': "2030-01-01 12:00"}})
+    firebase_helpers.get_all_matches()
+    database.child('matches').child('2').set({'team1': "C", 'team2': "D", 'time': "2030-01-01 15:00"})
+    UNINDEXED.add('matches')
+    
+    # The cached snapshot predates match 2
+    assert list(get_unlocked_matches()) == ['1']
@@ -0,0 +1,57 @@
+"""
+RankIndex must give the same ranks and leaderboard as a stable sort of the
+users node by score, however the scores reach it.
+"""
+import random
+
+import pytest
+
+from club_world_cup_bot.services.ranking import RankIndex
+
+def sorted_leaderboard(users):
+    """Reference ranking: users with a score, stable-sorted by score descending."""
+    scored = [(user_id, user['score']) for user_id, user in users.items() if 'score' in user]
+    scored.sort(key=lambda item: -item[1])
+    return [(user_id, score, rank) for rank, (user_id, score) in enumerate(scored, 1)]
+
+def index_leaderboard(index):
+    return [(entry['user_id'], entry['score'], entry['rank']) for entry in index.top()]
+
+@pytest.mark.parametrize("seed", range(10))
+def test_rank_index_matches_stable_sort(seed):
+    rng = random.Random(seed)
+    users = {str(i): {'first_name': f"User {i}", 'score': rng.randint(-5, 20)} for i in range(200)}
+    users['no-score'] = {'first_name': "New"}
+    
+    index = RankIndex()
+    index.load(users)
+    
+    for step in range(300):
+        user_id = str(rng.randrange(220))
+        if step % 3 == 0:
+            # Includes scores far outside the range the tree was built for
+            score = rng.choice([rng.randint(-5, 20), rng.randint(-500, 500)])
+            index.set_score(user_id, score)
+            users.setdefault(user_id, {})['score'] = score
+        elif step % 3 == 1:
+            delta = rng.randint(-3, 3)
+            index.add_score(user_id, delta)
+            user = users.setdefault(user_id, {})
+            user['score'] = user.get('score', 0) + delta
+        else:
+            # Bulk change of many users, which rebuilds the index
+            changed = rng.sample(sorted(users), 60)
+            deltas = {user_id: rng.randint(-2, 4) for user_id in changed[:30]}
+            scores = {user_id: rng.randint(0, 30) for user_id in changed[30:]}
+            index.update_scores(scores=scores, deltas=deltas)
+            for user_id, delta in deltas.items():
+                users[user_id]['score'] = users[user_id].get('score', 0) + delta
+            for user_id, score in scores.items():
+                users[user_id]['score'] = score
+    
+    expected = sorted_leaderboard(users)
+    assert index_leaderboard(index) == expected
+    assert index.top(10) == index.top()[:10]
+    for user_id, score, rank in expected:
+        assert index.rank(user_id) == (rank, score)
+    assert index.rank('missing') == (None, 0)
@@ -0,0 +1,44 @@
+"""
+send_match_reminder must reach every user with access who has not predicted
+the match, and skip user records that are not Telegram chats.
+"""
+import asyncio
+
+from club_world_cup_bot.services.prediction import set_admin_by_username
+from club_world_cup_bot.services.reminders import get_reminder_recipients, send_match_reminder
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+    
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append(chat_id)
+
+MATCH = {'team1': "Chelsea", 'team2': "Benfica", 'time': "2030-07-14 21:00"}
+
+def setup_users(database):
+    database.child('matches').child('1').set(dict(MATCH, locked=False))
+    database.child('users').set({
+        '7': {'first_name': "Ann", 'whitelisted': True, 'score': 0},
+        '8': {'first_name': "Bob", 'whitelisted': True, 'score': 0},
+        '9': {'first_name': "Cid", 'whitelisted': False, 'score': 0}
+    })
+    database.child('match_predictions').child('1').set({'8': {'home_goals': 1, 'away_goals': 0}})
+    # An admin configured by username who has not started the bot yet
+    set_admin_by_username("owner")
+
+def test_placeholder_admin_is_not_a_recipient(database):
+    setup_users(database)
+    
+    assert 'placeholder_owner' in database.child('users').get()
+    assert get_reminder_recipients('1') == ['7']
+
+def test_reminders_are_sent_and_recorded_with_placeholder_admin(database):
+    setup_users(database)
+    bot = FakeBot()
+    
+    assert asyncio.run(send_match_reminder(bot, '1', MATCH)) == (1, 0)
+    
+    assert bot.sent == [7]
+    assert database.child('reminders').child('1').get() == {'7': True}
+    assert database.child('matches').child('1').child('reminder_sent').get() is True
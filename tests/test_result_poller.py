@@ -0,0 +1,187 @@
+"""
+ResultPoller.poll against a local stand-in for API-Football: retries on 429,
+backoff of unfinished matches, pausing on a low quota and applying finished
+fixtures through set_match_result.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from club_world_cup_bot.services import api_fetch
+from club_world_cup_bot.services.api_fetch import APIFootballClient, ResponseCache
+from club_world_cup_bot.services.result_poller import (
+    ResultPoller, RESULT_POLL_BACKOFF_SECONDS, RESULT_POLL_QUOTA_RESERVE, _next_quota_reset
+)
+from club_world_cup_bot.services.schedule import format_kickoff
+
+# Kickoff of the polled matches, three hours before NOW
+NOW = 1750118400
+KICKOFF = NOW - 3 * 3600
+
+class StubAPI(BaseHTTPRequestHandler):
+    """Answers /fixtures?ids= from the server's fixtures, after any queued error statuses (or "invalid" bodies)."""
+    
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        server.requests.append(query)
+        
+        status = server.statuses.pop(0) if server.statuses else 200
+        if status in (200, "invalid"):
+            ids = query.get('ids', [''])[0].split('-')
+            fixtures = [server.fixtures[fixture_id] for fixture_id in ids if fixture_id in server.fixtures]
+            body = {"get": "fixtures", "errors": [], "results": len(fixtures), "response": fixtures}
+        else:
+            body = {"message": "Too many requests"}
+        
+        data = json.dumps(body).encode()
+        if status == "invalid":
+            # A 200 whose body is cut off, e.g. by a proxy
+            status, data = 200, data[:len(data) // 2]
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("x-ratelimit-requests-limit", "100")
+        self.send_header("x-ratelimit-requests-remaining", str(server.remaining))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def api_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPI)
+    server.requests = []
+    server.statuses = []
+    server.fixtures = {}
+    server.remaining = 100
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    
+    # A fresh session, with short retry backoffs
+    monkeypatch.setattr(api_fetch, "_session", None)
+    monkeypatch.setattr(api_fetch, "API_RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(api_fetch, "API_RETRY_JITTER", 0.01)
+    monkeypatch.setattr(APIFootballClient, "BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    # Polls are minutes apart on the test's clock but not in real time, so don't cache them
+    monkeypatch.setattr(api_fetch, "LIVE_FIXTURE_CACHE_TTL", 0)
+    
+    yield server
+    
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def poller(api_server):
+    return ResultPoller(APIFootballClient(api_key="test", cache=ResponseCache()))
+
+def fixture(fixture_id, status, goals=(None, None), fulltime=(None, None), winner=(None, None), round="Group Stage - 1"):
+    return {
+        "fixture": {"id": fixture_id, "date": "2025-06-16T21:00:00+00:00", "status": {"short": status}},
+        "league": {"id": 15, "season": 2025, "round": round},
+        "teams": {"home": {"name": "Chelsea", "winner": winner[0]}, "away": {"name": "Benfica", "winner": winner[1]}},
+        "goals": {"home": goals[0], "away": goals[1]},
+        "score": {"fulltime": {"home": fulltime[0], "away": fulltime[1]}}
+    }
+
+def add_match(database, match_id, fixture_id, is_knockout=False):
+    database.child('matches').child(match_id).set({
+        'team1': "Chelsea", 'team2': "Benfica", 'time': format_kickoff(KICKOFF),
+        'is_knockout': is_knockout, 'api_fixture_id': fixture_id, 'locked': True
+    })
+
+def test_finished_fixture_sets_result_and_scores(database, api_server, poller):
+    add_match(database, '1', 101)
+    add_match(database, '2', 102, is_knockout=True)
+    database.child('users').set({'7': {'first_name': "Ann", 'score': 0}, '8': {'first_name': "Bob", 'score': 0}})
+    database.child('match_predictions').set({
+        '1': {'7': {'home_goals': 2, 'away_goals': 0}, '8': {'home_goals': 0, 'away_goals': 1}},
+        '2': {'7': {'home_goals': 1, 'away_goals': 1, 'resolution_type': "ET", 'knockout_winner': "2"}}
+    })
+    api_server.fixtures = {
+        '101': fixture(101, "FT", goals=(2, 0), fulltime=(2, 0)),
+        '102': fixture(102, "AET", goals=(1, 4), fulltime=(1, 1), winner=(False, True), round="Round of 16")
+    }
+    
+    assert sorted(poller.poll(NOW)) == ['1', '2']
+    
+    # Both fixtures were fetched with one request
+    assert api_server.requests == [{'ids': ['101-102']}]
+    matches = database.child('matches').get()
+    assert matches['1']['result'] == {'home_goals': 2, 'away_goals': 0}
+    assert matches['2']['result'] == {'home_goals': 1, 'away_goals': 1, 'resolution_type': "ET", 'knockout_winner': "2"}
+    # Exact score (3) in match 1, plus exact score, winner and resolution (5) in match 2
+    assert database.child('users').child('7').child('score').get() == 8
+    assert database.child('users').child('8').child('score').get() == -1
+    
+    # Matches with a result are not polled again
+    assert poller.poll(NOW + 3600) == []
+    assert len(api_server.requests) == 1
+
+def test_429_is_retried(database, api_server, poller):
+    add_match(database, '1', 101)
+    api_server.fixtures = {'101': fixture(101, "FT", goals=(1, 0), fulltime=(1, 0))}
+    api_server.statuses = [429, 429]
+    
+    assert poller.poll(NOW) == ['1']
+    assert len(api_server.requests) == 3
+
+def test_persistent_429_backs_off(database, api_server, poller):
+    add_match(database, '1', 101)
+    api_server.fixtures = {'101': fixture(101, "FT", goals=(1, 0), fulltime=(1, 0))}
+    api_server.statuses = [429] * (api_fetch.API_RETRIES + 1)
+    
+    assert poller.poll(NOW) == []
+    assert len(api_server.requests) == api_fetch.API_RETRIES + 1
+    assert 'result' not in database.child('matches').child('1').get()
+    
+    # The match waits out the backoff, then is fetched again
+    assert poller.poll(NOW + RESULT_POLL_BACKOFF_SECONDS - 1) == []
+    assert len(api_server.requests) == api_fetch.API_RETRIES + 1
+    assert poller.poll(NOW + RESULT_POLL_BACKOFF_SECONDS) == ['1']
+
+def test_invalid_json_backs_off(database, api_server, poller):
+    add_match(database, '1', 101)
+    api_server.fixtures = {'101': fixture(101, "FT", goals=(1, 0), fulltime=(1, 0))}
+    api_server.statuses = ["invalid"]
+    
+    assert poller.poll(NOW) == []
+    assert 'result' not in database.child('matches').child('1').get()
+    
+    assert poller.poll(NOW + RESULT_POLL_BACKOFF_SECONDS) == ['1']
+
+def test_unfinished_match_backoff_doubles(database, api_server, poller):
+    add_match(database, '1', 101)
+    api_server.fixtures = {'101': fixture(101, "2H", goals=(1, 0))}
+    
+    polled_at = []
+    for now in range(NOW, NOW + 4 * RESULT_POLL_BACKOFF_SECONDS, 60):
+        before = len(api_server.requests)
+        assert poller.poll(now) == []
+        if len(api_server.requests) > before:
+            polled_at.append(now - NOW)
+    
+    assert polled_at == [0, RESULT_POLL_BACKOFF_SECONDS, 3 * RESULT_POLL_BACKOFF_SECONDS]
+
+def test_low_quota_pauses_until_reset(database, api_server, poller):
+    add_match(database, '1', 101)
+    add_match(database, '2', 102)
+    api_server.fixtures = {'101': fixture(101, "FT", goals=(1, 0), fulltime=(1, 0))}
+    api_server.remaining = RESULT_POLL_QUOTA_RESERVE
+    
+    # Fixture 102 is missing from the response, so it is due again after the backoff
+    assert poller.poll(NOW) == ['1']
+    api_server.fixtures['102'] = fixture(102, "FT", goals=(0, 0), fulltime=(0, 0))
+    
+    # The response reported a low quota: no more requests until it resets
+    assert poller.poll(NOW + 3600) == []
+    assert poller.poll(_next_quota_reset(NOW) - 1) == []
+    assert len(api_server.requests) == 1
+    
+    api_server.remaining = 99
+    assert poller.poll(_next_quota_reset(NOW)) == ['2']
+    assert len(api_server.requests) == 2
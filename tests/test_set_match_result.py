@@ -0,0 +1,59 @@
+"""
+set_match_result must leave every score right, even when the score change of
+the match could not be applied incrementally.
+"""
+import threading
+
+from club_world_cup_bot.services import prediction, scoring
+from club_world_cup_bot.services.prediction import set_match_result
+
+def setup_match(database):
+    database.child('matches').set({
+        '1': {'team1': "Chelsea", 'team2': "Benfica", 'time': "2025-06-28 20:00", 'is_knockout': False, 'locked': True}
+    })
+    database.child('users').set({'7': {'first_name': "Ann", 'score': 0}, '8': {'first_name': "Bob", 'score': 0}})
+    predictions = {'7': {'home_goals': 2, 'away_goals': 1}, '8': {'home_goals': 0, 'away_goals': 0}}
+    database.child('match_predictions').set({'1': predictions})
+    database.child('predictions').set({user_id: {'1': prediction} for user_id, prediction in predictions.items()})
+
+def scores(database):
+    return {user_id: user['score'] for user_id, user in database.child('users').get().items()}
+
+def test_result_applies_score_change(database):
+    setup_match(database)
+    
+    assert set_match_result('1', 2, 1)
+    assert scores(database) == {'7': 3, '8': -1}
+    
+    # Correcting the result replaces its points instead of adding to them
+    assert set_match_result('1', 0, 0)
+    assert scores(database) == {'7': -1, '8': 3}
+
+def test_failed_score_change_falls_back_to_recompute(database, monkeypatch):
+    setup_match(database)
+    monkeypatch.setattr(scoring, "_apply_score_deltas", lambda *args: False)
+    
+    assert set_match_result('1', 2, 1)
+    assert scores(database) == {'7': 3, '8': -1}
+
+def test_recompute_waits_for_result_to_be_applied(database, monkeypatch):
+    setup_match(database)
+    recomputes = []
+    swap_match_result = prediction.swap_match_result
+    
+    def swap_then_recompute(*args):
+        swapped = swap_match_result(*args)
+        # A full recompute started now would count the saved result, and the increment again
+        recompute = threading.Thread(target=lambda: recomputes.append(scoring.update_leaderboard()))
+        recompute.start()
+        recompute.join(timeout=0.2)
+        assert recompute.is_alive()
+        swap_then_recompute.thread = recompute
+        return swapped
+    
+    monkeypatch.setattr(prediction, "swap_match_result", swap_then_recompute)
+    
+    assert set_match_result('1', 2, 1)
+    swap_then_recompute.thread.join()
+    assert recomputes == [True]
+    assert scores(database) == {'7': 3, '8': -1}